@@ -5,12 +5,17 @@ import json
 from ontology.art import artworks
 from entities import AbstractSolution
 import copy
-from museum import run_and_plot
+from museum import plan_route
+from route_renderer import RouteRenderer
+from route_optimizer import optimize_route
+from room_occupancy import RoomOccupancy
 
 app = Flask(__name__)
 
 llama_model = Llama(model_name='llama3.2')
 iface = Interface()
+route_renderer = RouteRenderer()
+room_occupancy = RoomOccupancy()
 
 @app.route('/')
 def index():
@@ -77,29 +82,6 @@ def process_final_answers():
     print(fp_results)
     return jsonify(status='ok', result=fp_results)
 
-def cut_route(time, recommendation):
-    """
-    Parameters:
-    time: int
-        The time available for the visit
-    recommendation: list of artwork ids complete
-    The recommendation neeeds to be adjusted. We are going to remove the artworks that exceed the time available
-        """
-    recommendations = recommendation[0]
-    filtered_recommendations = [] 
-
-    for id_artwork in recommendations:
-        artwork = artworks[id_artwork]
-        time -= artwork.default_time
-        if time >= 0:  
-            # Enough time to consider this artwork
-            filtered_recommendations.append(id_artwork)
-        else:
-            # No time left
-            break
-    recommendation[0][:] = filtered_recommendations 
-        
-
 @app.route('/route', methods=['GET'])
 def route_page():
     # We assume iface.ap and iface.fp now contain all needed info
@@ -154,9 +136,17 @@ def route_page():
 
     time = (iface.fp[0] * 1)*60
     iface.time = time
-    
-    for recommendation in recommendations.values():
-        cut_route(time, recommendation)
+
+    # Keep the artworks with the highest total score that fit in the time available, walking between rooms included,
+    # avoiding the rooms that the groups already on their way make crowded
+    _, ap = iface.recommender.convert_to_problems(clean_response)
+    iface.time_coefficient = ap.time_coefficient
+    iface.num_people = ap.specific_problem.num_people
+    start_time = room_occupancy.now()
+    crowding = room_occupancy.crowding(start_time, start_time + time)
+    for name, (items, probs) in recommendations.items():
+        route = optimize_route(items, probs, time, time_coefficient=ap.time_coefficient, only_elevators=bool(int(iface.fp[1])), room_crowding=crowding)
+        recommendations[name] = (route.artworks, probs)
     
 
     iface.route_to_plot = copy.deepcopy(recommendations)
@@ -177,10 +167,24 @@ def select_route():
     data = request.get_json()
     route_type = data.get('route')
     iface.route_type = route_type
-    run_and_plot(iface.route_to_plot[iface.route_type][0], bool(int(iface.fp[1])) )
+    # The image of the route is rendered in the background, the page loads it from its URL once it is ready
+    route = plan_route(iface.route_to_plot[iface.route_type][0], bool(int(iface.fp[1])) )
+    image_filename = route_renderer.submit(route)
+    # The group is expected in the rooms of its route from now on (replacing the route it selected before, if any)
+    if iface.planned_visit is not None:
+        room_occupancy.remove_visit(iface.planned_visit)
+    artwork_minutes = {artwork_id: artworks[artwork_id].default_time * iface.time_coefficient for artwork_id in iface.route_to_plot[iface.route_type][0]}
+    iface.planned_visit = room_occupancy.add_visit(route, artwork_minutes, people=iface.num_people)
     # Aquí podrías guardar la selección en la DB si quieres
-    # Por ahora solo devolvemos ok
-    return jsonify(status='ok')
+    return jsonify(
+        status='ok', route=route, image_url=url_for('static', filename=f'routes/{image_filename}'),
+        image_status_url=url_for('route_image_status', filename=image_filename)
+    )
+
+@app.route('/route_image_status/<filename>', methods=['GET'])
+def route_image_status(filename):
+    # Polled by the route page while the image of the selected route is rendered
+    return jsonify(status=route_renderer.status(filename))
 
 @app.route('/feedback', methods=['GET'])
 def feedback():
@@ -206,17 +210,7 @@ def goodbye():
     # We redifine the variable from a list of matches to a list of match types
     sorted_matches = [m.match_type for m in sorted_matches]
 
-    new_case = {
-    'num_people': int(iface.clean_response[1]),
-    'preferred_author_name': iface.clean_response[2],
-    'preferred_year': int(iface.clean_response[3]),
-    'preferred_main_theme': iface.clean_response[4],
-    'guided_visit': int(iface.clean_response[5]),
-    'minors': int(iface.clean_response[6]),
-    'num_experts': int(iface.clean_response[7]),
-    'past_museum_visits': int(iface.clean_response[8])
-    }
-    cluster_id = iface.recommender.clustering_system.classify_new_case(new_case)
+    cluster_id = iface.recommender.classify_groups([iface.clean_response])[0]
 
     print(len(sorted_matches))
     print(len(iface.route_c[iface.route_type][0]))
@@ -15,7 +15,11 @@ from group_description import compare_sentences, load_model
 from typing import List, Tuple
 
 class CBR:
-	def __init__(self, db_path='./data/database.db', alpha=0.6, beta=0.3, gamma=0.1, top_k=3):
+	def __init__(self, db_path='./data/database.db', alpha=0.6, beta=0.3, gamma=0.1, top_k=3, shard: Tuple[int, int] = None):
+		"""
+		:param shard: (shard_index, shard_count) if this instance is a shard of the case base (see cbr_shards). A shard owns
+		the clusters c with c % shard_count == shard_index and keeps their decoded cases in memory.
+		"""
 		self.conn = sqlite3.connect(db_path, check_same_thread=False)
 		self.conn.row_factory = sqlite3.Row 
 		self.ensure_columns()
@@ -26,6 +30,28 @@ class CBR:
 		self.top_k = top_k
 		#self.model = load_model()
 
+		self.shard = shard
+		self.case_cache = None
+		if shard is not None:
+			self.load_shard_cases()
+
+	def owns_cluster(self, cluster) -> bool:
+		"""Whether the cases of a cluster are kept in memory by this shard."""
+		return self.shard is not None and cluster is not None and cluster % self.shard[1] == self.shard[0]
+
+	def load_shard_cases(self):
+		"""(Re)loads the decoded cases of the clusters owned by this shard, e.g. after the cases are clustered again."""
+		shard_index, shard_count = self.shard
+		rows = self.conn.execute("SELECT * FROM train_cases WHERE cluster % ? = ?", (shard_count, shard_index)).fetchall()
+
+		self.case_cache = {}
+		for row in rows:
+			self.case_cache.setdefault(row['cluster'], []).append(self.decode_case(row))
+
+	def decode_case(self, row) -> Tuple:
+		"""Decodes the stored preferences of a case row, returning (row, preferred_periods_ids, preferred_themes)."""
+		return row, json.loads(row['preferred_periods_ids']), ast.literal_eval(row['preferred_themes'])
+
 	def create_indices(self):
 		"""Create indices for faster query performance."""
 		with self.conn:
@@ -348,59 +374,91 @@ class CBR:
 		"""
 		Retrieves the most similar cases to the given problem and updates their usage_count.
 		"""
-		query = """
-			SELECT * 
-			FROM train_cases 
-			WHERE cluster = ? 
+		return self.retrieve_many([problem], top_k=top_k)[0]
+
+	def retrieve_many(self, problems: List[AbstractProblem], top_k=50) -> List[List]:
 		"""
-		params = (problem.cluster,)
-		rows = self.conn.execute(query, params).fetchall()
-		cases_with_similarity = []
-		for row in rows:
-			stored_periods_id = json.loads(row['preferred_periods_ids'])
+		Retrieves the most similar cases to each of the given problems with a single query for all their clusters,
+		and updates the usage_count of the retrieved cases in a single transaction.
 
-			stored_author_name = row['preferred_author_name']
-
-			preferred_themes = ast.literal_eval(row['preferred_themes']) 
-
-			similarity = self.calculate_similarity(
-				problem_group_size=problem.group_size,
-				problem_group_type=problem.group_type,
-				problem_art_knowledge=problem.art_knowledge,
-				problem_preferred_periods=problem.preferred_periods,
-				problem_preferred_author=problem.preferred_author,
-				problem_preferred_themes=problem.preferred_themes,
-				problem_time_coefficient=problem.time_coefficient,
-				stored_group_size=row['group_size'],
-				stored_group_type=row['group_type'],
-				stored_art_knowledge=row['art_knowledge'],
-				stored_preferred_periods_id=stored_periods_id,
-				stored_author_name=stored_author_name,
-				stored_preferred_themes=preferred_themes,
-				stored_time_coefficient=row['time_coefficient']
-			)
+		Args:
+			problems (List[AbstractProblem]): The problems to retrieve cases for.
+			top_k (int): The number of cases retrieved for each problem.
 
-			feedback = row['rating']
-			distance = similarity * feedback
+		Returns:
+			List[List]: The selected (case, distance) tuples of each problem.
+		"""
+		if not problems:
+			return []
+
+		clusters = list({problem.cluster for problem in problems})
 
-			cases_with_similarity.append((row, distance))
+		# The clusters owned by this shard are already decoded in memory
+		rows_by_cluster = {cluster: self.case_cache.get(cluster, []) for cluster in clusters if self.owns_cluster(cluster)}
+		clusters = [cluster for cluster in clusters if cluster not in rows_by_cluster]
 
-		# Sort by distance and return top_k
-		ranked_cases = sorted(cases_with_similarity, key=lambda x: x[1], reverse=True)
-		selected_cases = ranked_cases[:top_k]
+		if clusters:
+			query = f"""
+				SELECT * 
+				FROM train_cases 
+				WHERE cluster IN ({', '.join('?' * len(clusters))}) 
+			"""
+			rows_by_cluster.update({cluster: [] for cluster in clusters})
+			for row in self.conn.execute(query, clusters).fetchall():
+				# Decode the stored preferences once, they are shared by all the problems of the cluster
+				rows_by_cluster[row['cluster']].append(self.decode_case(row))
+
+		selected_cases_per_problem = []
+		usage_counts = {}
+		for problem in problems:
+			cases_with_similarity = []
+			for row, stored_periods_id, preferred_themes in rows_by_cluster[problem.cluster]:
+				similarity = self.calculate_similarity(
+					problem_group_size=problem.group_size,
+					problem_group_type=problem.group_type,
+					problem_art_knowledge=problem.art_knowledge,
+					problem_preferred_periods=problem.preferred_periods,
+					problem_preferred_author=problem.preferred_author,
+					problem_preferred_themes=problem.preferred_themes,
+					problem_time_coefficient=problem.time_coefficient,
+					stored_group_size=row['group_size'],
+					stored_group_type=row['group_type'],
+					stored_art_knowledge=row['art_knowledge'],
+					stored_preferred_periods_id=stored_periods_id,
+					stored_author_name=row['preferred_author_name'],
+					stored_preferred_themes=preferred_themes,
+					stored_time_coefficient=row['time_coefficient']
+				)
+
+				feedback = row['rating']
+				distance = similarity * feedback
+
+				cases_with_similarity.append((row, distance))
+
+			# Sort by distance and return top_k
+			ranked_cases = sorted(cases_with_similarity, key=lambda x: x[1], reverse=True)
+			selected_cases = ranked_cases[:top_k]
+			selected_cases_per_problem.append(selected_cases)
+
+			for case, dist in selected_cases:
+				usage_counts[case['case_id']] = usage_counts.get(case['case_id'], 0) + 1
 
 		# Actualizar el contador de uso
-		for case, dist in selected_cases:
-			self.increment_usage_count(case['case_id']) 
+		with self.conn:
+			self.conn.executemany(
+				"UPDATE train_cases SET usage_count = COALESCE(usage_count, 0) + ? WHERE case_id = ?",
+				[(count, case_id) for case_id, count in usage_counts.items()]
+			)
 
-		return selected_cases
+		return selected_cases_per_problem
 
-	def reuse(self, base_problem: AbstractProblem) -> Tuple[List[int], List[float]]:
+	def reuse(self, base_problem: AbstractProblem, retrieved_cases: List = None) -> Tuple[List[int], List[float]]:
 			"""
 			Adapts a solution for the base problem by combining and reordering artworks
 			from the top k most similar cases to create a personalized route of desired_artwork_count artworks.
 			
 			:param base_problem: The AbstractProblem instance representing the new problem.
+			:param retrieved_cases: The cases already retrieved for the problem (e.g. by `retrieve_many`). If None, they are retrieved.
 			:param top_k: Number of top similar cases to consider.
 			:param alpha: Weight for normalized frequency.
 			:param beta: Weight for normalized match_type.
@@ -417,7 +475,8 @@ class CBR:
 			desired_artwork_count = 50
 
 			# Step 1: Retrieve the top k most similar cases
-			retrieved_cases = self.retrieve(base_problem, top_k=top_k)
+			if retrieved_cases is None:
+				retrieved_cases = self.retrieve(base_problem, top_k=top_k)
 
 			# Step 2: Initialize dictionaries to store frequencies and positions
 			artwork_frequency = {}
@@ -610,12 +669,20 @@ class CBR:
 			cluster
 		))
 		self.conn.commit()
+
+		# Keep the in-memory cases of the shard up to date
+		if self.owns_cluster(cluster):
+			row = self.conn.execute("SELECT * FROM train_cases WHERE case_id = ?", (case_id + 1,)).fetchone()
+			self.case_cache.setdefault(cluster, []).append(self.decode_case(row))
 	
 	def forget_cases(self, threshold=0.2):
 		"""Removes cases with low utility from the database."""
 		with self.conn:
 			self.conn.execute("DELETE FROM train_cases WHERE utility <= ?", (threshold,))
 
+		if self.shard is not None:
+			self.load_shard_cases()
+
 	def recommend_items(self, ap: AbstractProblem, top_k: int = 3) -> Tuple[List[int], List[float]]:
 		"""
 		Recommends items based on the utility values of the stored cases.
@@ -632,6 +699,22 @@ class CBR:
 			return [], []
 		return recommended_artworks, recommended_probs
 
+	def recommend_items_many(self, aps: List[AbstractProblem]) -> List[Tuple[List[int], List[float]]]:
+		"""
+		Recommends items for several problems at once, retrieving the cases of all of them with `retrieve_many`.
+
+		Args:
+			aps (List[AbstractProblem]): The abstract problems representing the user queries.
+
+		Returns:
+			List[Tuple[List[int], List[float]]]: The recommended item IDs and their values for each problem.
+		"""
+		recommendations = []
+		for ap, retrieved_cases in zip(aps, self.retrieve_many(aps, top_k=self.top_k)):
+			recommended_artworks, recommended_probs = self.reuse(ap, retrieved_cases=retrieved_cases)
+			recommendations.append((recommended_artworks, recommended_probs) if recommended_artworks else ([], []))
+		return recommendations
+
 	
 def row_to_dict(row):
 	return {k: row[k] for k in row.keys()}
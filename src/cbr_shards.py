@@ -0,0 +1,139 @@
+import threading
+import multiprocessing as mp
+from typing import List, Tuple
+
+from cbr import CBR
+from entities import AbstractProblem
+
+def shard_worker(conn, db_path: str, shard_index: int, shard_count: int, cbr_kwargs: dict):
+	"""
+	Main loop of a shard process: owns a CBR shard and answers the (command, payload) messages received through the pipe
+	with ('ok', result) or ('error', message).
+	"""
+	cbr = CBR(db_path, shard=(shard_index, shard_count), **cbr_kwargs)
+
+	while True:
+		try:
+			command, payload = conn.recv()
+		except EOFError:
+			break
+
+		if command == 'stop':
+			break
+
+		try:
+			if command == 'recommend':
+				result = cbr.recommend_items_many(payload)
+			elif command == 'retain':
+				result = cbr.retain(**payload)
+			elif command == 'reload':
+				result = cbr.load_shard_cases()
+			else:
+				raise ValueError(f"Unknown command: {command}")
+			conn.send(('ok', result))
+		except Exception as e:
+			conn.send(('error', f"{type(e).__name__}: {e}"))
+
+	conn.close()
+
+class CBRShardRouter:
+	"""
+	Routes CBR requests to a set of shard processes. Shard i owns the clusters c with c % shard_count == i and keeps
+	their decoded cases in memory, so retrieval scales across cores with a bounded memory footprint per process.
+	Requests are sent over multiprocessing pipes.
+	"""
+	def __init__(self, db_path: str, shard_count: int, **cbr_kwargs):
+		"""
+		Starts the shard processes. They are forked, so the router is created before the process starts any thread.
+
+		Args:
+			db_path (str): The path to the SQLite database.
+			shard_count (int): The number of shard processes.
+			cbr_kwargs: The parameters of the CBR shards (alpha, beta, gamma, top_k).
+		"""
+		assert shard_count > 0, "The number of shards must be positive."
+
+		self.shard_count = shard_count
+		self.pipes = []
+		self.processes = []
+		self.locks = [threading.Lock() for _ in range(shard_count)]
+
+		for shard_index in range(shard_count):
+			parent_conn, child_conn = mp.Pipe()
+			process = mp.Process(target=shard_worker, args=(child_conn, db_path, shard_index, shard_count, cbr_kwargs), daemon=True)
+			process.start()
+			child_conn.close()
+			self.pipes.append(parent_conn)
+			self.processes.append(process)
+
+	def shard_for(self, cluster) -> int:
+		"""Returns the index of the shard owning a cluster (unassigned cases go to shard 0)."""
+		return 0 if cluster is None else cluster % self.shard_count
+
+	def __request(self, shard_index: int, command: str, payload):
+		with self.locks[shard_index]:
+			self.pipes[shard_index].send((command, payload))
+			status, result = self.pipes[shard_index].recv()
+
+		if status == 'error':
+			raise RuntimeError(f"CBR shard {shard_index} failed: {result}")
+		return result
+
+	def recommend_items(self, ap: AbstractProblem) -> Tuple[List[int], List[float]]:
+		"""
+		Recommends items for a problem on the shard owning its cluster. See `CBR.recommend_items`.
+		"""
+		return self.recommend_items_many([ap])[0]
+
+	def recommend_items_many(self, aps: List[AbstractProblem]) -> List[Tuple[List[int], List[float]]]:
+		"""
+		Recommends items for several problems, sending each shard the problems of its clusters.
+		The shards work on their batches concurrently. See `CBR.recommend_items_many`.
+		"""
+		positions_by_shard = {}
+		for position, ap in enumerate(aps):
+			positions_by_shard.setdefault(self.shard_for(ap.cluster), []).append(position)
+
+		# Send every batch before waiting for any result
+		shard_indices = sorted(positions_by_shard)
+		for shard_index in shard_indices:
+			self.locks[shard_index].acquire()
+		try:
+			for shard_index in shard_indices:
+				self.pipes[shard_index].send(('recommend', [aps[position] for position in positions_by_shard[shard_index]]))
+			responses = {shard_index: self.pipes[shard_index].recv() for shard_index in shard_indices}
+		finally:
+			for shard_index in shard_indices:
+				self.locks[shard_index].release()
+
+		recommendations = [None] * len(aps)
+		for shard_index, (status, result) in responses.items():
+			if status == 'error':
+				raise RuntimeError(f"CBR shard {shard_index} failed: {result}")
+			for position, recommendation in zip(positions_by_shard[shard_index], result):
+				recommendations[position] = recommendation
+		return recommendations
+
+	def retain(self, **retain_kwargs) -> None:
+		"""
+		Stores a case through the shard owning its cluster, which also adds it to its in-memory cases. See `CBR.retain`.
+		"""
+		self.__request(self.shard_for(retain_kwargs['cluster']), 'retain', retain_kwargs)
+
+	def reload(self) -> None:
+		"""
+		Reloads the in-memory cases of every shard, needed after the cases are clustered again.
+		"""
+		for shard_index in range(self.shard_count):
+			self.__request(shard_index, 'reload', None)
+
+	def close(self) -> None:
+		"""
+		Stops the shard processes.
+		"""
+		for shard_index, pipe in enumerate(self.pipes):
+			with self.locks[shard_index]:
+				pipe.send(('stop', None))
+				pipe.close()
+		for process in self.processes:
+			process.join()
@@ -1,21 +1,35 @@
+import time
 import sqlite3
 from typing import Dict, List
 from scipy.stats import pearsonr
 from scipy.spatial.distance import cosine
 import numpy as np
 
+from mf import MatrixFactorization
+from cf_cache import RecommendationCache
+from cf_scoring import ParallelScorer, score_group, time_decay_weights
+from cf_snapshot import RatingsSnapshot, current_version, export_ratings_snapshot
+
 class CF:
     """
     This class implements a Collaborative Filtering (CF) system based on group information 
     and their ratings of various items. Ratings are stored along with the number of times 
     each group has visited an item, which are used to compute average ratings.
 
-    The system uses both user-based and item-based collaborative filtering to recommend items.
+    The system uses both user-based and item-based collaborative filtering to recommend items,
+    or alternatively a matrix-factorization model of the ratings (method 'als').
     """
-    VALID_METHODS = ['cosine', 'pearson']
+    SIMILARITY_METHODS = ['cosine', 'pearson']
+    VALID_METHODS = SIMILARITY_METHODS + ['als']
+
+    # With time decay, cached recommendations expire every DECAY_CACHE_RESOLUTION x half_life seconds
+    # (the weights of the ratings change by less than 1% in that time)
+    DECAY_CACHE_RESOLUTION = 0.01
 
     def __init__(self, 
-        ratings_range: list, db_path='../data/database.db', default_alpha: float = 0.5, default_gamma: float = 1, default_decay_factor: float = 1, default_method: str = 'cosine'
+        ratings_range: list, db_path='../data/database.db', default_alpha: float = 0.5, default_gamma: float = 1, default_decay_factor: float = 1, default_method: str = 'cosine',
+        mf_model_dir: str = 'models/mf', mf_factors: int = 16, cache_size: int = 256, snapshot_dir: str | None = None,
+        default_half_life: float | None = None
         ):
         """
         Initializes the collaborative filtering system by connecting to the database.
@@ -34,11 +48,25 @@ class CF:
             A factor controlling the decay of the old rating, default is 1 (no decay).
         default_method : str
             The similarity method to use for both group and item similarities, default is 'cosine'.
+            'als' uses the matrix-factorization model instead of the neighbourhood predictions.
+        mf_model_dir : str
+            Directory where the matrix-factorization factors are persisted, default is 'models/mf'.
+        mf_factors : int
+            Number of latent factors of the matrix-factorization model, default is 16.
+        cache_size : int
+            Maximum number of recommendations kept in the result cache, default is 256. 0 disables the cache.
+        snapshot_dir : str, optional
+            Directory of the memory-mapped ratings snapshots. If it contains a snapshot, ratings are read from it
+            (plus the ratings written by this instance since then) instead of querying the database.
+        default_half_life : float, optional
+            Age in seconds at which a rating weighs half as much as a new one when predicting ratings, default is None (no time decay).
+            The decay is applied at scoring time from the last-update timestamp of each rating, so it can be changed without rewriting the table.
         """
         assert default_method in self.VALID_METHODS, f"Invalid method; use one of {self.VALID_METHODS}"
         assert 0 <= default_alpha <= 1, "Alpha must be between 0 and 1"
         assert 0 <= default_gamma, "Gamma must be a non-negative value"
         assert 0 <= default_decay_factor <= 1, "Decay factor must be between 0 and 1"
+        assert (default_half_life is None) or (default_half_life > 0), "Half-life must be a positive value"
 
         self.db_path = db_path
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
@@ -48,13 +76,22 @@ class CF:
         self.default_gamma = default_gamma
         self.default_decay_factor = default_decay_factor
         self.default_method = default_method
+        self.default_half_life = default_half_life
         self.ratings_range = ratings_range
 
+        self.mf = MatrixFactorization(model_dir=mf_model_dir, n_factors=mf_factors)
+        self.cache = RecommendationCache(max_size=cache_size)
+
+        self.snapshot_dir = snapshot_dir
+        self.snapshot = None
+        if snapshot_dir is not None and current_version(snapshot_dir) is not None:
+            self.snapshot = RatingsSnapshot(snapshot_dir)
+
     def create_tables(self):
         """
         Creates the necessary table to store group ratings and visit counts for items.
-        Each entry corresponds to a (group_id, item_id) pair, storing the average rating 
-        and the total number of visits that led to that rating.
+        Each entry corresponds to a (group_id, item_id) pair, storing the average rating,
+        the total number of visits that led to that rating and the time of the last visit.
         """
         with self.conn:
             self.conn.execute('''
@@ -63,10 +100,16 @@ class CF:
                     item_id INTEGER,
                     rating REAL,
                     visit_count INTEGER DEFAULT 0,
+                    updated_at REAL,
                     PRIMARY KEY (group_id, item_id)
                 );
             ''')
 
+            # Tables created before timestamps were stored
+            columns = [col[1] for col in self.conn.execute("PRAGMA table_info(ratings)").fetchall()]
+            if 'updated_at' not in columns:
+                self.conn.execute("ALTER TABLE ratings ADD COLUMN updated_at REAL")
+
     def store_group_ratings(self, 
         group_id: int, 
         ordered_items: List[int], 
@@ -114,26 +157,36 @@ class CF:
         ordered_visited_items_matches = ordered_items_matches[:visited_items_count]
         total_visited_matches = sum(ordered_visited_items_matches)
 
+        item_ratings = {}
         for item_id, item_matches in zip(ordered_visited_items, ordered_visited_items_matches):
             item_ratio = item_matches / total_visited_matches if total_visited_matches > 0 else 0
-            item_rating = global_rating + gamma * (item_ratio - 1/visited_items_count) #
+            item_ratings[item_id] = global_rating + gamma * (item_ratio - 1/visited_items_count) #
+
+        self.__store_ratings(group_id=group_id, item_ratings=item_ratings, decay_factor=decay_factor)
 
-            self.__store_rating(group_id=group_id, item_id=item_id, item_rating=item_rating, decay_factor=decay_factor)
+        # The written ratings change the neighbourhood predictions of every group that has this one as a neighbour
+        self.cache.invalidate(group_id, ordered_visited_items, methods=self.SIMILARITY_METHODS)
 
-    def __store_rating(self, group_id: int, item_id: int, item_rating: float, decay_factor: float | None = None) -> None:
+        # Keep the factors of the group up to date without retraining the whole model
+        if self.mf.is_fitted:
+            group_ratings = self.get_group_ratings(group_id)
+            if self.mf.fold_in(group_id, list(group_ratings.keys()), [r[0] for r in group_ratings.values()]):
+                self.mf.save(groups_only=True)
+
+    def __store_ratings(self, group_id: int, item_ratings: Dict[int, float], decay_factor: float | None = None) -> None:
         """
-        Stores or updates a group's average rating and visit count for an item, 
-        adjusting the weight of the old mean and giving slightly more importance 
-        to the new rating.
+        Stores or updates a group's average ratings, visit counts and last-update timestamps for some items,
+        adjusting the weight of the old mean and giving slightly more importance to the new rating.
+
+        The weighted average is computed by the upsert itself, so writing does not need to read the
+        existing records first. All the ratings are written in a single transaction.
 
         Parameters
         ----------
         group_id : int
             Unique identifier for the group.
-        item_id : int
-            Unique identifier for the item.
-        item_rating : float
-            The rating given to the item by the group on this visit.
+        item_ratings : Dict[int, float]
+            Dictionary mapping each item identifier to the rating given to it by the group on this visit.
         decay_factor : float
             A factor (0 <= decay_factor <= 1) controlling the decay of the old rating.
             - If decay_factor = 0, the old rating is completely replaced by the new rating.
@@ -145,45 +198,82 @@ class CF:
         if decay_factor is None:
             decay_factor = self.default_decay_factor
 
-        # Check if there's an existing record
-        existing = self.conn.execute('''
-            SELECT rating, visit_count FROM ratings 
-            WHERE group_id = ? AND item_id = ?
-        ''', (group_id, item_id)).fetchone()
-
-        if existing is None:
-            # No existing record, insert a new one
-            new_rating = item_rating
-            new_visit_count = 1
-        else:
-            old_rating, old_visit_count = existing
+        updated_at = time.time()
 
-            # Compute the new weighted average
-            new_visit_count = old_visit_count + 1  # Keep the real visit count for record
-
-            old_weight = (old_visit_count / new_visit_count) * decay_factor
-
-            new_weight = 1 - old_weight
-            
-            new_rating = old_weight * old_rating + new_weight * item_rating
-
-        # Update or insert the record in the database
+        # old_weight = (old_visit_count / new_visit_count) * decay_factor
         with self.conn:
-            self.conn.execute('''
-                INSERT INTO ratings (group_id, item_id, rating, visit_count)
-                VALUES (?, ?, ?, ?)
+            self.conn.executemany('''
+                INSERT INTO ratings (group_id, item_id, rating, visit_count, updated_at)
+                VALUES (:group_id, :item_id, :rating, 1, :updated_at)
                 ON CONFLICT(group_id, item_id) DO UPDATE SET 
-                    rating=excluded.rating,
-                    visit_count=excluded.visit_count;
-            ''', (group_id, item_id, new_rating, new_visit_count))
+                    rating = (visit_count * 1.0 / (visit_count + 1)) * :decay_factor * rating
+                        + (1 - (visit_count * 1.0 / (visit_count + 1)) * :decay_factor) * excluded.rating,
+                    visit_count = visit_count + 1,
+                    updated_at = excluded.updated_at;
+            ''', [
+                {'group_id': group_id, 'item_id': item_id, 'rating': item_rating, 'updated_at': updated_at, 'decay_factor': decay_factor}
+                for item_id, item_rating in item_ratings.items()
+            ])
+
+        # The snapshot is not rewritten, the ratings land in its delta overlay until the next export
+        if self.snapshot is not None:
+            for item_id, item_rating in item_ratings.items():
+                existing = self.snapshot.get(group_id, item_id)
+                if existing is None:
+                    self.snapshot.set(group_id, item_id, item_rating, 1, updated_at)
+                else:
+                    old_rating, old_visit_count = existing
+                    old_weight = (old_visit_count / (old_visit_count + 1)) * decay_factor
+                    new_rating = old_weight * old_rating + (1 - old_weight) * item_rating
+                    self.snapshot.set(group_id, item_id, new_rating, old_visit_count + 1, updated_at)
 
     def clear_ratings(self) -> None:
         """
-        Clears all ratings from the database.
+        Clears all ratings from the database. The matrix-factorization model is discarded too, in memory and on disk,
+        so the 'als' method falls back to the average ratings until `train_factors` is called again.
         """
         with self.conn:
             self.conn.execute('DELETE FROM ratings')
 
+        self.cache.clear()
+        self.mf.delete()
+        self.mf = MatrixFactorization(model_dir=self.mf.model_dir, n_factors=self.mf.n_factors)
+
+        # Publish the empty table so that no process keeps reading the old snapshot
+        if self.snapshot is not None:
+            self.export_snapshot()
+
+    def export_snapshot(self) -> int:
+        """
+        Exports the ratings table to a new memory-mapped snapshot in `snapshot_dir` and starts reading from it,
+        which empties the delta overlay.
+
+        Returns
+        -------
+        int
+            The version of the new snapshot.
+        """
+        assert self.snapshot_dir is not None, "A snapshot directory must be given to export snapshots"
+
+        version = export_ratings_snapshot(self.conn, self.snapshot_dir)
+        self.snapshot = RatingsSnapshot(self.snapshot_dir)
+        return version
+
+    def train_factors(self) -> None:
+        """
+        Trains the matrix-factorization model on the whole ratings table and persists its factors.
+        """
+        group_ids, item_ids, ratings = self.get_rating_matrix()
+        rows, cols = np.nonzero(~np.isnan(ratings))
+        if len(rows) == 0:
+            return
+
+        self.mf.fit(group_ids[rows], item_ids[cols], ratings[rows, cols])
+        self.mf.save()
+
+        # The cached recommendations were scored with the previous factors (or without a model)
+        self.cache.clear()
+
     def get_group_ratings(self, group_id: int) -> Dict[int, tuple[float, int]]:
         """
         Retrieves all averaged ratings from a specific group.
@@ -198,6 +288,9 @@ class CF:
         Dict[int, tuple[float, int]]
             Dictionary mapping item identifiers to a tuple of (rating, visit_count).
         """
+        if self.snapshot is not None:
+            return self.snapshot.group_ratings(group_id)
+
         query = "SELECT item_id, rating, visit_count FROM ratings WHERE group_id = ?"
         rows = self.conn.execute(query, (group_id,)).fetchall()
         return {r[0]: (r[1], r[2]) for r in rows}
@@ -216,6 +309,9 @@ class CF:
         Dict[int, tuple[float, int]]
             Dictionary mapping group identifiers to a tuple of (rating, visit_count).
         """
+        if self.snapshot is not None:
+            return self.snapshot.item_ratings(item_id)
+
         query = "SELECT group_id, rating, visit_count FROM ratings WHERE item_id = ?"
         rows = self.conn.execute(query, (item_id,)).fetchall()
         return {r[0]: (r[1], r[2]) for r in rows}
@@ -229,6 +325,9 @@ class CF:
         List[int]
             List of group identifiers.
         """
+        if self.snapshot is not None:
+            return self.snapshot.all_groups()
+
         query = "SELECT DISTINCT group_id FROM ratings"
         rows = self.conn.execute(query).fetchall()
         return [r[0] for r in rows]
@@ -242,10 +341,70 @@ class CF:
         List[int]
             List of item identifiers.
         """
+        if self.snapshot is not None:
+            return self.snapshot.all_items()
+
         query = "SELECT DISTINCT item_id FROM ratings"
         rows = self.conn.execute(query).fetchall()
         return [r[0] for r in rows]
 
+    def get_rating_matrix(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Retrieves all the ratings as a dense matrix with a single query.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, np.ndarray]
+            Sorted group identifiers (rows), sorted item identifiers (columns) and the rating matrix,
+            with NaN for the items not rated by a group.
+        """
+        group_ids, item_ids, ratings, _ = self.get_rating_matrices()
+        return group_ids, item_ids, ratings
+
+    def get_rating_matrices(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Retrieves all the ratings and their last-update timestamps as dense matrices with a single query.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+            Sorted group identifiers (rows), sorted item identifiers (columns), the rating matrix and the
+            timestamp matrix, with NaN for the items not rated by a group (and for ratings without a timestamp).
+        """
+        if self.snapshot is not None:
+            return self.snapshot.rating_matrices()
+
+        rows = self.conn.execute("SELECT group_id, item_id, rating, updated_at FROM ratings").fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, 0)), np.empty((0, 0))
+
+        group_ids, item_ids, ratings, timestamps = (np.array(column) for column in zip(*rows))
+        group_ids, group_rows = np.unique(group_ids, return_inverse=True)
+        item_ids, item_cols = np.unique(item_ids, return_inverse=True)
+
+        matrix = np.full((len(group_ids), len(item_ids)), np.nan)
+        matrix[group_rows, item_cols] = ratings
+        updated_at = np.full((len(group_ids), len(item_ids)), np.nan)
+        updated_at[group_rows, item_cols] = np.where(timestamps == None, np.nan, timestamps).astype(np.float64)
+
+        return group_ids, item_ids, matrix, updated_at
+
+    def __recency_weights(self, updated_at: np.ndarray, half_life: float | None) -> np.ndarray | None:
+        """
+        Computes the time-decay weight of every rating, or None if there is no time decay.
+        """
+        if half_life is None:
+            return None
+        return time_decay_weights(updated_at, half_life, time.time())
+
+    def __cache_key(self, group_id: int, method: str, alpha: float, top_k_users: int | None, top_k_items: int | None, half_life: float | None) -> tuple:
+        """
+        Cache key of a recommendation. With time decay, the key includes the current time bucket, so that a cached
+        recommendation is not served after the weights of the ratings have decayed.
+        """
+        decay_bucket = None if half_life is None else int(time.time() // (half_life * self.DECAY_CACHE_RESOLUTION))
+        return (group_id, method, alpha, top_k_users, top_k_items, half_life, decay_bucket)
+
     def group_similarity(self, group_id_a: int, group_id_b: int, method: str | None = None) -> float:
         """
         Computes the similarity between two groups based on their ratings of items.
@@ -264,7 +423,7 @@ class CF:
         float
             Similarity score between the groups based on their ratings.
         """
-        assert method in self.VALID_METHODS, f"Invalid method; use one of {self.VALID_METHODS}"
+        assert method in self.SIMILARITY_METHODS, f"Invalid method; use one of {self.SIMILARITY_METHODS}"
 
         if method is None:
             method = self.default_method
@@ -307,7 +466,7 @@ class CF:
         float
             Similarity score between the items.
         """
-        assert method in self.VALID_METHODS, f"Invalid method; use one of {self.VALID_METHODS}"
+        assert method in self.SIMILARITY_METHODS, f"Invalid method; use one of {self.SIMILARITY_METHODS}"
 
         if method is None:
             method = self.default_method
@@ -329,7 +488,8 @@ class CF:
     
     def recommend_items(
         self, target_group_id: int, method: str | None = None, alpha: float | None = None,
-        top_k_users: int | None = None, top_k_items: int | None = None
+        top_k_users: int | None = None, top_k_items: int | None = None, workers: int | None = None,
+        half_life: float | None = None
     ) -> tuple[List[int], List[float]]:
         """
         Recommends a sorted list of items for a target group.
@@ -346,11 +506,19 @@ class CF:
             Number of most similar users to consider for user-based filtering. If None, all users are considered.
         top_k_items : int, optional
             Number of most similar items to consider for item-based filtering. If None, all items are considered.
+        workers : int, optional
+            Number of worker processes among which the items are partitioned. If None, the items are scored in this process.
+            Only worth it for very large rating matrices, as the pool is started on every call.
+        half_life : float, optional
+            Age in seconds at which a rating weighs half as much as a new one. If None, the default half-life is used.
 
         Returns
         -------
         Tuple[List[int], List[float]]
             Sorted list of item IDs by predicted relevance and their corresponding probabilities.
+            Results are cached until a rating write affects the group or the items it rated (any write for the
+            similarity methods, see RecommendationCache.invalidate), and with time decay
+            for DECAY_CACHE_RESOLUTION x half_life seconds at most.
         """
         assert method in self.VALID_METHODS + [None], f"Invalid method; use one of {self.VALID_METHODS}"
         assert (alpha is None) or (0 <= alpha <= 1), "Alpha must be between 0 and 1"
@@ -361,106 +529,174 @@ class CF:
         if alpha is None:
             alpha = self.default_alpha
 
-        # Retrieve all groups
-        all_groups = self.get_all_groups()
+        if half_life is None:
+            half_life = self.default_half_life
 
-        # If the group is new, return the average rating of all items
-        if target_group_id not in all_groups:
-            # print(f"New group detected ({target_group_id}) in CF, returning average ratings.")
-            avg_ratings = {}
-            for item in self.get_all_items():
-                item_ratings = self.get_item_ratings(item)
-                avg_rating = sum(r[0] for r in item_ratings.values()) / len(item_ratings) if item_ratings else 0
-                avg_ratings[item] = avg_rating
-
-            sorted_avg_ratings = sorted(avg_ratings.keys(), key=lambda x: avg_ratings[x], reverse=True)
-
-            sorted_probs = [avg_ratings[item] for item in sorted_avg_ratings]
-
-            return sorted_avg_ratings, sorted_probs
-
-        # Retrieve all items and the target group's ratings
-        all_items = self.get_all_items()
-        target_ratings = self.get_group_ratings(target_group_id)
+        cache_key = self.__cache_key(target_group_id, method, alpha, top_k_users, top_k_items, half_life)
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            sorted_items, sorted_probs = self.__compute_recommendations(target_group_id, method, alpha, top_k_users, top_k_items, half_life, workers)
 
-        user_based_predictions, item_based_predictions = {}, {}
-        for item in all_items:
-            # USER-BASED COLLABORATIVE FILTERING --------------------------------
-            user_based_score = 0
-            user_similarity_sum = 0
+            # Entries of new groups depend on the ratings of all items
+            rated_items = self.get_group_ratings(target_group_id).keys() or None
+            cached = (sorted_items, sorted_probs)
+            self.cache.put(cache_key, cached, rated_items=rated_items)
 
-            group_similarities = sorted([
-                (group, self.group_similarity(target_group_id, group, method=method))
-                for group in all_groups if group != target_group_id
-            ], key=lambda x: x[1], reverse=True)
+        # Return copies, callers are allowed to modify the lists
+        return list(cached[0]), list(cached[1])
 
-            # Only consider the top-k most similar users
-            if top_k_users is not None:
-                group_similarities = group_similarities[:top_k_users]
-
-            for similar_group, similar_group_similarity in group_similarities:
-                group_ratings = self.get_group_ratings(similar_group)
+    def __compute_recommendations(
+        self, target_group_id: int, method: str, alpha: float, top_k_users: int | None, top_k_items: int | None,
+        half_life: float | None, workers: int | None = None
+    ) -> tuple[List[int], List[float]]:
+        """
+        Computes the sorted list of recommended items for a target group, without using the cache.
+        See `recommend_items` for the parameters.
+        """
+        group_ids, item_ids, ratings, updated_at = self.get_rating_matrices()
+        weights = self.__recency_weights(updated_at, half_life)
 
-                if item in group_ratings:
-                    group_item_rating = group_ratings[item][0]
+        # If the group is new, return the average rating of all items
+        if target_group_id not in group_ids:
+            # print(f"New group detected ({target_group_id}) in CF, returning average ratings.")
+            return self.__recommend_average_ratings(item_ids, ratings, weights)
 
-                    user_based_score += similar_group_similarity * group_item_rating
-                    user_similarity_sum += similar_group_similarity
+        if method == 'als':
+            return self.__recommend_items_mf(target_group_id, item_ids, ratings, weights)
 
-            user_based_prediction = (
-                user_based_score / user_similarity_sum if user_similarity_sum > 0 else 0
-            )
+        target_row = int(np.searchsorted(group_ids, target_group_id))
+        if workers is not None and workers > 1:
+            with ParallelScorer(ratings, workers, weights) as scorer:
+                sorted_cols, sorted_probs = scorer.score_group(target_row, method, alpha, top_k_users, top_k_items)
+        else:
+            sorted_cols, sorted_probs = score_group(ratings, target_row, method, alpha, top_k_users, top_k_items, weights)
 
-            user_based_predictions[item] = user_based_prediction
+        return [int(item) for item in item_ids[sorted_cols]], [float(prob) for prob in sorted_probs]
 
-            # ITEM-BASED COLLABORATIVE FILTERING --------------------------------
-            item_based_score = 0
-            item_similarity_sum = 0
+    def recommend_items_batch(
+        self, target_group_ids: List[int], method: str | None = None, alpha: float | None = None,
+        top_k_users: int | None = None, top_k_items: int | None = None, workers: int | None = None,
+        half_life: float | None = None
+    ) -> Dict[int, tuple[List[int], List[float]]]:
+        """
+        Recommends a sorted list of items for several target groups at once, reading the ratings only once.
+        Intended for evaluation and offline scoring.
 
-            item_similarities = sorted([
-                (similar_item, self.item_similarity(item, similar_item, method=method))
-                for similar_item in target_ratings.keys()
-            ], key=lambda x: x[1], reverse=True)
+        Parameters
+        ----------
+        target_group_ids : List[int]
+            Identifiers of the target groups.
+        method, alpha, top_k_users, top_k_items, half_life
+            See `recommend_items`.
+        workers : int, optional
+            Number of worker processes among which the target groups are partitioned. If None, the groups are scored in this process.
 
-            # Only consider the top-k most similar items
-            if top_k_items is not None:
-                item_similarities = item_similarities[:top_k_items]
+        Returns
+        -------
+        Dict[int, tuple[List[int], List[float]]]
+            Dictionary mapping each target group to its sorted list of item IDs and their corresponding probabilities.
+        """
+        assert method in self.VALID_METHODS + [None], f"Invalid method; use one of {self.VALID_METHODS}"
+        assert (alpha is None) or (0 <= alpha <= 1), "Alpha must be between 0 and 1"
 
-            for similar_item, similar_item_similarity in item_similarities:
-                target_rated_item_rating = target_ratings[similar_item][0]
-                item_based_score += similar_item_similarity * target_rated_item_rating
-                item_similarity_sum += similar_item_similarity
+        if method is None:
+            method = self.default_method
 
-            item_based_prediction = (
-                item_based_score / item_similarity_sum if item_similarity_sum > 0 else 0
-            )
+        if alpha is None:
+            alpha = self.default_alpha
 
-            item_based_predictions[item] = item_based_prediction
+        if half_life is None:
+            half_life = self.default_half_life
+
+        results = {}
+        for target_group_id in dict.fromkeys(target_group_ids):
+            cached = self.cache.get(self.__cache_key(target_group_id, method, alpha, top_k_users, top_k_items, half_life))
+            if cached is not None:
+                results[target_group_id] = cached
+
+        missing = [group_id for group_id in dict.fromkeys(target_group_ids) if group_id not in results]
+        if missing:
+            group_ids, item_ids, ratings, updated_at = self.get_rating_matrices()
+            weights = self.__recency_weights(updated_at, half_life)
+            group_rows = {int(group_id): row for row, group_id in enumerate(group_ids)}
+
+            new_groups = [group_id for group_id in missing if group_id not in group_rows]
+            known_groups = [group_id for group_id in missing if group_id in group_rows]
+
+            computed = {}
+            if new_groups:
+                average_ratings = self.__recommend_average_ratings(item_ids, ratings, weights)
+                computed.update({group_id: average_ratings for group_id in new_groups})
+
+            if method == 'als':
+                computed.update({group_id: self.__recommend_items_mf(group_id, item_ids, ratings, weights) for group_id in known_groups})
+            elif known_groups:
+                target_rows = [group_rows[group_id] for group_id in known_groups]
+                if workers is not None and workers > 1:
+                    with ParallelScorer(ratings, workers, weights) as scorer:
+                        scores = scorer.score_groups(target_rows, method, alpha, top_k_users, top_k_items)
+                else:
+                    scores = [score_group(ratings, row, method, alpha, top_k_users, top_k_items, weights) for row in target_rows]
+
+                for group_id, (sorted_cols, sorted_probs) in zip(known_groups, scores):
+                    computed[group_id] = ([int(item) for item in item_ids[sorted_cols]], [float(prob) for prob in sorted_probs])
+
+            for group_id, result in computed.items():
+                # Entries of new groups depend on the ratings of all items
+                rated_items = item_ids[~np.isnan(ratings[group_rows[group_id]])].tolist() if group_id in group_rows else None
+                self.cache.put(self.__cache_key(group_id, method, alpha, top_k_users, top_k_items, half_life), result, rated_items=rated_items)
+                results[group_id] = result
+
+        # Return copies, callers are allowed to modify the lists
+        return {group_id: (list(results[group_id][0]), list(results[group_id][1])) for group_id in target_group_ids}
+
+    def __recommend_average_ratings(self, item_ids: np.ndarray, ratings: np.ndarray, weights: np.ndarray | None = None) -> tuple[List[int], List[float]]:
+        """
+        Recommends all items sorted by their average rating among all groups (weighted by recency if weights
+        are given), used for new groups.
+        """
+        if len(item_ids) == 0:
+            return [], []
 
-        # Scale to give the same importance to both predictions
-        min_user_based_prediction, max_user_based_prediction = min(user_based_predictions.values()), max(user_based_predictions.values())
-        scaled_user_based_predictions = {
-            item: (user_based_predictions[item] - min_user_based_prediction) / (max_user_based_prediction - min_user_based_prediction) if max_user_based_prediction != min_user_based_prediction else 0
-            for item in all_items
-        }
+        if weights is None:
+            avg_ratings = np.nanmean(ratings, axis=0)
+        else:
+            rated = ~np.isnan(ratings)
+            weights = np.where(rated, weights, 0)
+            avg_ratings = (np.where(rated, ratings, 0) * weights).sum(axis=0) / weights.sum(axis=0)
+        order = np.argsort(-avg_ratings, kind='stable')
 
-        min_item_based_prediction, max_item_based_prediction = min(item_based_predictions.values()), max(item_based_predictions.values())
-        scaled_item_based_predictions = {
-            item: (item_based_predictions[item] - min_item_based_prediction) / (max_item_based_prediction - min_item_based_prediction) if max_item_based_prediction != min_item_based_prediction else 0
-            for item in all_items
-        }
+        return [int(item) for item in item_ids[order]], [float(prob) for prob in avg_ratings[order]]
 
-        # Combine user-based and item-based predictions using alpha
-        predicted_ratings = {
-            item: alpha * scaled_user_based_predictions[item] + (1 - alpha) * scaled_item_based_predictions[item]
-            for item in all_items
-        }
+    def __recommend_items_mf(self, target_group_id: int, item_ids: np.ndarray, ratings: np.ndarray, weights: np.ndarray | None = None) -> tuple[List[int], List[float]]:
+        """
+        Recommends a sorted list of items for a target group using the matrix-factorization model.
+        The model is loaded from disk (or trained if there is none) the first time it is needed.
+        The factors are trained on the raw ratings, recency weights only affect the fallback for groups without factors.
+        """
+        if not self.mf.is_fitted and not self.mf.load():
+            self.train_factors()
 
-        # Sort items by predicted ratings in descending order
-        sorted_items = sorted(predicted_ratings.keys(), key=lambda x: predicted_ratings[x], reverse=True)
+        scores = self.mf.score(target_group_id)
+        if scores is None:
+            # The group was stored after the factors were trained
+            group_ratings = self.get_group_ratings(target_group_id)
+            if not self.mf.fold_in(target_group_id, list(group_ratings.keys()), [r[0] for r in group_ratings.values()]):
+                return self.__recommend_average_ratings(item_ids, ratings, weights)
+            scores = self.mf.score(target_group_id)
 
-        # print([round(float(predicted_ratings[item]), 4) for item in sorted_items])
+        # Scale to [0, 1] as the neighbourhood predictions
+        min_score, max_score = scores.min(), scores.max()
+        scaled_scores = (scores - min_score) / (max_score - min_score) if max_score != min_score else np.zeros_like(scores)
 
-        sorted_probs = [predicted_ratings[item] for item in sorted_items]
+        order = np.argsort(-scaled_scores, kind='stable')
+        sorted_items = [int(item) for item in self.mf.item_ids[order]]
+        sorted_probs = [float(prob) for prob in scaled_scores[order]]
 
         return sorted_items, sorted_probs
+
+    def cache_stats(self) -> Dict[str, float]:
+        """
+        Returns the hit-rate metrics of the recommendation cache.
+        """
+        return self.cache.stats()
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Set
+
+class RecommendationCache:
+    """
+    This class implements a bounded LRU cache for the recommendations of the CF system.
+
+    Every entry is keyed by (group_id, method, alpha, top_k_users, top_k_items, half_life, decay bucket) and remembers
+    the items rated by the group when it was computed, so that a rating write only invalidates
+    the entries of the written group and the entries of the groups that rated any of the written
+    items. Entries computed without group ratings (new groups, ranked by the average rating of
+    all items) depend on every item and are invalidated by any write, and so are the entries of
+    the methods given to invalidate (neighbourhood methods, whose predictions for a group change
+    with the ratings of its neighbours).
+    """
+    def __init__(self, max_size: int = 256):
+        """
+        Initializes an empty cache.
+
+        Parameters
+        ----------
+        max_size : int
+            Maximum number of cached recommendations, default is 256. 0 disables the cache.
+        """
+        assert max_size >= 0, "Cache size must be a non-negative value"
+
+        self.max_size = max_size
+        self.entries: OrderedDict[tuple, tuple] = OrderedDict()
+        self.keys_by_group: Dict[int, Set[tuple]] = {}
+        self.keys_by_item: Dict[int, Set[tuple]] = {}
+        self.keys_depending_on_all_items: Set[tuple] = set()
+        self.item_dependencies: Dict[tuple, Set[int] | None] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> tuple | None:
+        """
+        Returns the cached value for a key (marking it as recently used), or None if it is not cached.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key: tuple, value: tuple, rated_items: Iterable[int] | None) -> None:
+        """
+        Stores a value in the cache, evicting the least recently used entry if the cache is full.
+
+        Parameters
+        ----------
+        key : tuple
+            (group_id, method, alpha, top_k_users, top_k_items, half_life, decay bucket).
+        value : tuple
+            The recommendation to cache.
+        rated_items : Iterable[int] | None
+            Items rated by the group when the value was computed. None means the value depends on all items.
+        """
+        if self.max_size == 0:
+            return
+
+        if key in self.entries:
+            self.__remove(key)
+
+        self.entries[key] = value
+        self.keys_by_group.setdefault(key[0], set()).add(key)
+
+        if rated_items is None:
+            self.keys_depending_on_all_items.add(key)
+            self.item_dependencies[key] = None
+        else:
+            rated_items = set(rated_items)
+            for item_id in rated_items:
+                self.keys_by_item.setdefault(item_id, set()).add(key)
+            self.item_dependencies[key] = rated_items
+
+        while len(self.entries) > self.max_size:
+            oldest_key = next(iter(self.entries))
+            self.__remove(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, group_id: int, item_ids: Iterable[int], methods: Iterable[str] = ()) -> None:
+        """
+        Invalidates the entries affected by a rating write of a group on some items.
+        The entries of the given methods are invalidated for every group.
+        """
+        keys = set(self.keys_by_group.get(group_id, ())) | self.keys_depending_on_all_items
+        methods = set(methods)
+        if methods:
+            keys |= {key for key in self.entries if key[1] in methods}
+        for item_id in item_ids:
+            keys |= self.keys_by_item.get(item_id, set())
+
+        for key in keys:
+            self.__remove(key)
+        self.invalidations += len(keys)
+
+    def clear(self) -> None:
+        """
+        Invalidates all the entries.
+        """
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+        self.keys_by_group.clear()
+        self.keys_by_item.clear()
+        self.keys_depending_on_all_items.clear()
+        self.item_dependencies.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the hit-rate metrics of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions
+        }
+
+    def __remove(self, key: Hashable) -> None:
+        self.entries.pop(key, None)
+
+        group_keys = self.keys_by_group.get(key[0])
+        if group_keys is not None:
+            group_keys.discard(key)
+            if not group_keys:
+                del self.keys_by_group[key[0]]
+
+        rated_items = self.item_dependencies.pop(key, None)
+        if rated_items is None:
+            self.keys_depending_on_all_items.discard(key)
+        else:
+            for item_id in rated_items:
+                item_keys = self.keys_by_item.get(item_id)
+                if item_keys is not None:
+                    item_keys.discard(key)
+                    if not item_keys:
+                        del self.keys_by_item[item_id]
@@ -0,0 +1,273 @@
+"""
+Vectorized neighbourhood scoring of the CF system over a dense rating matrix.
+
+The rating matrix has one row per group and one column per item, with NaN for the items a group has
+not rated. Similarities are computed over the common support of each pair of vectors, as in
+`CF.group_similarity` and `CF.item_similarity`, and scaled to [0, 1]. Undefined similarities
+(no common support, zero norms or constant vectors for Pearson) are 0.
+
+Predictions can optionally weight every rating by a recency weight in (0, 1], see `time_decay_weights`.
+Similarities are always computed on the raw ratings.
+
+The same kernels are run by the worker processes of `ParallelScorer`, which read the rating
+matrix from shared memory instead of receiving a pickled copy per task.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List
+import numpy as np
+
+def time_decay_weights(updated_at: np.ndarray, half_life: float | None, now: float) -> np.ndarray:
+    """
+    Computes the exponential time-decay weight of every rating, 0.5 ** (age / half_life).
+    Ratings without a timestamp (NaN) have weight 1.
+
+    Parameters
+    ----------
+    updated_at : np.ndarray
+        Timestamp (seconds since the epoch) of the last update of every rating.
+    half_life : float | None
+        Age (in seconds) at which a rating weighs half as much as a new one. None disables the decay.
+    now : float
+        Current timestamp.
+    """
+    if half_life is None:
+        return np.ones_like(updated_at, dtype=np.float64)
+
+    age = np.maximum(now - updated_at, 0)
+    return np.where(np.isnan(updated_at), 1.0, np.exp(-np.log(2) * age / half_life))
+
+def _similarities(dot, sum_a, sum_b, sq_a, sq_b, count, method: str, min_count: int) -> np.ndarray:
+    """
+    Computes cosine or Pearson similarities scaled to [0, 1] from the sufficient statistics of
+    each pair of vectors restricted to their common support.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'cosine':
+            similarity = dot / np.sqrt(sq_a * sq_b)
+        else:
+            var_a = sq_a - sum_a ** 2 / count
+            var_b = sq_b - sum_b ** 2 / count
+            # Constant vectors have an undefined correlation
+            var_a[var_a <= 1e-12 * np.maximum(sq_a, 1)] = 0
+            var_b[var_b <= 1e-12 * np.maximum(sq_b, 1)] = 0
+            similarity = (dot - sum_a * sum_b / count) / np.sqrt(var_a * var_b)
+
+    # Rounding keeps exact ties (e.g. Pearson over two points is always -1 or 1) tied despite float error
+    similarity = np.round((np.clip(similarity, -1, 1) + 1) / 2, 10)
+    similarity[~np.isfinite(similarity) | (count < min_count)] = 0
+    return similarity
+
+def group_similarities(ratings: np.ndarray, target_row: int, method: str) -> np.ndarray:
+    """
+    Computes the similarity of the target group with every group (rows of the rating matrix).
+    """
+    rated = ~np.isnan(ratings)
+    values = np.where(rated, ratings, 0)
+    target_rated = rated[target_row].astype(np.float64)
+    target_values = values[target_row]
+
+    return _similarities(
+        dot=values @ target_values,
+        sum_a=values @ target_rated,
+        sum_b=rated @ target_values,
+        sq_a=(values ** 2) @ target_rated,
+        sq_b=rated @ (target_values ** 2),
+        count=rated @ target_rated,
+        method=method,
+        min_count=2 if method == 'pearson' else 1
+    )
+
+def item_similarities(ratings: np.ndarray, cols_a: np.ndarray, cols_b: np.ndarray, method: str) -> np.ndarray:
+    """
+    Computes the similarity of every item in cols_a with every item in cols_b (columns of the rating matrix).
+    """
+    rated = ~np.isnan(ratings)
+    values = np.where(rated, ratings, 0)
+    rated_a, values_a = rated[:, cols_a].astype(np.float64), values[:, cols_a]
+    rated_b, values_b = rated[:, cols_b].astype(np.float64), values[:, cols_b]
+
+    return _similarities(
+        dot=values_a.T @ values_b,
+        sum_a=values_a.T @ rated_b,
+        sum_b=rated_a.T @ values_b,
+        sq_a=(values_a ** 2).T @ rated_b,
+        sq_b=rated_a.T @ (values_b ** 2),
+        count=rated_a.T @ rated_b,
+        method=method,
+        min_count=2 if method == 'pearson' else 1
+    )
+
+def select_similar_groups(ratings: np.ndarray, target_row: int, method: str, top_k_users: int | None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the rows of the most similar groups to the target group (excluding itself) and their similarities.
+    """
+    similarities = group_similarities(ratings, target_row, method)
+    others = np.delete(np.arange(ratings.shape[0]), target_row)
+    order = others[np.argsort(-similarities[others], kind='stable')]
+
+    # Only consider the top-k most similar users
+    if top_k_users is not None:
+        order = order[:top_k_users]
+
+    return order, similarities[order]
+
+def predict_items(
+    ratings: np.ndarray, target_row: int, cols: np.ndarray, similar_rows: np.ndarray, similar_groups_similarities: np.ndarray,
+    method: str, top_k_items: int | None, weights: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the unscaled user-based and item-based predictions of the target group for the items in cols,
+    weighting every rating by its recency weight if weights are given.
+    """
+    # USER-BASED COLLABORATIVE FILTERING --------------------------------
+    neighbours = ratings[np.ix_(similar_rows, cols)]
+    neighbours_rated = ~np.isnan(neighbours)
+    neighbours_weights = neighbours_rated if weights is None else np.where(neighbours_rated, weights[np.ix_(similar_rows, cols)], 0)
+    user_based_score = similar_groups_similarities @ (np.where(neighbours_rated, neighbours, 0) * neighbours_weights)
+    user_similarity_sum = similar_groups_similarities @ neighbours_weights
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        user_based_predictions = np.where(user_similarity_sum > 0, user_based_score / user_similarity_sum, 0)
+
+    # ITEM-BASED COLLABORATIVE FILTERING --------------------------------
+    target_cols = np.flatnonzero(~np.isnan(ratings[target_row]))
+    similarities = item_similarities(ratings, cols, target_cols, method)
+    target_values = np.broadcast_to(ratings[target_row, target_cols], similarities.shape)
+    target_weights = np.broadcast_to(1.0 if weights is None else weights[target_row, target_cols], similarities.shape)
+
+    # Only consider the top-k most similar items
+    if top_k_items is not None and top_k_items < len(target_cols):
+        top = np.argsort(-similarities, axis=1, kind='stable')[:, :top_k_items]
+        similarities = np.take_along_axis(similarities, top, axis=1)
+        target_values = np.take_along_axis(target_values, top, axis=1)
+        target_weights = np.take_along_axis(target_weights, top, axis=1)
+
+    item_based_score = (similarities * target_weights * target_values).sum(axis=1)
+    item_similarity_sum = (similarities * target_weights).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        item_based_predictions = np.where(item_similarity_sum > 0, item_based_score / item_similarity_sum, 0)
+
+    return user_based_predictions, item_based_predictions
+
+def combine_predictions(user_based_predictions: np.ndarray, item_based_predictions: np.ndarray, alpha: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Scales both predictions to [0, 1], combines them using alpha and returns the columns sorted
+    by predicted rating in descending order and their predicted ratings.
+    """
+    def scale(predictions: np.ndarray) -> np.ndarray:
+        # Scale to give the same importance to both predictions
+        min_prediction, max_prediction = predictions.min(), predictions.max()
+        if max_prediction == min_prediction:
+            return np.zeros_like(predictions)
+        return (predictions - min_prediction) / (max_prediction - min_prediction)
+
+    predicted_ratings = alpha * scale(user_based_predictions) + (1 - alpha) * scale(item_based_predictions)
+    order = np.argsort(-predicted_ratings, kind='stable')
+    return order, predicted_ratings[order]
+
+def score_group(
+    ratings: np.ndarray, target_row: int, method: str, alpha: float, top_k_users: int | None, top_k_items: int | None,
+    weights: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the neighbourhood recommendation of a group over all the columns of the rating matrix.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        Columns sorted by predicted rating in descending order and their predicted ratings.
+    """
+    similar_rows, similarities = select_similar_groups(ratings, target_row, method, top_k_users)
+    user_based, item_based = predict_items(ratings, target_row, np.arange(ratings.shape[1]), similar_rows, similarities, method, top_k_items, weights)
+    return combine_predictions(user_based, item_based, alpha)
+
+# --- Worker processes ---
+
+_worker_memory = None
+_worker_ratings = None
+_worker_weights = None
+
+def _attach_ratings(name: str, shape: tuple, dtype: str) -> None:
+    """
+    Initializer of the worker processes: maps the shared rating matrix (and the recency weights,
+    stacked after it if present) without copying them.
+    """
+    global _worker_memory, _worker_ratings, _worker_weights
+    _worker_memory = shared_memory.SharedMemory(name=name)
+    stacked = np.ndarray(shape, dtype=dtype, buffer=_worker_memory.buf)
+    _worker_ratings = stacked[0]
+    _worker_weights = stacked[1] if shape[0] > 1 else None
+
+def _predict_chunk(target_row, cols, similar_rows, similarities, method, top_k_items):
+    return predict_items(_worker_ratings, target_row, cols, similar_rows, similarities, method, top_k_items, _worker_weights)
+
+def _score_groups_chunk(target_rows, method, alpha, top_k_users, top_k_items):
+    return [score_group(_worker_ratings, row, method, alpha, top_k_users, top_k_items, _worker_weights) for row in target_rows]
+
+class ParallelScorer:
+    """
+    Scores groups over a rating matrix with a pool of worker processes. The matrix is copied once
+    into shared memory and every worker maps it read-only, so tasks only carry row and column indices.
+
+    Use it as a context manager, the shared memory and the pool are released on exit.
+    """
+    def __init__(self, ratings: np.ndarray, workers: int, weights: np.ndarray | None = None):
+        assert workers > 0, "The number of workers must be positive"
+
+        self.ratings = ratings
+        self.weights = weights
+        self.workers = workers
+        self.memory = None
+        self.pool = None
+
+    def __enter__(self) -> 'ParallelScorer':
+        arrays = [self.ratings] if self.weights is None else [self.ratings, self.weights]
+        stacked_shape = (len(arrays),) + self.ratings.shape
+        self.memory = shared_memory.SharedMemory(create=True, size=max(int(np.prod(stacked_shape)) * 8, 1))
+        stacked = np.ndarray(stacked_shape, dtype=np.float64, buffer=self.memory.buf)
+        for i, array in enumerate(arrays):
+            stacked[i] = array
+        self.ratings = stacked[0]
+        self.weights = stacked[1] if len(arrays) > 1 else None
+
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_attach_ratings,
+            initargs=(self.memory.name, stacked_shape, stacked.dtype.str)
+        )
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.pool.shutdown()
+        self.ratings = None
+        self.weights = None
+        self.memory.close()
+        self.memory.unlink()
+
+    def score_group(self, target_row: int, method: str, alpha: float, top_k_users: int | None, top_k_items: int | None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Scores one group, partitioning the items across the workers.
+        """
+        similar_rows, similarities = select_similar_groups(self.ratings, target_row, method, top_k_users)
+        chunks = np.array_split(np.arange(self.ratings.shape[1]), self.workers)
+
+        futures = [
+            self.pool.submit(_predict_chunk, target_row, cols, similar_rows, similarities, method, top_k_items)
+            for cols in chunks if len(cols) > 0
+        ]
+        results = [future.result() for future in futures]
+
+        user_based = np.concatenate([user for user, _ in results])
+        item_based = np.concatenate([item for _, item in results])
+        return combine_predictions(user_based, item_based, alpha)
+
+    def score_groups(self, target_rows: List[int], method: str, alpha: float, top_k_users: int | None, top_k_items: int | None) -> List[tuple[np.ndarray, np.ndarray]]:
+        """
+        Scores several groups, partitioning the groups across the workers.
+        """
+        chunks = [chunk for chunk in np.array_split(np.asarray(target_rows, dtype=np.int64), self.workers) if len(chunk) > 0]
+        futures = [self.pool.submit(_score_groups_chunk, chunk, method, alpha, top_k_users, top_k_items) for chunk in chunks]
+        return [result for future in futures for result in future.result()]
@@ -0,0 +1,228 @@
+"""
+Memory-mapped snapshots of the ratings table.
+
+A snapshot stores the ratings as CSR arrays (one row per group, one column per item) in `.npy`
+files that are opened read-only with `np.load(mmap_mode='r')`, so opening one is near-instant and
+the OS page cache is shared by every process that reads it (e.g. the Flask app and the evaluation
+scripts).
+
+Layout of a snapshot directory:
+
+    CURRENT                 version number of the latest complete snapshot
+    v<version>/
+        manifest.json       version stamp, creation time and shape
+        indptr.npy          row pointers (n_groups + 1)
+        indices.npy         column of each rating
+        data.npy            rating values
+        visit_count.npy     visit count of each rating
+        updated_at.npy      timestamp of the last update of each rating (NaN if unknown)
+        group_ids.npy       group identifier of each row (sorted)
+        item_ids.npy        item identifier of each column (sorted)
+
+Every export writes a new version directory and then atomically replaces CURRENT, so readers
+never see a partially written snapshot.
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+from typing import Dict, List
+import numpy as np
+
+ARRAYS = ['indptr', 'indices', 'data', 'visit_count', 'updated_at', 'group_ids', 'item_ids']
+
+def current_version(snapshot_dir: str) -> int | None:
+    """
+    Returns the version of the latest complete snapshot in snapshot_dir, or None if there is none.
+    """
+    try:
+        with open(os.path.join(snapshot_dir, 'CURRENT')) as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+def export_ratings_snapshot(conn: sqlite3.Connection, snapshot_dir: str, keep_versions: int = 2) -> int:
+    """
+    Exports the ratings table to a new snapshot version.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection to the database storing the ratings.
+    snapshot_dir : str
+        Directory of the snapshots.
+    keep_versions : int
+        Number of versions kept on disk (older ones are removed), default is 2 so that readers of the
+        previous version are not disturbed.
+
+    Returns
+    -------
+    int
+        The version of the new snapshot.
+    """
+    assert keep_versions >= 1, "At least the new version must be kept"
+
+    rows = conn.execute("SELECT group_id, item_id, rating, visit_count, updated_at FROM ratings ORDER BY group_id, item_id").fetchall()
+    if rows:
+        group_column, item_column, data, visit_count, updated_at = (np.array(column) for column in zip(*rows))
+        updated_at = np.where(updated_at == None, np.nan, updated_at).astype(np.float64)
+    else:
+        group_column, item_column = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        data, visit_count, updated_at = np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    group_ids, group_rows = np.unique(group_column, return_inverse=True)
+    item_ids, indices = np.unique(item_column, return_inverse=True)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(group_rows, minlength=len(group_ids)))])
+
+    version = (current_version(snapshot_dir) or 0) + 1
+    version_dir = os.path.join(snapshot_dir, f'v{version}')
+    os.makedirs(version_dir, exist_ok=True)
+
+    arrays = {
+        'indptr': indptr.astype(np.int64),
+        'indices': indices.astype(np.int32),
+        'data': data.astype(np.float64),
+        'visit_count': visit_count.astype(np.int32),
+        'updated_at': updated_at,
+        'group_ids': group_ids.astype(np.int64),
+        'item_ids': item_ids.astype(np.int64)
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(version_dir, f'{name}.npy'), array)
+
+    with open(os.path.join(version_dir, 'manifest.json'), 'w') as f:
+        json.dump({'version': version, 'created_at': time.time(), 'n_groups': len(group_ids), 'n_items': len(item_ids), 'n_ratings': len(data)}, f)
+
+    # Publish the new version atomically
+    tmp_path = os.path.join(snapshot_dir, 'CURRENT.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(str(version))
+    os.replace(tmp_path, os.path.join(snapshot_dir, 'CURRENT'))
+
+    for name in os.listdir(snapshot_dir):
+        if name.startswith('v') and name[1:].isdigit() and int(name[1:]) <= version - keep_versions:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+    return version
+
+class RatingsSnapshot:
+    """
+    Read-only view of the latest ratings snapshot plus an in-memory delta overlay with the ratings
+    written by this process since the snapshot was exported. The overlay is expected to stay small:
+    it is emptied every time a new snapshot is exported.
+    """
+    def __init__(self, snapshot_dir: str):
+        """
+        Opens the latest snapshot in snapshot_dir with memory-mapped arrays.
+
+        Raises
+        ------
+        FileNotFoundError
+            If there is no snapshot in snapshot_dir.
+        """
+        version = current_version(snapshot_dir)
+        if version is None:
+            raise FileNotFoundError(f"No ratings snapshot found in {snapshot_dir}")
+
+        self.snapshot_dir = snapshot_dir
+        self.version = version
+        version_dir = os.path.join(snapshot_dir, f'v{version}')
+        for name in ARRAYS:
+            path = os.path.join(version_dir, f'{name}.npy')
+            if name == 'updated_at' and not os.path.exists(path):
+                # Snapshots exported before timestamps were stored
+                self.updated_at = np.full(len(self.data), np.nan)
+                continue
+            setattr(self, name, np.load(path, mmap_mode='r'))
+
+        self.group_rows = {int(group_id): row for row, group_id in enumerate(self.group_ids)}
+        self.item_cols = {int(item_id): col for col, item_id in enumerate(self.item_ids)}
+
+        # (group_id, item_id) -> (rating, visit_count, updated_at)
+        self.delta: Dict[tuple[int, int], tuple[float, int, float]] = {}
+
+    def set(self, group_id: int, item_id: int, rating: float, visit_count: int, updated_at: float = np.nan) -> None:
+        """
+        Records a rating written after the snapshot was exported.
+        """
+        self.delta[(group_id, item_id)] = (rating, visit_count, updated_at)
+
+    def get(self, group_id: int, item_id: int) -> tuple[float, int] | None:
+        """
+        Returns the (rating, visit_count) of a group for an item, or None if it has not been rated.
+        """
+        if (group_id, item_id) in self.delta:
+            return self.delta[(group_id, item_id)][:2]
+
+        row, col = self.group_rows.get(group_id), self.item_cols.get(item_id)
+        if row is None or col is None:
+            return None
+
+        start, end = self.indptr[row], self.indptr[row + 1]
+        position = start + np.searchsorted(self.indices[start:end], col)
+        if position < end and self.indices[position] == col:
+            return float(self.data[position]), int(self.visit_count[position])
+        return None
+
+    def group_ratings(self, group_id: int) -> Dict[int, tuple[float, int]]:
+        """
+        Returns a dictionary mapping the items rated by a group to a tuple of (rating, visit_count).
+        """
+        ratings = {}
+        row = self.group_rows.get(group_id)
+        if row is not None:
+            start, end = self.indptr[row], self.indptr[row + 1]
+            for col, rating, visit_count in zip(self.indices[start:end], self.data[start:end], self.visit_count[start:end]):
+                ratings[int(self.item_ids[col])] = (float(rating), int(visit_count))
+
+        ratings.update({item_id: value[:2] for (g, item_id), value in self.delta.items() if g == group_id})
+        return ratings
+
+    def item_ratings(self, item_id: int) -> Dict[int, tuple[float, int]]:
+        """
+        Returns a dictionary mapping the groups that rated an item to a tuple of (rating, visit_count).
+        """
+        ratings = {}
+        col = self.item_cols.get(item_id)
+        if col is not None:
+            positions = np.flatnonzero(self.indices == col)
+            rows = np.searchsorted(self.indptr, positions, side='right') - 1
+            for row, position in zip(rows, positions):
+                ratings[int(self.group_ids[row])] = (float(self.data[position]), int(self.visit_count[position]))
+
+        ratings.update({group_id: value[:2] for (group_id, i), value in self.delta.items() if i == item_id})
+        return ratings
+
+    def all_groups(self) -> List[int]:
+        return sorted(set(self.group_rows) | {group_id for group_id, _ in self.delta})
+
+    def all_items(self) -> List[int]:
+        return sorted(set(self.item_cols) | {item_id for _, item_id in self.delta})
+
+    def rating_matrices(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Builds the dense rating and timestamp matrices of the snapshot with the delta overlay applied.
+        See `CF.get_rating_matrices`.
+        """
+        group_ids = np.array(self.all_groups(), dtype=np.int64)
+        item_ids = np.array(self.all_items(), dtype=np.int64)
+        matrix = np.full((len(group_ids), len(item_ids)), np.nan)
+        updated_at = np.full((len(group_ids), len(item_ids)), np.nan)
+
+        # Snapshot ids are a sorted subset of the merged ids
+        snapshot_rows = np.searchsorted(group_ids, self.group_ids)
+        snapshot_cols = np.searchsorted(item_ids, self.item_ids)
+        rows = np.repeat(snapshot_rows, np.diff(self.indptr))
+        matrix[rows, snapshot_cols[self.indices]] = self.data
+        updated_at[rows, snapshot_cols[self.indices]] = self.updated_at
+
+        if self.delta:
+            keys = np.array(list(self.delta.keys()), dtype=np.int64)
+            values = np.array([(rating, timestamp) for rating, _, timestamp in self.delta.values()], dtype=np.float64)
+            rows, cols = np.searchsorted(group_ids, keys[:, 0]), np.searchsorted(item_ids, keys[:, 1])
+            matrix[rows, cols] = values[:, 0]
+            updated_at[rows, cols] = values[:, 1]
+
+        return group_ids, item_ids, matrix, updated_at
@@ -1,13 +1,32 @@
 import sqlite3
 import pandas as pd
-from sklearn.cluster import KMeans
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.metrics import silhouette_score
 import joblib
+import hashlib
 import os
 
+def _evaluate_k(X_scaled, k, minimum_examples_per_cluster, silhouette_sample_size, random_state):
+    """
+    Fit KMeans with k clusters and compute its silhouette score.
+    The score is None if a cluster has less than minimum_examples_per_cluster examples.
+    """
+    kmeans = KMeans(n_clusters=k, random_state=random_state, n_init=10)
+    labels = kmeans.fit_predict(X_scaled)
+
+    # Check the constraint before the (expensive) silhouette score
+    counts = np.bincount(labels, minlength=k)
+    if counts.min() < minimum_examples_per_cluster:
+        return k, None, kmeans
+
+    sample_size = silhouette_sample_size if silhouette_sample_size is not None and silhouette_sample_size < len(labels) else None
+    score = silhouette_score(X_scaled, labels, sample_size=sample_size, random_state=random_state)
+    return k, score, kmeans
+
 class Clustering:
-    def __init__(self, db_path='./data/database.db', model_path='./models/kmeans_model.joblib'):
+    def __init__(self, db_path='./data/database.db', model_path='./models/kmeans_model.joblib', inertia_drift_threshold=0.5, size_skew_drift_threshold=0.5, min_drift_samples=20):
         self.db_path = db_path
         self.model_path = model_path
         self.conn = sqlite3.connect(self.db_path)
@@ -19,35 +38,54 @@ class Clustering:
         self.cluster_labels = None
         self.feature_names = []
         self.ids = None  # Initialize ids attribute
+        self.fingerprint = None  # Fingerprint of the fetched train_cases (see compute_fingerprint)
+        self.model_is_current = False  # Whether the model was fitted on the fetched train_cases
+
+        # Encoder lookups of the NumPy classifier (see build_lookups)
+        self.author_codes = None
+        self.theme_codes = None
+
+        # Incremental mode (see start_incremental)
+        self.inertia_drift_threshold = inertia_drift_threshold
+        self.size_skew_drift_threshold = size_skew_drift_threshold
+        self.min_drift_samples = min_drift_samples
+        self.incremental = False
+        self.reference_inertia = None
+        self.reference_size_skew = None
+        self.cluster_sizes = None
+        self.new_cases_inertia = 0.0
+        self.new_cases_count = 0
 
-    def determine_optimal_clusters(self, X_scaled, min_clusters=3, max_clusters=10, minimum_examples_per_cluster=3):
+    def determine_optimal_clusters(self, X_scaled, min_clusters=3, max_clusters=10, minimum_examples_per_cluster=3, n_jobs=-1, silhouette_sample_size=2000, random_state=42):
         """
         Determine the optimal number of clusters using the silhouette score
         and ensure each cluster has at least minimum_examples_per_cluster examples.
         Update the KMeans model with the best result that satisfies the constraint.
+
+        The candidate k are evaluated in parallel with joblib (n_jobs workers). The silhouette score is
+        computed on a sample of silhouette_sample_size cases (None for all of them), and it is not computed
+        for the candidates that do not satisfy the constraint.
         """
+        results = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(_evaluate_k)(X_scaled, k, minimum_examples_per_cluster, silhouette_sample_size, random_state)
+            for k in range(min_clusters, max_clusters + 1)
+        )
+
         best_score = -1
         best_k = None
         best_model = None  # Track the best model
 
-        # Iterate over the range of clusters
-        for k in range(min_clusters, max_clusters + 1):
-            kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-            labels = kmeans.fit_predict(X_scaled)
-            score = silhouette_score(X_scaled, labels, random_state=42)
-            print(f'Number of clusters: {k}, Silhouette Score: {score:.4f}')
+        # Results are in the order of k, so ties keep the smallest k
+        for k, score, kmeans in results:
+            if score is None:
+                print(f'Number of clusters: {k}, cluster size below minimum. Skipping this k.')
+                continue
 
-            # Check if all clusters have at least minimum_examples_per_cluster examples
-            unique, counts = pd.Series(labels).value_counts().sort_index().index, pd.Series(labels).value_counts().sort_index().values
-            if all(count >= minimum_examples_per_cluster for count in counts):
-                print(f'All clusters have at least {minimum_examples_per_cluster} examples.')
-                # Update the best result if this score is the highest
-                if score > best_score:
-                    best_score = score
-                    best_k = k
-                    best_model = kmeans
-            else:
-                print(f'Cluster size below minimum for k={k}. Skipping this k.')
+            print(f'Number of clusters: {k}, Silhouette Score: {score:.4f}')
+            if score > best_score:
+                best_score = score
+                best_k = k
+                best_model = kmeans
 
         if best_model is None:
             raise ValueError(f"No k between {min_clusters} and {max_clusters} satisfies the minimum examples per cluster constraint.")
@@ -55,6 +93,7 @@ class Clustering:
         # Finalize the KMeans model with the best k
         self.kmeans = best_model
         self.cluster_labels = self.kmeans.predict(X_scaled)
+        self.model_is_current = self.fingerprint is not None
         print(f'\nOptimal number of clusters determined: {best_k} with Silhouette Score: {best_score:.4f}')
 
         return best_k
@@ -68,6 +107,7 @@ class Clustering:
         ORDER BY case_id
         """
         df = pd.read_sql_query(query, self.conn)
+        self.fingerprint = self.compute_fingerprint(df)
         df['guided_visit'] = df['guided_visit'].astype(int)
         df['minors'] = df['minors'].astype(int)
         df['preferred_main_theme_encoded'] = self.label_encoder_theme.fit_transform(df['preferred_main_theme'])
@@ -78,8 +118,21 @@ class Clustering:
                     'preferred_main_theme_encoded']
         self.data = df[features]
         self.ids = df['case_id']
+        self.build_lookups()
         return df
 
+    def compute_fingerprint(self, df):
+        """
+        Fingerprint of the fetched train_cases: row count, max case_id and a hash of the clustering columns.
+        A saved model is only reused if it was fitted on data with the same fingerprint.
+        """
+        content_hash = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+        return {
+            'row_count': len(df),
+            'max_case_id': int(df['case_id'].max()) if len(df) > 0 else None,
+            'content_hash': content_hash
+        }
+
     def encode_and_scale_features(self):
         """Encode categorical features and scale numerical features for clustering."""
         if self.data is None:
@@ -88,7 +141,7 @@ class Clustering:
         self.feature_names = list(self.data.columns)
         return X_scaled
 
-    def perform_clustering(self, X_scaled, min_k=3, max_k=10, minimum_examples_per_cluster=3):
+    def perform_clustering(self, X_scaled, min_k=3, max_k=10, minimum_examples_per_cluster=3, n_jobs=-1, silhouette_sample_size=2000, random_state=42):
         """
         Perform KMeans clustering using the determined optimal number of clusters.
         Ensures each cluster has at least minimum_examples_per_cluster examples.
@@ -99,7 +152,10 @@ class Clustering:
                 X_scaled, 
                 min_clusters=min_k, 
                 max_clusters=max_k, 
-                minimum_examples_per_cluster=minimum_examples_per_cluster
+                minimum_examples_per_cluster=minimum_examples_per_cluster,
+                n_jobs=n_jobs,
+                silhouette_sample_size=silhouette_sample_size,
+                random_state=random_state
             )
         else:
             # If KMeans is already initialized (e.g., from saved model), just predict
@@ -110,7 +166,7 @@ class Clustering:
 
     def ensure_cluster_column_in_cases(self):
         """Ensure the 'cluster' column exists in the train_cases table."""
-        cursor = self.conn.execute("PRAGMA table_info(cases)")
+        cursor = self.conn.execute("PRAGMA table_info(train_cases)")
         columns = [col[1] for col in cursor.fetchall()]
         if 'cluster' not in columns:
             with self.conn:
@@ -118,13 +174,28 @@ class Clustering:
             print("Added 'cluster' column to train_cases table.")
 
     def save_clusters_to_cases(self):
-        """Save cluster assignments to the train_cases table."""
+        """
+        Save cluster assignments to the train_cases table.
+        The (case_id, cluster) pairs are loaded into a temporary table and applied with a single UPDATE ... FROM join,
+        all in one transaction.
+        """
         if self.cluster_labels is None:
             raise ValueError("No clustering results to save.")
         self.ensure_cluster_column_in_cases()
         with self.conn:
-            for id_val, label in zip(self.ids, self.cluster_labels):
-                self.conn.execute("UPDATE train_cases SET cluster = ? WHERE case_id = ?", (int(label), id_val))
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS new_clusters (case_id INTEGER PRIMARY KEY, cluster INTEGER)")
+            self.conn.execute("DELETE FROM new_clusters")
+            self.conn.executemany(
+                "INSERT INTO new_clusters (case_id, cluster) VALUES (?, ?)",
+                zip((int(id_val) for id_val in self.ids), (int(label) for label in self.cluster_labels))
+            )
+            self.conn.execute("""
+                UPDATE train_cases
+                SET cluster = new_clusters.cluster
+                FROM new_clusters
+                WHERE train_cases.case_id = new_clusters.case_id
+            """)
+            self.conn.execute("DELETE FROM new_clusters")
         print("Clusters saved to train_cases table.")
 
     def save_model(self):
@@ -134,7 +205,8 @@ class Clustering:
             'scaler': self.scaler,
             'label_encoder_theme': self.label_encoder_theme,
             'label_encoder_author': self.label_encoder_author,
-            'feature_names': self.feature_names
+            'feature_names': self.feature_names,
+            'fingerprint': self.fingerprint
         }
         os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
         joblib.dump(model_data, self.model_path)
@@ -144,13 +216,38 @@ class Clustering:
         """Load the model and preprocessing objects."""
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Model file not found at {self.model_path}")
+        self.apply_model_data(joblib.load(self.model_path))
+        print(f"Model loaded from {self.model_path}")
+
+    def load_model_if_current(self):
+        """
+        Load the saved model only if it was fitted on the fetched train_cases (same fingerprint).
+        Returns whether the model was loaded; if not, the cases must be clustered again.
+        """
+        if self.fingerprint is None:
+            raise ValueError("No data available. Fetch data first.")
+        if not os.path.exists(self.model_path):
+            return False
+
         model_data = joblib.load(self.model_path)
+        if model_data.get('fingerprint') != self.fingerprint:
+            print(f"Model at {self.model_path} is outdated.")
+            return False
+
+        self.apply_model_data(model_data)
+        print(f"Model loaded from {self.model_path}")
+        return True
+
+    def apply_model_data(self, model_data):
+        """Set the model and preprocessing objects from the saved model data."""
         self.kmeans = model_data['kmeans']
         self.scaler = model_data['scaler']
         self.label_encoder_theme = model_data['label_encoder_theme']
         self.label_encoder_author = model_data['label_encoder_author']
         self.feature_names = model_data['feature_names']
-        print(f"Model loaded from {self.model_path}")
+        self.model_is_current = self.fingerprint is not None and model_data.get('fingerprint') == self.fingerprint
+        self.incremental = False
+        self.build_lookups()
 
     def print_cluster_statistics(self):
         """Print statistics for each cluster."""
@@ -202,27 +299,180 @@ class Clustering:
         print(centroids_df)
 
 
+    def label_cases_after(self, case_id):
+        """
+        Classify the train_cases added after case_id (e.g. retained while the model was being fitted, with the
+        clusters of the previous model) and save their clusters. Returns the number of labelled cases.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            df = pd.read_sql_query("""
+            SELECT case_id, num_people, preferred_author_name, preferred_year,
+                   preferred_main_theme, guided_visit, minors, num_experts, past_museum_visits
+            FROM train_cases
+            WHERE case_id > ?
+            ORDER BY case_id
+            """, conn, params=(int(case_id),))
+            if df.empty:
+                return 0
+
+            df['guided_visit'] = df['guided_visit'].astype(int)
+            df['minors'] = df['minors'].astype(int)
+            labels = self.classify_new_cases(df.to_dict('records'))
+            with conn:
+                conn.executemany(
+                    "UPDATE train_cases SET cluster = ? WHERE case_id = ?",
+                    zip(labels, (int(id_val) for id_val in df['case_id']))
+                )
+            return len(labels)
+        finally:
+            conn.close()
+
+    def build_lookups(self):
+        """Precompute the category -> code dicts of the label encoders, used instead of LabelEncoder.transform."""
+        self.author_codes = {name: code for code, name in enumerate(self.label_encoder_author.classes_)}
+        self.theme_codes = {name: code for code, name in enumerate(self.label_encoder_theme.classes_)}
+
+    def features_array(self, new_cases):
+        """
+        Build the (unscaled) feature matrix of several new cases in the order of feature_names.
+        Authors and themes unseen when fitting the encoders are NaN.
+        """
+        if self.author_codes is None:
+            self.build_lookups()
+
+        columns = {
+            'preferred_author_name_encoded': [self.author_codes.get(new_case['preferred_author_name'], np.nan) for new_case in new_cases],
+            'preferred_main_theme_encoded': [self.theme_codes.get(new_case['preferred_main_theme'], np.nan) for new_case in new_cases]
+        }
+        return np.array([
+            columns[name] if name in columns else [new_case[name] for new_case in new_cases]
+            for name in self.feature_names
+        ], dtype=np.float64).T.reshape(len(new_cases), len(self.feature_names))
+
+    def classify_features(self, X):
+        """
+        Assign each row of an unscaled feature matrix to the nearest centroid.
+
+        The scaler is folded into the centroids: the distance in the scaled space is a weighted distance to the
+        unscaled centroids, with weights 1 / scale^2. Unknown features (NaN, e.g. unseen authors or themes) are set
+        to their mean, as in scale_features, so that a case gets the same cluster as with partial_fit_features.
+        """
+        centroids = self.scaler.mean_ + self.kmeans.cluster_centers_ * self.scaler.scale_
+        weights = 1 / self.scaler.scale_ ** 2
+
+        X = np.where(np.isnan(X), self.scaler.mean_, X)
+        differences = X[:, None, :] - centroids[None, :, :]
+        distances = (differences ** 2 * weights).sum(axis=2)
+        return np.argmin(distances, axis=1)
+
     def classify_new_case(self, new_case):
         """Classify a new case into a cluster."""
-        # Encode categorical features
-        preferred_author_encoded = self.label_encoder_author.transform([new_case['preferred_author_name']])[0]
-        preferred_theme_encoded = self.label_encoder_theme.transform([new_case['preferred_main_theme']])[0]
-
-        # Create DataFrame for the new case
-        df_new = pd.DataFrame([{
-            'num_people': new_case['num_people'],
-            'preferred_author_name_encoded': preferred_author_encoded,
-            'preferred_year': new_case['preferred_year'],
-            'guided_visit': new_case['guided_visit'],
-            'minors': new_case['minors'],
-            'num_experts': new_case['num_experts'],
-            'past_museum_visits': new_case['past_museum_visits'],
-            'preferred_main_theme_encoded': preferred_theme_encoded
-        }])
-        df_new = df_new[self.feature_names]
-        X_scaled_new = self.scaler.transform(df_new)
-        return int(self.kmeans.predict(X_scaled_new)[0])
-    
+        return self.classify_new_cases([new_case])[0]
+
+    def encode_new_cases(self, new_cases):
+        """Encode and scale several new cases with the fitted encoders and scaler (unseen categories are set to their mean)."""
+        return self.scale_features(self.features_array(new_cases))
+
+    def scale_features(self, X):
+        """Scale an unscaled feature matrix with the fitted scaler (unknown features are set to their mean)."""
+        return np.nan_to_num((X - self.scaler.mean_) / self.scaler.scale_)
+
+    def classify_new_cases(self, new_cases):
+        """Classify several new cases into clusters with a single nearest-centroid assignment."""
+        if not new_cases:
+            return []
+
+        return [int(label) for label in self.classify_features(self.features_array(new_cases))]
+
+    def start_incremental(self, X_scaled=None):
+        """
+        Switch to incremental mode: the fitted KMeans model is replaced by a MiniBatchKMeans model
+        initialized with its centroids, which is then updated with partial_fit_cases instead of re-clustering.
+        The current inertia and cluster sizes are kept as the reference of the drift metrics.
+        """
+        if self.kmeans is None:
+            raise ValueError("K-Means model is not trained yet.")
+        if X_scaled is None:
+            if self.data is None:
+                raise ValueError("No data available. Fetch data first.")
+            X_scaled = self.scaler.transform(self.data)
+
+        centroids = self.kmeans.cluster_centers_
+        self.kmeans = MiniBatchKMeans(n_clusters=len(centroids), init=centroids, n_init=1, random_state=42)
+        self.kmeans.partial_fit(X_scaled)
+        self.incremental = True
+
+        labels = self.kmeans.predict(X_scaled)
+        self.cluster_sizes = np.bincount(labels, minlength=len(centroids))
+        self.reference_inertia = self.mean_inertia(X_scaled, labels)
+        self.reference_size_skew = self.size_skew(self.cluster_sizes)
+        self.new_cases_inertia = 0.0
+        self.new_cases_count = 0
+
+    def mean_inertia(self, X_scaled, labels):
+        """Mean squared distance of the cases to the centroid of their cluster."""
+        return float(np.mean(np.sum((X_scaled - self.kmeans.cluster_centers_[labels]) ** 2, axis=1)))
+
+    def size_skew(self, cluster_sizes):
+        """Size of the largest cluster relative to the mean cluster size."""
+        return float(cluster_sizes.max() / cluster_sizes.mean())
+
+    def partial_fit_cases(self, new_cases):
+        """
+        Assign new cases to clusters and update the centroids with them (incremental mode).
+        Returns the cluster of each case.
+        """
+        if not new_cases:
+            return []
+
+        return self.partial_fit_features(self.features_array(new_cases))
+
+    def partial_fit_features(self, X):
+        """Same as partial_fit_cases, for an unscaled feature matrix (see features_array)."""
+        if not self.incremental:
+            raise ValueError("Incremental mode is not started. Call start_incremental first.")
+        if len(X) == 0:
+            return []
+
+        X_scaled_new = self.scale_features(X)
+
+        # The drift is measured with the centroids the cases were assigned with
+        labels = self.kmeans.predict(X_scaled_new)
+        self.new_cases_inertia += self.mean_inertia(X_scaled_new, labels) * len(labels)
+        self.new_cases_count += len(labels)
+
+        self.kmeans.partial_fit(X_scaled_new)
+        labels = self.kmeans.predict(X_scaled_new)
+        self.cluster_sizes += np.bincount(labels, minlength=len(self.cluster_sizes))
+
+        return [int(label) for label in labels]
+
+    def drift(self):
+        """
+        Drift metrics of the incremental model since start_incremental:
+        relative change of the mean inertia of the new cases and relative change of the cluster size skew.
+        """
+        if not self.incremental:
+            raise ValueError("Incremental mode is not started. Call start_incremental first.")
+
+        inertia_change = 0.0
+        if self.new_cases_count > 0 and self.reference_inertia > 0:
+            inertia_change = (self.new_cases_inertia / self.new_cases_count) / self.reference_inertia - 1
+
+        return {
+            'inertia_change': inertia_change,
+            'size_skew_change': self.size_skew(self.cluster_sizes) / self.reference_size_skew - 1,
+            'new_cases': self.new_cases_count
+        }
+
+    def needs_reclustering(self):
+        """Whether the drift of the incremental model crosses a threshold and a full k-sweep is needed."""
+        drift = self.drift()
+        if drift['new_cases'] < self.min_drift_samples:
+            return False
+        return drift['inertia_change'] > self.inertia_drift_threshold or drift['size_skew_change'] > self.size_skew_drift_threshold
+
     def get_cases_in_cluster(self, cluster_id):
         """
         Retrieve and display all train_cases belonging to a specific cluster.
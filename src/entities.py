@@ -1,5 +1,6 @@
 from typing import List, Dict, Optional
 from dataclasses import dataclass, field
+import numpy as np
 
 
 @dataclass
@@ -1227,30 +1228,95 @@ class SpecificSolution:
     total_days: int = 1
     daily_minutes: int = 480  # Default 8 hours
     day_assignments: Dict[int, List[Artwork]] = field(default_factory=dict)
+    day_routes: Dict[int, List[int]] = field(default_factory=dict)  # Room ids walked each day
     visited_artworks_count: int = 0
 
     def distribute_artworks(self):
-        """Assigns the artworks obtained in AbstractSolution to several days, considering daily_minutes."""
+        """
+        Plans the visit over several days on the museum graph (see museum.py), considering daily_minutes.
+
+        1. The rooms of the matched artworks are ordered along a single walk, so that consecutive rooms are close.
+        2. The walk is split into total_days consecutive segments of similar time (artworks and walking), i.e. every
+           day gets a group of nearby rooms.
+        3. Every day keeps the artworks of its segment with the highest match that fit in daily_minutes, walking
+           included (see route_optimizer), and the spare time of each day is then offered to the left-out artworks.
+        4. The room path of every day is planned with the cached shortest paths, avoiding the stairs with reduced mobility.
+
+        The walking times are the ones of the current museum graph (see museum.current_museum).
+        """
+        # Imported here because museum imports ontology.art, which imports this module
+        import museum as museum_routes
+        from route_optimizer import optimize_route
+
+        self.day_assignments = {}
+        self.day_routes = {}
+
         # Sort by match_type in descending order, similar to CLIPS
         ordered = sorted(self.related_to_AbstractSolution.matches, key=lambda x: x.match_type, reverse=True)
 
-        # Initialize time per day
-        day_time = {d: 0 for d in range(1, self.total_days+1)}
+        distances = museum_routes.route_distances(self.reduced_mobility)
+        graph = distances.graph
+        ordered = [m for m in ordered if m.artwork.artwork_id in graph.artwork_rooms]
 
+        # Distances between the key rooms (the entry, key room 0, and the rooms of the matched artworks)
+        key_rooms = list(dict.fromkeys([distances.entry] + [graph.room_index[graph.artwork_rooms[m.artwork.artwork_id]] for m in ordered]))
+        key_index = {room: i for i, room in enumerate(key_rooms)}
+        D = distances.between(key_rooms)
+        end_costs = distances.to_exit[key_rooms]
+        entry = 0
+
+        room_of = {m.artwork.artwork_id: key_index[graph.room_index[graph.artwork_rooms[m.artwork.artwork_id]]] for m in ordered}
+        ordered = [m for m in ordered if np.isfinite(D[entry, room_of[m.artwork.artwork_id]]) and np.isfinite(end_costs[room_of[m.artwork.artwork_id]])]
+
+        # 1. Order the rooms along a single walk
+        rooms = list(dict.fromkeys(room_of[m.artwork.artwork_id] for m in ordered))
+        order = museum_routes.visit_order(D[entry, rooms], D[np.ix_(rooms, rooms)], end_costs[rooms]) if rooms else []
+        if sorted(order) == list(range(len(rooms))):
+            rooms = [rooms[i] for i in order]
+        else:
+            # No single walk goes through all the rooms (directed edges), every day starts again from the entry
+            rooms = sorted(rooms, key=lambda room: (D[entry, room], room))
+
+        # 2. Split the walk into segments of similar time
+        room_times = {room: 0.0 for room in rooms}
         for m in ordered:
-            assigned = False
-            for d in range(1, self.total_days+1):
-                if day_time[d] + m.artwork_time <= self.daily_minutes:
-                    day_time[d] += m.artwork_time
-                    if d not in self.day_assignments:
-                        self.day_assignments[d] = []
-                    self.day_assignments[d].append(m.artwork)
-                    assigned = True
-                    break
-            if not assigned:
-                # Not enough time in available days
-                # Depending on the logic, you could skip or try to adjust
-                pass
+            room_times[room_of[m.artwork.artwork_id]] += m.artwork_time
+        stops = [entry] + rooms
+        step_times = [(D[a, b] if np.isfinite(D[a, b]) else D[entry, b]) + room_times[b] for a, b in zip(stops, stops[1:])]
+        day_target = sum(step_times) / self.total_days
+
+        day_of_room = {}
+        elapsed = 0.0
+        for room, step_time in zip(rooms, step_times):
+            day_of_room[room] = min(int((elapsed + step_time / 2) // day_target) + 1, self.total_days) if day_target > 0 else 1
+            elapsed += step_time
+
+        # 3. Keep the best artworks of each segment that fit in a day, then fill the spare time with the left-out ones
+        def plan_day(candidates: List[Match]) -> List[Match]:
+            route = optimize_route(
+                [m.artwork.artwork_id for m in candidates], [m.match_type for m in candidates], self.daily_minutes,
+                only_elevators=self.reduced_mobility, times=[m.artwork_time for m in candidates]
+            )
+            by_id = {m.artwork.artwork_id: m for m in candidates}
+            return [by_id[artwork_id] for artwork_id in route.artworks]
+
+        day_matches = {}
+        for d in range(1, self.total_days+1):
+            day_matches[d] = plan_day([m for m in ordered if day_of_room[room_of[m.artwork.artwork_id]] == d])
+
+        for d in range(1, self.total_days+1):
+            assigned = {m.artwork.artwork_id for matches in day_matches.values() for m in matches}
+            left_out = [m for m in ordered if m.artwork.artwork_id not in assigned]
+            if not left_out:
+                break
+            day_matches[d] = plan_day(sorted(day_matches[d] + left_out, key=lambda x: x.match_type, reverse=True))
+
+        # 4. Room path of every day
+        for d, matches in day_matches.items():
+            if matches:
+                self.day_assignments[d] = [m.artwork for m in matches]
+                self.day_routes[d] = museum_routes.plan_route([m.artwork.artwork_id for m in matches], only_elevators=self.reduced_mobility)
+
         self.visited_artworks_count = sum(len(arts) for arts in self.day_assignments.values())
 
     def find_entry_room(self, museum: Museum) -> Optional[Room]:
@@ -1266,42 +1332,16 @@ class SpecificSolution:
         return None
 
     def find_route_for_day(self, day: int, museum: Museum) -> List[Room]:
-        """Finds a simplified route: start at an entry room, visit the rooms of the artworks, and exit.
-        A pathfinding algorithm (BFS, DFS, A*) could be implemented here, taking reduced mobility into account.
-        For simplicity, we will do a trivial approximation.
-
-        NOTE: This is a simplified implementation as an example.
         """
-        entry = self.find_entry_room(museum)
-        exit_room = self.find_exit_room(museum)
-        if not entry or not exit_room:
+        Returns the rooms of museum walked on a day, from the entry to the exit, as planned by distribute_artworks on
+        the current museum graph of museum.py (the stairs are avoided with reduced mobility).
+        Returns [] if a room of the route is not a room of museum (the route was planned on another museum).
+        """
+        rooms_by_id = {r.room_id: r for r in museum.rooms + museum.auxiliary_rooms}
+        route = self.day_routes.get(day, [])
+        if any(room_id not in rooms_by_id for room_id in route):
             return []
-
-        # Target rooms: rooms where the artworks for that day are located
-        target_rooms_ids = set()
-        for art in self.day_assignments.get(day, []):
-            # art.artwork_in_room must be the name of the room; we will need to get the room instance
-            room_obj = next((r for r in museum.rooms if r.room_name == art.artwork_in_room), None)
-            if room_obj:
-                target_rooms_ids.add(room_obj.room_id)
-
-        # Assume a simple path: entry -> each target room -> exit
-        # In a real case, a pathfinding algorithm would be implemented.
-        # Here, for simplicity, we return a fictitious list assuming direct connection.
-        path = [entry]
-        for rid in target_rooms_ids:
-            r = next((ro for ro in museum.rooms if ro.room_id == rid), None)
-            if r:
-                # If there is reduced mobility, avoid rooms with stairs
-                # Here, we would need to check the path. For simplicity,
-                # we assume the path is direct.
-                if self.reduced_mobility and r.is_stairs:
-                    # Find an alternative... (Omitted for simplicity)
-                    pass
-                path.append(r)
-
-        path.append(exit_room)
-        return path
+        return [rooms_by_id[room_id] for room_id in route]
 
     def find_all_routes(self, museum: Museum) -> Dict[int, List[Room]]:
         """Generates the routes for each day and returns them in a dictionary."""
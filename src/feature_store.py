@@ -0,0 +1,155 @@
+import copy
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from entities import AbstractProblem, SpecificProblem
+from authors import authors
+from ontology.themes import theme_instances
+from ontology.periods import periods
+
+# Authors offered to the abstract problems (the first 50 of the dictionary)
+AVAILABLE_AUTHORS = list(authors.values())[:50]
+
+@dataclass
+class GroupFeatures:
+	"""
+	Derived features of a group, computed once from its `clean_response`.
+	"""
+	clean_response: tuple
+	specific_problem: SpecificProblem
+	abstract_problem: AbstractProblem
+	cluster_features: dict
+	encoded_features: np.ndarray = None  # Row of Clustering.features_array
+	encoded_with: dict = None  # Encoder lookup (Clustering.author_codes) that produced encoded_features
+
+class FeatureStore:
+	"""
+	In-memory store of the derived features of the groups, keyed by group_id.
+
+	Building an AbstractProblem scans the periods and looks up the author, themes and time coefficient of the group, and
+	classifying it encodes its clustering features. The store keeps the results of both, so returning visitors and
+	evaluation rows skip the derivation. An entry is derived again if the group answers differently, and its encoded
+	features are recomputed when the encoders of the clustering system change (new clustering or loaded model).
+	"""
+	def __init__(self, max_groups: int | None = 10000):
+		"""
+		Args:
+			max_groups (int): The number of groups kept, the least recently used ones are evicted first (None for no limit).
+		"""
+		self.max_groups = max_groups
+		self.groups: OrderedDict[int, GroupFeatures] = OrderedDict()
+		self.lock = threading.RLock()  # The store is shared by the request threads
+
+	def __len__(self) -> int:
+		return len(self.groups)
+
+	def get(self, clean_response: list) -> GroupFeatures:
+		"""
+		Returns the features of a group, deriving and storing them if the group is unknown or answered differently.
+		"""
+		group_id = int(clean_response[0])
+		key = tuple(clean_response)
+
+		with self.lock:
+			features = self.groups.get(group_id)
+			if features is None or features.clean_response != key:
+				features = self.derive(clean_response)
+				self.groups[group_id] = features
+
+			self.groups.move_to_end(group_id)
+			if self.max_groups is not None and len(self.groups) > self.max_groups:
+				self.groups.popitem(last=False)
+
+			return features
+
+	def put(self, clean_response: list) -> GroupFeatures:
+		"""
+		Stores the features of a group (at retain time), replacing the previous ones.
+		"""
+		with self.lock:
+			self.groups.pop(int(clean_response[0]), None)
+			return self.get(clean_response)
+
+	def invalidate(self, group_id: int | None = None) -> None:
+		"""
+		Forgets the features of a group, or of every group if group_id is None.
+		"""
+		with self.lock:
+			if group_id is None:
+				self.groups.clear()
+			else:
+				self.groups.pop(group_id, None)
+
+	def problems(self, clean_response: list) -> Tuple[SpecificProblem, AbstractProblem]:
+		"""
+		Returns the SpecificProblem and AbstractProblem of a group.
+		The AbstractProblem is a shallow copy, so that setting its cluster does not affect other requests of the group.
+		"""
+		features = self.get(clean_response)
+		return features.specific_problem, copy.copy(features.abstract_problem)
+
+	def encoded_features(self, clean_responses: List[list], clustering_system) -> np.ndarray:
+		"""
+		Returns the (unscaled) clustering feature matrix of several groups, see `Clustering.features_array`.
+		Only the groups not encoded yet with the current encoders of the clustering system are encoded.
+		"""
+		all_features = [self.get(clean_response) for clean_response in clean_responses]
+
+		if clustering_system.author_codes is None:
+			clustering_system.build_lookups()
+		encoders = clustering_system.author_codes
+
+		pending = [features for features in all_features if features.encoded_with is not encoders]
+		if pending:
+			X = clustering_system.features_array([features.cluster_features for features in pending])
+			for features, row in zip(pending, X):
+				features.encoded_features = row
+				features.encoded_with = encoders
+
+		return np.array([features.encoded_features for features in all_features]).reshape(len(all_features), -1)
+
+	@staticmethod
+	def derive(clean_response: list) -> GroupFeatures:
+		"""
+		Derives the features of a group from its `clean_response` data list.
+		"""
+		specific_problem = SpecificProblem(
+			group_id=int(clean_response[0]),
+			num_people=int(clean_response[1]),
+			favorite_author=clean_response[2],
+			favorite_period=int(clean_response[3]),
+			favorite_theme=clean_response[4],
+			guided_visit=bool(int(clean_response[5])),
+			minors=bool(int(clean_response[6])),
+			num_experts=int(clean_response[7]),
+			past_museum_visits=int(clean_response[8]),
+			group_description=clean_response[9]
+		)
+
+		abstract_problem = AbstractProblem(
+			specific_problem=specific_problem,
+			available_authors=AVAILABLE_AUTHORS,
+			available_themes=theme_instances,
+			available_periods=periods
+		)
+
+		cluster_features = {
+			'num_people': int(clean_response[1]),
+			'preferred_author_name': clean_response[2],
+			'preferred_year': int(clean_response[3]),
+			'preferred_main_theme': clean_response[4],
+			'guided_visit': int(clean_response[5]),
+			'minors': int(clean_response[6]),
+			'num_experts': int(clean_response[7]),
+			'past_museum_visits': int(clean_response[8])
+		}
+
+		return GroupFeatures(
+			clean_response=tuple(clean_response),
+			specific_problem=specific_problem,
+			abstract_problem=abstract_problem,
+			cluster_features=cluster_features
+		)
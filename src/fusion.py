@@ -0,0 +1,165 @@
+"""
+Rank fusion of the CF and CBR recommendations.
+
+Both recommendations are aligned to a fixed artwork catalog as dense arrays (NaN for the items a
+system did not return), so every strategy is a handful of vectorized operations over the catalog:
+
+- 'weighted': beta * cf_score + (1 - beta) * cbr_score (CombSUM).
+- 'rrf':      reciprocal-rank fusion, beta / (k + cf_rank) + (1 - beta) / (k + cbr_rank).
+- 'borda':    Borda count, every system gives n + 1 - rank points to each of the n items it ranked.
+
+An item missing from one of the systems gets no contribution from it, and items missing from both
+are left out of the fused recommendation.
+"""
+
+from typing import Dict, List
+import numpy as np
+
+STRATEGIES = ['weighted', 'rrf', 'borda']
+
+def weighted_fusion(cf_scores: np.ndarray, cbr_scores: np.ndarray, cf_ranks: np.ndarray, cbr_ranks: np.ndarray, beta: float, rrf_k: int) -> np.ndarray:
+    return beta * np.nan_to_num(cf_scores) + (1 - beta) * np.nan_to_num(cbr_scores)
+
+def reciprocal_rank_fusion(cf_scores: np.ndarray, cbr_scores: np.ndarray, cf_ranks: np.ndarray, cbr_ranks: np.ndarray, beta: float, rrf_k: int) -> np.ndarray:
+    # Ranks start at 1, missing items have an infinite rank
+    return beta / (rrf_k + np.nan_to_num(cf_ranks, nan=np.inf)) + (1 - beta) / (rrf_k + np.nan_to_num(cbr_ranks, nan=np.inf))
+
+def borda_fusion(cf_scores: np.ndarray, cbr_scores: np.ndarray, cf_ranks: np.ndarray, cbr_ranks: np.ndarray, beta: float, rrf_k: int) -> np.ndarray:
+    cf_points = np.nan_to_num(np.sum(~np.isnan(cf_ranks)) + 1 - cf_ranks)
+    cbr_points = np.nan_to_num(np.sum(~np.isnan(cbr_ranks)) + 1 - cbr_ranks)
+    return beta * cf_points + (1 - beta) * cbr_points
+
+FUSION_FUNCTIONS = {
+    'weighted': weighted_fusion,
+    'rrf': reciprocal_rank_fusion,
+    'borda': borda_fusion
+}
+
+def top_k_indices(scores: np.ndarray, k: int | None = None) -> np.ndarray:
+    """
+    Returns the indices of the k highest scores sorted by descending score (ties keep the index order).
+    Only the top k are fully sorted, the rest of the array is partitioned in linear time.
+
+    Parameters
+    ----------
+    scores : np.ndarray
+        Scores to rank.
+    k : int, optional
+        Number of indices to return. If None, all the indices are returned.
+    """
+    if k is None or k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.lexsort((top, -scores[top]))]
+
+class RankFusion:
+    """
+    This class fuses the CF and CBR recommendations of a group over an artwork catalog.
+    """
+    def __init__(self, catalog_ids: List[int], strategy: str = 'weighted', rrf_k: int = 60, top_k: int | None = None):
+        """
+        Initializes the fusion over a catalog.
+
+        Parameters
+        ----------
+        catalog_ids : List[int]
+            Identifiers of the artworks of the catalog. Items outside the catalog are added to it when they are first seen.
+        strategy : str
+            The default fusion strategy, one of STRATEGIES, default is 'weighted'.
+        rrf_k : int
+            Rank offset of the reciprocal-rank fusion, default is 60.
+        top_k : int, optional
+            Number of fused items returned. If None, all the items returned by any of the systems are.
+        """
+        assert strategy in STRATEGIES, f"Invalid strategy; use one of {STRATEGIES}"
+        assert rrf_k >= 0, "The RRF rank offset must be a non-negative value"
+
+        self.strategy = strategy
+        self.rrf_k = rrf_k
+        self.top_k = top_k
+
+        self.catalog_ids = np.array(catalog_ids, dtype=np.int64)
+        self.catalog_index: Dict[int, int] = {int(item_id): i for i, item_id in enumerate(self.catalog_ids)}
+
+    def __positions(self, items: List[int]) -> np.ndarray:
+        """
+        Returns the catalog position of each item, adding the unknown items to the catalog.
+        """
+        new_items = [item_id for item_id in dict.fromkeys(items) if item_id not in self.catalog_index]
+        if new_items:
+            for item_id in new_items:
+                self.catalog_index[int(item_id)] = len(self.catalog_index)
+            self.catalog_ids = np.append(self.catalog_ids, np.array(new_items, dtype=np.int64))
+
+        return np.array([self.catalog_index[item_id] for item_id in items], dtype=np.int64)
+
+    def align(self, items: List[int], scores: List[float]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Aligns a sorted recommendation to the catalog.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The score and the rank (starting at 1) of every catalog item, NaN for the items not recommended.
+        """
+        assert len(items) == len(scores), "Length of items and scores must match"
+
+        positions = self.__positions(items)
+        aligned_scores = np.full(len(self.catalog_ids), np.nan)
+        aligned_ranks = np.full(len(self.catalog_ids), np.nan)
+
+        if len(positions) > 0:
+            aligned_scores[positions] = scores
+            aligned_ranks[positions] = np.arange(1, len(positions) + 1)
+
+        return aligned_scores, aligned_ranks
+
+    def fuse(
+        self, cf_items: List[int], cf_scores: List[float], cbr_items: List[int], cbr_scores: List[float], beta: float,
+        strategy: str | None = None, top_k: int | None = None
+    ) -> tuple[List[int], List[float]]:
+        """
+        Fuses the CF and CBR recommendations of a group.
+
+        Parameters
+        ----------
+        cf_items, cf_scores : List[int], List[float]
+            CF recommendation, sorted by descending relevance.
+        cbr_items, cbr_scores : List[int], List[float]
+            CBR recommendation, sorted by descending relevance.
+        beta : float
+            Weight of the CF recommendation (the CBR one weighs 1 - beta).
+        strategy : str, optional
+            Fusion strategy. If None, the default strategy is used.
+        top_k : int, optional
+            Number of fused items returned. If None, the default top_k is used.
+
+        Returns
+        -------
+        tuple[List[int], List[float]]
+            Fused items sorted by descending fused score and their fused scores.
+        """
+        assert (strategy is None) or (strategy in STRATEGIES), f"Invalid strategy; use one of {STRATEGIES}"
+
+        if strategy is None:
+            strategy = self.strategy
+
+        if top_k is None:
+            top_k = self.top_k
+
+        # Add the unknown items of both sides to the catalog before aligning, so that both arrays have the same length
+        self.__positions(list(cf_items) + list(cbr_items))
+        cf_aligned_scores, cf_aligned_ranks = self.align(cf_items, cf_scores)
+        cbr_aligned_scores, cbr_aligned_ranks = self.align(cbr_items, cbr_scores)
+
+        fused = FUSION_FUNCTIONS[strategy](cf_aligned_scores, cbr_aligned_scores, cf_aligned_ranks, cbr_aligned_ranks, beta, self.rrf_k)
+
+        # Items returned by none of the systems are left out
+        recommended = np.flatnonzero(~np.isnan(cf_aligned_ranks) | ~np.isnan(cbr_aligned_ranks))
+        order = recommended[top_k_indices(fused[recommended], top_k)]
+
+        return [int(item_id) for item_id in self.catalog_ids[order]], [float(score) for score in fused[order]]
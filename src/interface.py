@@ -101,6 +101,7 @@ class Interface:
         self.llama = Llama()
         self.recommender = Recommender(db_path="data/database.db", clustering=True)
         self.db = sqlite3.connect("data/database.db", check_same_thread=False)
+        self.planned_visit = None  # Room occupancy added by the selected route, see room_occupancy
 
     def get_id(self):
         cursor = self.db.cursor()
@@ -0,0 +1,213 @@
+import os
+from typing import List
+import numpy as np
+
+class MatrixFactorization:
+    """
+    This class implements a matrix-factorization model of the ratings table, trained with
+    Alternating Least Squares (ALS) on the observed (group, item, rating) triplets.
+
+    Every group and every item is represented by a latent factor vector, and the predicted rating
+    of an item for a group is the global mean plus the dot product of both vectors. Scoring all
+    the items for a group is therefore a single matrix-vector product, independently of the
+    number of stored groups.
+
+    The factor matrices and their id maps are persisted as `.npy` files in `model_dir`.
+    """
+    FILES = ['group_factors', 'item_factors', 'group_ids', 'item_ids', 'global_mean']
+
+    def __init__(self, model_dir: str = 'models/mf', n_factors: int = 16, regularization: float = 0.1, n_iterations: int = 15, seed: int = 42):
+        """
+        Initializes an empty (not fitted) matrix-factorization model.
+
+        Parameters
+        ----------
+        model_dir : str
+            Directory where the factor matrices are stored, default is 'models/mf'.
+        n_factors : int
+            Number of latent factors of each group and item, default is 16.
+        regularization : float
+            L2 regularization weight, scaled by the number of ratings of each group or item, default is 0.1.
+        n_iterations : int
+            Number of ALS sweeps (groups then items) performed by `fit`, default is 15.
+        seed : int
+            Seed used to initialize the factors, default is 42.
+        """
+        assert n_factors > 0, "The number of factors must be positive"
+        assert regularization >= 0, "Regularization must be a non-negative value"
+
+        self.model_dir = model_dir
+        self.n_factors = n_factors
+        self.regularization = regularization
+        self.n_iterations = n_iterations
+        self.seed = seed
+
+        self.group_factors = None
+        self.item_factors = None
+        self.group_ids = None
+        self.item_ids = None
+        self.global_mean = 0.0
+        self.group_index = {}
+        self.item_index = {}
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.item_factors is not None
+
+    def __build_indices(self) -> None:
+        self.group_index = {int(g): i for i, g in enumerate(self.group_ids)}
+        self.item_index = {int(it): i for i, it in enumerate(self.item_ids)}
+
+    def __solve(self, fixed_factors: np.ndarray, ratings: np.ndarray) -> np.ndarray:
+        """
+        Solves the regularized least squares problem of one group (or item) given the fixed
+        factors of the items (or groups) it is related to and the centered ratings.
+        """
+        A = fixed_factors.T @ fixed_factors + self.regularization * len(ratings) * np.eye(self.n_factors)
+        b = fixed_factors.T @ ratings
+        return np.linalg.solve(A, b)
+
+    def fit(self, group_ids: np.ndarray, item_ids: np.ndarray, ratings: np.ndarray) -> None:
+        """
+        Trains the model from scratch with ALS.
+
+        Parameters
+        ----------
+        group_ids : np.ndarray
+            Group identifier of each observed rating.
+        item_ids : np.ndarray
+            Item identifier of each observed rating.
+        ratings : np.ndarray
+            Observed ratings.
+        """
+        assert len(group_ids) == len(item_ids) == len(ratings), "Length of group_ids, item_ids and ratings must match"
+        assert len(ratings) > 0, "There are no ratings to train the model"
+
+        self.group_ids, group_rows = np.unique(np.asarray(group_ids, dtype=np.int64), return_inverse=True)
+        self.item_ids, item_cols = np.unique(np.asarray(item_ids, dtype=np.int64), return_inverse=True)
+        self.__build_indices()
+
+        ratings = np.asarray(ratings, dtype=np.float64)
+        self.global_mean = float(ratings.mean())
+        centered = ratings - self.global_mean
+
+        rng = np.random.default_rng(self.seed)
+        self.group_factors = rng.normal(scale=0.1, size=(len(self.group_ids), self.n_factors))
+        self.item_factors = rng.normal(scale=0.1, size=(len(self.item_ids), self.n_factors))
+
+        # Ratings grouped by row and by column, computed once for all the sweeps
+        by_group = np.argsort(group_rows, kind='stable')
+        group_splits = np.split(by_group, np.cumsum(np.bincount(group_rows, minlength=len(self.group_ids)))[:-1])
+        by_item = np.argsort(item_cols, kind='stable')
+        item_splits = np.split(by_item, np.cumsum(np.bincount(item_cols, minlength=len(self.item_ids)))[:-1])
+
+        for _ in range(self.n_iterations):
+            for g, idx in enumerate(group_splits):
+                self.group_factors[g] = self.__solve(self.item_factors[item_cols[idx]], centered[idx])
+            for i, idx in enumerate(item_splits):
+                self.item_factors[i] = self.__solve(self.group_factors[group_rows[idx]], centered[idx])
+
+    def fold_in(self, group_id: int, item_ids: List[int], ratings: List[float]) -> bool:
+        """
+        Computes (or recomputes) the factors of a single group from its ratings, keeping the item
+        factors fixed. This adds newly stored groups to the model without retraining it.
+
+        Parameters
+        ----------
+        group_id : int
+            Identifier of the group.
+        item_ids : List[int]
+            Items rated by the group. Items unknown to the model are ignored.
+        ratings : List[float]
+            Ratings of the group for each item in item_ids.
+
+        Returns
+        -------
+        bool
+            Whether the group factors could be computed (at least one known item was rated).
+        """
+        assert self.is_fitted, "The model must be fitted before folding in new groups"
+
+        known = [(self.item_index[i], r) for i, r in zip(item_ids, ratings) if i in self.item_index]
+        if not known:
+            return False
+
+        cols, values = zip(*known)
+        factors = self.__solve(self.item_factors[list(cols)], np.asarray(values, dtype=np.float64) - self.global_mean)
+
+        if group_id in self.group_index:
+            self.group_factors[self.group_index[group_id]] = factors
+        else:
+            self.group_index[group_id] = len(self.group_ids)
+            self.group_ids = np.append(self.group_ids, group_id)
+            self.group_factors = np.vstack([self.group_factors, factors])
+
+        return True
+
+    def score(self, group_id: int) -> np.ndarray | None:
+        """
+        Predicts the rating of every item of the model (in the order of `item_ids`) for a group.
+
+        Returns
+        -------
+        np.ndarray | None
+            Predicted ratings, or None if the group is not part of the model.
+        """
+        if not self.is_fitted or group_id not in self.group_index:
+            return None
+        return self.global_mean + self.item_factors @ self.group_factors[self.group_index[group_id]]
+
+    def save(self, groups_only: bool = False) -> None:
+        """
+        Saves the factor matrices and id maps to `model_dir`.
+
+        Parameters
+        ----------
+        groups_only : bool
+            Whether to only save the group arrays (the item arrays do not change when folding in groups).
+        """
+        assert self.is_fitted, "The model must be fitted before saving it"
+        os.makedirs(self.model_dir, exist_ok=True)
+
+        arrays = {
+            'group_factors': self.group_factors,
+            'group_ids': self.group_ids,
+        }
+        if not groups_only:
+            arrays['item_factors'] = self.item_factors
+            arrays['item_ids'] = self.item_ids
+            arrays['global_mean'] = np.array(self.global_mean)
+
+        for name, array in arrays.items():
+            np.save(os.path.join(self.model_dir, f'{name}.npy'), array)
+
+    def delete(self) -> None:
+        """
+        Deletes the saved factor matrices and id maps from `model_dir`, so that `load` does not find a stale model.
+        """
+        for name in self.FILES:
+            path = os.path.join(self.model_dir, f'{name}.npy')
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load(self) -> bool:
+        """
+        Loads the factor matrices and id maps from `model_dir`.
+
+        Returns
+        -------
+        bool
+            Whether a stored model was found and loaded.
+        """
+        paths = {name: os.path.join(self.model_dir, f'{name}.npy') for name in self.FILES}
+        if not all(os.path.exists(path) for path in paths.values()):
+            return False
+
+        self.group_factors = np.load(paths['group_factors'])
+        self.item_factors = np.load(paths['item_factors'])
+        self.group_ids = np.load(paths['group_ids'])
+        self.item_ids = np.load(paths['item_ids'])
+        self.global_mean = float(np.load(paths['global_mean']))
+        self.n_factors = self.item_factors.shape[1]
+        self.__build_indices()
+        return True
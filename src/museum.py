@@ -1,8 +1,13 @@
 from dataclasses import dataclass, field
 from typing import List, Dict
-from collections import deque
+from collections import OrderedDict
 from ontology.art import artworks
+from museum_graph import MuseumGraph
+import heapq
 import random
+import threading
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
 import networkx as nx
 import matplotlib.pyplot as plt
 
@@ -19,6 +24,7 @@ class Room:
     room_name: str
     adjacent_rooms: List['Room'] = field(default_factory=list)
     artworks_id_in_room: List[int] = field(default_factory=list)
+    floor: int = 0
 
 # --- Museum Creation ---
 
@@ -63,6 +69,12 @@ rooms["12"].adjacent_rooms = [rooms["2"], rooms["5"]]
 rooms["13"].adjacent_rooms = [rooms["3"], rooms["6"]]
 rooms["14"].adjacent_rooms = [rooms["6"], rooms["9"]]
 
+# Floors (the elevators and stairs are on the lower of the floors they connect, the rest is on floor 0)
+for key in ["4", "5", "6", "11", "14"]:
+    rooms[key].floor = 1
+for key in ["7", "8", "9"]:
+    rooms[key].floor = 2
+
 # --- Artworks ---
 # Assign artworks to rooms
 # Normal rooms (the ones that are not in the elevator or stairs)
@@ -76,59 +88,455 @@ for artwork in artworks.keys():  # Artwork ids
     random_room = random.choice(normal_rooms)
     random_room.artworks_id_in_room.append(artwork)
 
-@dataclass
-class Node:
-    room: Room
-    rooms_path: List[Room]
-
-def find_route(artworks_to_visit, only_elevators: bool = False):
-    needed_rooms = []
-    for artwork_id in artworks_to_visit:
-        room = next(room for room in rooms.values() if artwork_id in room.artworks_id_in_room)
-        if room not in needed_rooms:
-            needed_rooms.append(room)
-
-    entry_room = next(room for room in rooms.values() if room.is_entry)
+# --- Indexes ---
+# Built with the museum and kept up to date by assign_artwork; call museum_changed after editing the rooms directly
 
-    start_node = Node(room=entry_room, rooms_path=[entry_room])
+rooms_by_id: Dict[int, Room] = {}
+artwork_rooms: Dict[int, int] = {}  # Artwork id -> room id
 
-    queue = deque([start_node])
-
-    while queue:
-        current_node = queue.popleft()
-
-        if current_node.room.is_exit:
-            if all(room in current_node.rooms_path for room in needed_rooms):
-                return [room.room_id for room in current_node.rooms_path]
-
-        for adjacent_room in current_node.room.adjacent_rooms:
-            if only_elevators and adjacent_room.is_stairs:
-                continue
-            else:
-                new_node = Node(room=adjacent_room, rooms_path=current_node.rooms_path + [adjacent_room])
-                queue.append(new_node)
+def build_indexes():
+    """(Re)build the room id -> Room and artwork id -> room id indexes from the rooms."""
+    rooms_by_id.clear()
+    artwork_rooms.clear()
+    for room in rooms.values():
+        rooms_by_id[room.room_id] = room
+        for artwork_id in room.artworks_id_in_room:
+            artwork_rooms[artwork_id] = room.room_id
+
+def assign_artwork(artwork_id: int, room_id: int):
+    """Move an artwork to a room (or place it, if it is new), keeping the indexes consistent."""
+    old_room_id = artwork_rooms.get(artwork_id)
+    if old_room_id == room_id:
+        return
+    if old_room_id is not None:
+        rooms_by_id[old_room_id].artworks_id_in_room.remove(artwork_id)
+    rooms_by_id[room_id].artworks_id_in_room.append(artwork_id)
+    artwork_rooms[artwork_id] = room_id
+
+build_indexes()
+
+# --- Museum Graph ---
+# Routes are planned on a compact MuseumGraph (see museum_graph.py): the built-in museum above, or a museum layout
+# loaded from a file with museum_graph.load_museum and selected with use_museum
+
+# Minutes to walk between two adjacent rooms of the built-in museum
+ROOM_WALKING_TIME = 1.0
+
+_builtin_museum: MuseumGraph | None = None
+_loaded_museum: MuseumGraph | None = None
+
+def builtin_museum_graph() -> MuseumGraph:
+    """The built-in museum (rooms) as a MuseumGraph. Its artwork placement is the artwork_rooms index itself, so assign_artwork is seen by the planner."""
+    room_list = list(rooms.values())
+    edges = [(room.room_id, adjacent.room_id) for room in room_list for adjacent in room.adjacent_rooms]
+    return MuseumGraph.from_edges(
+        name=room_list[0].museum,
+        room_ids=[room.room_id for room in room_list],
+        room_names=[room.room_name for room in room_list],
+        floors=[room.floor for room in room_list],
+        is_entry=[room.is_entry for room in room_list],
+        is_exit=[room.is_exit for room in room_list],
+        is_stairs=[room.is_stairs for room in room_list],
+        is_elevator=[room.is_elevator for room in room_list],
+        edges_from=[source for source, _ in edges],
+        edges_to=[target for _, target in edges],
+        walking_times=[ROOM_WALKING_TIME] * len(edges),
+        directed=[True] * len(edges),
+        artwork_rooms=artwork_rooms
+    )
+
+def current_museum() -> MuseumGraph:
+    """The museum graph the routes are planned on: the loaded museum if any (see use_museum), else the built-in one."""
+    global _builtin_museum
+    if _loaded_museum is not None:
+        return _loaded_museum
+    if _builtin_museum is None:
+        _builtin_museum = builtin_museum_graph()
+    return _builtin_museum
+
+def use_museum(graph: MuseumGraph | None):
+    """Plan the routes on a loaded museum graph (see museum_graph.load_museum), or on the built-in museum if graph is None."""
+    global _loaded_museum
+    _loaded_museum = graph
+    clear_route_distances()
+
+def needed_rooms_of(artworks_to_visit, graph: MuseumGraph | None = None) -> List[int]:
+    """Positions in the museum graph of the rooms of the artworks to visit, in order of first appearance."""
+    graph = graph or current_museum()
+    return list(dict.fromkeys(graph.room_index[graph.artwork_rooms[artwork_id]] for artwork_id in artworks_to_visit))
 
-    if plot:
-            plot_route(route)
+def find_route(artworks_to_visit, only_elevators: bool = False):
+    """
+    Shortest walk (in walking time) from the entry to an exit going through the rooms of all the artworks to visit, as a list of room ids.
+    Returns an empty list if there is no such walk (e.g. a room can only be reached by stairs and only_elevators is True).
+
+    The search is a Dijkstra over (room, covered rooms) states on the CSR adjacency, where the covered rooms are a bitmask
+    over the needed rooms. It is exact but exponential in the number of needed rooms, see plan_route for large visits.
+    """
+    distances = route_distances(only_elevators)
+    graph = distances.graph
+    needed = needed_rooms_of(artworks_to_visit, graph)
+    entry = distances.entry
+
+    # Fail fast if a needed room or every exit is unreachable
+    from_entry = distances.rows([entry])[0]
+    if np.isinf(from_entry[needed]).any() or np.isinf(distances.to_exit[entry]):
+        return []
+
+    room_bits = [0] * graph.n_rooms
+    for bit, room in enumerate(needed):
+        room_bits[room] = 1 << bit
+    all_covered = (1 << len(needed)) - 1
+    is_exit = graph.is_exit.tolist()
+    indptr, indices, weights = distances.matrix.indptr.tolist(), distances.matrix.indices.tolist(), distances.matrix.data.tolist()
+
+    # A state (room, covered) is encoded as the integer covered * number of rooms + room
+    n_rooms = graph.n_rooms
+    start = room_bits[entry] * n_rooms + entry
+    best = {start: 0.0}
+    parents = {start: -1}
+    heap = [(0.0, start)]
+
+    while heap:
+        time, state = heapq.heappop(heap)
+        if time > best[state]:
+            continue
+        covered, room = divmod(state, n_rooms)
+
+        if covered == all_covered and is_exit[room]:
+            route = []
+            while state != -1:
+                route.append(int(graph.room_ids[state % n_rooms]))
+                state = parents[state]
+            return route[::-1]
+
+        for k in range(indptr[room], indptr[room + 1]):
+            adjacent = indices[k]
+            next_state = (covered | room_bits[adjacent]) * n_rooms + adjacent
+            next_time = time + weights[k]
+            if next_time < best.get(next_state, np.inf):
+                best[next_state] = next_time
+                parents[next_state] = state
+                heapq.heappush(heap, (next_time, next_state))
 
     return []
 
-def plot_route(route: List[int]):
+# --- Shortest Paths and Visit Order ---
+
+# Above this number of rooms to visit, the visit order is found with 2-opt instead of Held-Karp
+HELD_KARP_MAX_ROOMS = 10
+
+class RouteDistances:
+    """
+    Shortest paths (in walking minutes) of a museum graph, from Dijkstra over its CSR adjacency.
+
+    The distances from a room are computed the first time they are needed and kept (up to max_rows rooms), so a route
+    only pays for its entry and its needed rooms, not for all the pairs of a museum with thousands of rooms.
+    The distance of every room to its closest exit is computed upfront, with one Dijkstra from the exits on the reversed graph.
+    """
+    def __init__(self, graph: MuseumGraph, only_elevators: bool = False, max_rows: int = 4096):
+        self.graph = graph
+        self.matrix = graph.csr(only_elevators)
+        self.index = graph.room_index
+        self.entry = int(np.flatnonzero(graph.is_entry)[0])
+        self.exits = np.flatnonzero(graph.is_exit)
+        self.max_rows = max_rows
+        self._rows: OrderedDict[int, tuple] = OrderedDict()  # Room -> (distances, predecessors)
+        self.lock = threading.RLock()  # The rows are shared by the request threads
+
+        if len(self.exits):
+            self.to_exit, _, self.exit_of = dijkstra(self.matrix.T.tocsr(), indices=self.exits, min_only=True, return_predecessors=True)
+        else:
+            self.to_exit, self.exit_of = np.full(graph.n_rooms, np.inf), np.full(graph.n_rooms, -1)
+
+    def rows(self, sources: List[int]) -> np.ndarray:
+        """rows(sources)[i, j]: walking time from the room sources[i] to the room j (inf if unreachable)."""
+        sources = [int(source) for source in sources]
+        with self.lock:
+            missing = [source for source in dict.fromkeys(sources) if source not in self._rows]
+            if missing:
+                distances, predecessors = dijkstra(self.matrix, indices=missing, return_predecessors=True)
+                for source, row, predecessor_row in zip(missing, distances, predecessors):
+                    self._rows[source] = (row, predecessor_row)
+
+            result = np.array([self._rows[source][0] for source in sources]).reshape(len(sources), self.graph.n_rooms)
+            for source in sources:
+                self._rows.move_to_end(source)
+            while len(self._rows) > self.max_rows:
+                self._rows.popitem(last=False)
+            return result
+
+    def between(self, rooms: List[int]) -> np.ndarray:
+        """between(rooms)[i, j]: walking time from rooms[i] to rooms[j]."""
+        return self.rows(rooms)[:, rooms]
+
+    def path(self, source: int, target: int) -> List[int]:
+        """Room positions of the shortest path from source to target, both included."""
+        with self.lock:
+            self.rows([source])
+            predecessors = self._rows[source][1]
+        path = [target]
+        while path[-1] != source:
+            path.append(int(predecessors[path[-1]]))
+        return path[::-1]
+
+# Distances of the normal graph (False) and of the graph without stairs (True), see route_distances
+_route_distances: Dict[bool, RouteDistances] = {}
+
+# Incremented every time the museum graph changes, so that the caches built on it know when to rebuild
+graph_version = 0
+
+def route_distances(only_elevators: bool = False) -> RouteDistances:
+    """
+    Shortest paths of the current museum graph, kept until it changes.
+    Call museum_changed after changing the rooms or their connections.
+    """
+    if only_elevators not in _route_distances:
+        _route_distances[only_elevators] = RouteDistances(current_museum(), only_elevators)
+    return _route_distances[only_elevators]
+
+def clear_route_distances():
+    """Forget the cached shortest paths and routes, e.g. after the museum graph changed."""
+    global graph_version
+    graph_version += 1
+    _route_distances.clear()
+    route_cache.clear()
+
+def held_karp_order(start_costs: np.ndarray, costs: np.ndarray, end_costs: np.ndarray) -> List[int]:
+    """
+    Optimal order to visit k rooms (Held-Karp dynamic programming over subsets, O(2^k k^2)).
+
+    start_costs[j] is the cost from the start to room j, costs[i, j] from room i to room j and end_costs[i] from room i to the end.
+    Infinite costs are missing edges (e.g. with directed edges), [] is returned if no order walks all the rooms.
+    """
+    k = len(start_costs)
+    bits = 1 << np.arange(k)
+
+    # best[mask, j]: cost of the best walk from the start through the rooms of mask ending at room j
+    best = np.full((1 << k, k), np.inf)
+    parent = np.full((1 << k, k), -1, dtype=np.int64)
+    best[bits, np.arange(k)] = start_costs
+
+    for mask in range(1, 1 << k):
+        in_mask = (mask & bits) != 0
+        if in_mask.sum() < 2:
+            continue
+        # Arrive at j from the best room i of mask without j
+        previous = best[mask ^ bits] + costs.T
+        previous[:, ~in_mask] = np.inf
+        previous[~in_mask, :] = np.inf
+        parent[mask] = np.argmin(previous, axis=1)
+        best[mask] = previous[np.arange(k), parent[mask]]
+
+    full = (1 << k) - 1
+    if not np.isfinite(best[full] + end_costs).any():
+        return []
+    last = int(np.argmin(best[full] + end_costs))
+    order = []
+    mask = full
+    while last != -1:
+        order.append(last)
+        mask, last = mask ^ (1 << last), int(parent[mask, last])
+    return order[::-1]
+
+def two_opt_order(start_costs: np.ndarray, costs: np.ndarray, end_costs: np.ndarray, max_passes: int = 50) -> List[int]:
+    """
+    Order to visit k rooms found with a nearest-neighbour walk improved by 2-opt segment reversals, for large k.
+    The costs are the ones of held_karp_order. They can be asymmetric (directed edges): a reversed segment is walked
+    the other way, so the change of its own cost is added to the change of the two edges that are replaced.
+    [] is returned if the walk found still has a missing (infinite) edge.
+    """
+    k = len(start_costs)
+
+    # Missing edges cost more than any whole walk of existing edges, so that the reversals remove them
+    original_costs = (start_costs, costs, end_costs)
+    finite = np.concatenate([c[np.isfinite(c)].ravel() for c in original_costs])
+    missing = (finite.max() if len(finite) else 1.0) * (k + 2)
+    start_costs, costs, end_costs = (np.where(np.isfinite(c), c, missing) for c in original_costs)
+
+    order = [int(np.argmin(start_costs))]
+    remaining = set(range(k)) - set(order)
+    while remaining:
+        order.append(min(remaining, key=lambda j: (costs[order[-1], j], j)))
+        remaining.remove(order[-1])
+
+    # The walk is start -> order -> end, with the start and the end as virtual endpoints
+    def cost(i, j):
+        if i is None:
+            return start_costs[j]
+        if j is None:
+            return end_costs[i]
+        return costs[i, j]
+
+    for _ in range(max_passes):
+        improved = False
+        walk = [None] + order + [None]
+        for i in range(1, len(walk) - 1):
+            reversed_delta = 0.0  # Change of the cost of walk[i..j] when walked backwards, 0 with symmetric costs
+            for j in range(i + 1, len(walk) - 1):
+                reversed_delta += costs[walk[j], walk[j - 1]] - costs[walk[j - 1], walk[j]]
+                # Reverse walk[i..j]
+                delta = cost(walk[i - 1], walk[j]) + cost(walk[i], walk[j + 1]) - cost(walk[i - 1], walk[i]) - cost(walk[j], walk[j + 1]) + reversed_delta
+                if delta < -1e-9:
+                    walk[i:j + 1] = walk[i:j + 1][::-1]
+                    reversed_delta = -reversed_delta
+                    improved = True
+        order = walk[1:-1]
+        if not improved:
+            break
+
+    start_costs, costs, end_costs = original_costs
+    if not (np.isfinite(start_costs[order[0]]) and np.isfinite(costs[order[:-1], order[1:]]).all() and np.isfinite(end_costs[order[-1]])):
+        return []
+    return order
+
+def visit_order(start_costs: np.ndarray, costs: np.ndarray, end_costs: np.ndarray, held_karp_max_rooms: int = HELD_KARP_MAX_ROOMS) -> List[int]:
+    """
+    Order to visit k rooms: Held-Karp up to held_karp_max_rooms rooms, 2-opt above (see held_karp_order).
+    [] if no order walking all the rooms was found.
+    """
+    if len(start_costs) == 0:
+        return []
+    if len(start_costs) <= held_karp_max_rooms:
+        return held_karp_order(start_costs, costs, end_costs)
+    return two_opt_order(start_costs, costs, end_costs)
+
+# --- Route Cache ---
+
+class RouteCache:
+    """
+    LRU cache of the routes planned by plan_route, keyed by (needed room ids, only_elevators, entry id, exit ids, held_karp_max_rooms).
+
+    The keys are sets of rooms, not of artworks, so moving artworks between rooms (assign_artwork) does not invalidate
+    the cached routes, while changing the rooms or their connections does (museum_changed).
+    """
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.routes: OrderedDict[tuple, List[int]] = OrderedDict()
+        self.lock = threading.Lock()  # The cache is shared by the request threads
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: tuple) -> List[int] | None:
+        with self.lock:
+            route = self.routes.get(key)
+            if route is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.routes.move_to_end(key)
+            return list(route)
+
+    def put(self, key: tuple, route: List[int]):
+        with self.lock:
+            self.routes[key] = list(route)
+            self.routes.move_to_end(key)
+            if len(self.routes) > self.max_size:
+                self.routes.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            if self.routes:
+                self.invalidations += 1
+            self.routes.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Hits, misses, hit rate, size and number of invalidations of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.routes),
+            'max_size': self.max_size,
+            'invalidations': self.invalidations
+        }
+
+route_cache = RouteCache()
+
+def museum_changed():
+    """Rebuild the indexes and forget the cached shortest paths and routes, after editing the rooms, their connections or their artworks directly."""
+    global _builtin_museum
+    build_indexes()
+    _builtin_museum = None
+    clear_route_distances()
+
+def plan_route(artworks_to_visit, only_elevators: bool = False, held_karp_max_rooms: int = HELD_KARP_MAX_ROOMS) -> List[int]:
+    """
+    Same as find_route, but from the shortest paths between the needed rooms: they are ordered as a travelling-salesman
+    path from the entry to the closest exit (Held-Karp up to held_karp_max_rooms rooms, 2-opt above) and joined with
+    their shortest paths. The walk is optimal with Held-Karp and near-optimal with 2-opt.
+    The routes are cached by set of needed rooms (see route_cache).
+    """
+    distances = route_distances(only_elevators)
+    graph = distances.graph
+    needed = [i for i in needed_rooms_of(artworks_to_visit, graph) if i != distances.entry]
+
+    key = (
+        frozenset(int(graph.room_ids[i]) for i in needed), only_elevators,
+        int(graph.room_ids[distances.entry]), tuple(graph.room_ids[distances.exits].tolist()), held_karp_max_rooms
+    )
+    route = route_cache.get(key)
+    if route is None:
+        route = _plan_route(distances, needed, held_karp_max_rooms)
+        route_cache.put(key, route)
+    return route
+
+def _plan_route(distances: RouteDistances, needed: List[int], held_karp_max_rooms: int) -> List[int]:
+    """Route of plan_route, without the cache (needed are room positions, without the entry)."""
+    entry = distances.entry
+    stops = [entry] + needed
+    D = distances.between(stops)
+
+    if np.isinf(distances.to_exit[entry]) or np.isinf(D[0]).any():
+        return []
+
+    order = visit_order(D[0, 1:], D[1:, 1:], distances.to_exit[needed], held_karp_max_rooms)
+    if sorted(order) != list(range(len(needed))):
+        return []
+    order = [0] + [i + 1 for i in order]
+    if np.isinf(D[order[:-1], order[1:]]).any() or np.isinf(distances.to_exit[stops[order[-1]]]):
+        return []
+
+    stops = [stops[i] for i in order]
+    stops.append(int(distances.exit_of[stops[-1]]))
+
+    route = [entry]
+    for source, target in zip(stops, stops[1:]):
+        route.extend(distances.path(source, target)[1:])
+    return distances.graph.room_ids[route].tolist()
+
+def museum_nx_graph(graph: MuseumGraph | None = None) -> nx.Graph:
+    """A museum graph (the current one by default) as a networkx graph, with the room names, floors and types as node attributes."""
+    graph = graph or current_museum()
     G = nx.Graph()
 
     # Add all rooms as nodes
-    for room in rooms.values():
-        G.add_node(room.room_id, 
-                   room=room.room_name,
-                   is_entry=room.is_entry,
-                   is_exit=room.is_exit,
-                   is_stairs=room.is_stairs,
-                   is_elevator=room.is_elevator)
-
-    # Add edges based on adjacent rooms
-    for room in rooms.values():
-        for adjacent in room.adjacent_rooms:
-            G.add_edge(room.room_id, adjacent.room_id)
+    for i, room_id in enumerate(graph.room_ids.tolist()):
+        G.add_node(room_id,
+                   room=graph.room_names[i],
+                   floor=int(graph.floors[i]),
+                   is_entry=bool(graph.is_entry[i]),
+                   is_exit=bool(graph.is_exit[i]),
+                   is_stairs=bool(graph.is_stairs[i]),
+                   is_elevator=bool(graph.is_elevator[i]))
+
+    # Add edges with their walking time
+    sources, targets, weights = graph.edges()
+    G.add_weighted_edges_from(zip(sources.tolist(), targets.tolist(), weights.tolist()), weight='walking_time')
+
+    return G
+
+def draw_route(ax, route: List[int], G: nx.Graph = None, pos: Dict = None):
+    """
+    Draw the museum layout and a route on a matplotlib axes.
+    G and pos (node positions) can be given to reuse a graph and a layout, see route_renderer.
+    """
+    if G is None:
+        G = museum_nx_graph()
+    if pos is None:
+        pos = nx.spring_layout(G, seed=42)  # Positions for all nodes
 
     # Define node colors based on room types
     node_colors = []
@@ -148,36 +556,32 @@ def plot_route(route: List[int]):
     # Define edge colors based on connection types
     edge_colors = []
     for edge in G.edges():
-        room1 = rooms[str(edge[0])]
-        room2 = rooms[str(edge[1])]
-        if room1.is_elevator or room2.is_elevator:
+        room1 = G.nodes[edge[0]]
+        room2 = G.nodes[edge[1]]
+        if room1['is_elevator'] or room2['is_elevator']:
             edge_colors.append('blue')       # Elevator Connection
-        elif room1.is_stairs or room2.is_stairs:
+        elif room1['is_stairs'] or room2['is_stairs']:
             edge_colors.append('orange')     # Stairs Connection
         else:
             edge_colors.append('black')      # Normal Connection
 
-    pos = nx.spring_layout(G, seed=42)  # Positions for all nodes
-
-    plt.figure(figsize=(14, 10))
-    
     # Draw nodes
-    nx.draw_networkx_nodes(G, pos, node_color=node_colors, node_size=800, alpha=0.9)
+    nx.draw_networkx_nodes(G, pos, ax=ax, node_color=node_colors, node_size=800, alpha=0.9)
 
     # Draw edges
-    nx.draw_networkx_edges(G, pos, edge_color=edge_colors, width=2)
+    nx.draw_networkx_edges(G, pos, ax=ax, edge_color=edge_colors, width=2)
 
     # Draw labels
-    labels = {room.room_id: room.room_name for room in rooms.values()}
-    nx.draw_networkx_labels(G, pos, labels, font_size=10, font_weight='bold')
+    labels = {room_id: room['room'] for room_id, room in G.nodes(data=True)}
+    nx.draw_networkx_labels(G, pos, labels, ax=ax, font_size=10, font_weight='bold')
 
     # Highlight the route
     if route:
         route_edges = list(zip(route, route[1:]))
-        nx.draw_networkx_edges(G, pos, edgelist=route_edges, edge_color='magenta', width=4)  # Changed to magenta
+        nx.draw_networkx_edges(G, pos, ax=ax, edgelist=route_edges, edge_color='magenta', width=4)  # Changed to magenta
 
         # Highlight the nodes in the route
-        nx.draw_networkx_nodes(G, pos, nodelist=route, node_color='yellow', node_size=1000, alpha=0.7)
+        nx.draw_networkx_nodes(G, pos, ax=ax, nodelist=route, node_color='yellow', node_size=1000, alpha=0.7)
 
     # Create custom legends
     from matplotlib.lines import Line2D
@@ -197,10 +601,14 @@ def plot_route(route: List[int]):
     ]
 
     # Position the legend outside the plot area
-    plt.legend(handles=legend_elements, loc='upper left', bbox_to_anchor=(1, 1), fontsize='medium')
+    ax.legend(handles=legend_elements, loc='upper left', bbox_to_anchor=(1, 1), fontsize='medium')
+
+    ax.set_title("Museum Layout and Route Visualization", fontsize=16)
+    ax.axis('off')
 
-    plt.title("Museum Layout and Route Visualization", fontsize=16)
-    plt.axis('off')
+def plot_route(route: List[int]):
+    plt.figure(figsize=(14, 10))
+    draw_route(plt.gca(), route)
     plt.tight_layout(rect=[0, 0, 0.85, 1])
     plt.show()
 
@@ -208,11 +616,15 @@ def plot_route(route: List[int]):
 
 # --- Test ---
 def run_and_plot(artworks_to_visit, only_elevators=False):
-    route = find_route(artworks_to_visit=artworks_to_visit, only_elevators=only_elevators)
+    route = plan_route(artworks_to_visit=artworks_to_visit, only_elevators=only_elevators)
+    graph = current_museum()
+    room_artworks = {}
+    for artwork_id, room_id in graph.artwork_rooms.items():
+        room_artworks.setdefault(room_id, []).append(artwork_id)
+
     print("Route Path:")
     for room_id in route:
-        room_instance = next(room for room in rooms.values() if room.room_id == room_id)
-        print(f"Room {room_instance.room_id} ({room_instance.room_name}) --> {room_instance.artworks_id_in_room}")
+        print(f"Room {room_id} ({graph.room_names[graph.room_index[room_id]]}) --> {room_artworks.get(room_id, [])}")
 
     plot_route(route)
 
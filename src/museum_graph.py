@@ -0,0 +1,185 @@
+"""
+Compact museum graphs for route planning.
+
+A museum is stored as NumPy arrays indexed by room position (ids, names, floors and room types) and a CSR adjacency
+(indptr / indices / walking times in minutes), so that museums with thousands of rooms are planned on directly
+with scipy.sparse.csgraph instead of Python object graphs.
+
+Layouts are loaded from a JSON file:
+
+    {
+        "name": "Museum 1",
+        "rooms": [{"room_id": 1, "room_name": "Room 1", "floor": 0, "is_entry": true, "is_exit": false, "is_stairs": false, "is_elevator": false}, ...],
+        "edges": [{"from": 1, "to": 2, "walking_time": 1.5, "directed": false}, ...],
+        "artworks": [{"artwork_id": 5357, "room_id": 3}, ...]
+    }
+
+or from a directory of CSV files with the same columns: rooms.csv, edges.csv and artworks.csv (optional).
+Edges are bidirectional unless "directed" is true, and walk in 1 minute if "walking_time" is missing.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+ROOM_FLAGS = ['is_entry', 'is_exit', 'is_stairs', 'is_elevator']
+
+@dataclass
+class MuseumGraph:
+    name: str
+    room_ids: np.ndarray  # Room id of every room position
+    room_names: List[str]
+    floors: np.ndarray
+    is_entry: np.ndarray
+    is_exit: np.ndarray
+    is_stairs: np.ndarray
+    is_elevator: np.ndarray
+    indptr: np.ndarray  # CSR adjacency: the neighbours of room i are indices[indptr[i]:indptr[i + 1]]
+    indices: np.ndarray
+    weights: np.ndarray  # Walking time in minutes of every edge
+    artwork_rooms: Dict[int, int] = field(default_factory=dict)  # Artwork id -> room id
+    room_index: Dict[int, int] = field(init=False)  # Room id -> room position
+
+    def __post_init__(self):
+        self.room_index = {int(room_id): i for i, room_id in enumerate(self.room_ids)}
+        self._csr = {}
+
+    @property
+    def n_rooms(self) -> int:
+        return len(self.room_ids)
+
+    @classmethod
+    def from_edges(
+        cls, name: str, room_ids, room_names, floors, is_entry, is_exit, is_stairs, is_elevator,
+        edges_from, edges_to, walking_times=None, directed=None, artwork_rooms: Dict[int, int] = None
+    ) -> 'MuseumGraph':
+        """
+        Builds a museum graph from room and edge arrays (edges given by room id).
+        Duplicated edges keep their shortest walking time.
+        """
+        room_ids = np.asarray(room_ids, dtype=np.int64)
+        assert len(np.unique(room_ids)) == len(room_ids), "Room ids must be unique"
+        room_index = {int(room_id): i for i, room_id in enumerate(room_ids)}
+
+        sources = np.array([room_index[int(room_id)] for room_id in edges_from], dtype=np.int64)
+        targets = np.array([room_index[int(room_id)] for room_id in edges_to], dtype=np.int64)
+        weights = np.ones(len(sources)) if walking_times is None else np.asarray(walking_times, dtype=np.float64)
+        assert (weights > 0).all(), "Walking times must be positive"
+
+        # Bidirectional edges are stored in both directions
+        directed = np.zeros(len(sources), dtype=bool) if directed is None else np.asarray(directed, dtype=bool)
+        sources, targets, weights = (
+            np.concatenate([sources, targets[~directed]]), np.concatenate([targets, sources[~directed]]), np.concatenate([weights, weights[~directed]])
+        )
+
+        # Sort by (source, target, weight) and keep the shortest of the duplicated edges
+        order = np.lexsort((weights, targets, sources))
+        sources, targets, weights = sources[order], targets[order], weights[order]
+        keep = np.ones(len(sources), dtype=bool)
+        keep[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        sources, targets, weights = sources[keep], targets[keep], weights[keep]
+
+        indptr = np.zeros(len(room_ids) + 1, dtype=np.int64)
+        np.add.at(indptr, sources + 1, 1)
+
+        return cls(
+            name=name,
+            room_ids=room_ids,
+            room_names=[str(room_name) for room_name in room_names],
+            floors=np.asarray(floors, dtype=np.int64),
+            is_entry=np.asarray(is_entry, dtype=bool),
+            is_exit=np.asarray(is_exit, dtype=bool),
+            is_stairs=np.asarray(is_stairs, dtype=bool),
+            is_elevator=np.asarray(is_elevator, dtype=bool),
+            indptr=np.cumsum(indptr),
+            indices=targets.astype(np.int32),
+            weights=weights,
+            artwork_rooms={} if artwork_rooms is None else artwork_rooms
+        )
+
+    def csr(self, only_elevators: bool = False) -> csr_matrix:
+        """Adjacency matrix weighted by walking time. With only_elevators, the edges into stairs are left out."""
+        if only_elevators not in self._csr:
+            matrix = csr_matrix((self.weights, self.indices, self.indptr), shape=(self.n_rooms, self.n_rooms))
+            if only_elevators:
+                matrix = matrix.tocoo()
+                keep = ~self.is_stairs[matrix.col]
+                matrix = csr_matrix((matrix.data[keep], (matrix.row[keep], matrix.col[keep])), shape=matrix.shape)
+            self._csr[only_elevators] = matrix
+        return self._csr[only_elevators]
+
+    def neighbours(self, room: int) -> np.ndarray:
+        """Positions of the rooms adjacent to the room at a position."""
+        return self.indices[self.indptr[room]:self.indptr[room + 1]]
+
+    def edges(self):
+        """(source id, target id, walking time) of every stored (directed) edge."""
+        sources = np.repeat(np.arange(self.n_rooms), np.diff(self.indptr))
+        return self.room_ids[sources], self.room_ids[self.indices], self.weights
+
+def load_museum(path: str) -> MuseumGraph:
+    """
+    Loads a museum layout from a JSON file or from a directory with rooms.csv, edges.csv and artworks.csv (see the module docstring).
+    """
+    if os.path.isdir(path):
+        rooms = pd.read_csv(os.path.join(path, 'rooms.csv'))
+        edges = pd.read_csv(os.path.join(path, 'edges.csv'))
+        artworks_path = os.path.join(path, 'artworks.csv')
+        placements = pd.read_csv(artworks_path) if os.path.exists(artworks_path) else pd.DataFrame(columns=['artwork_id', 'room_id'])
+        name = os.path.basename(os.path.normpath(path))
+    else:
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        rooms = pd.DataFrame(data['rooms'])
+        edges = pd.DataFrame(data.get('edges', []), columns=None if data.get('edges') else ['from', 'to'])
+        placements = pd.DataFrame(data.get('artworks', []), columns=None if data.get('artworks') else ['artwork_id', 'room_id'])
+        name = data.get('name', os.path.splitext(os.path.basename(path))[0])
+
+    assert 'room_id' in rooms, "The rooms need a room_id"
+    assert {'from', 'to'} <= set(edges.columns), "The edges need 'from' and 'to' room ids"
+
+    flags = {flag: rooms[flag].fillna(False).astype(bool).to_numpy() if flag in rooms else np.zeros(len(rooms), dtype=bool) for flag in ROOM_FLAGS}
+    graph = MuseumGraph.from_edges(
+        name=name,
+        room_ids=rooms['room_id'].to_numpy(),
+        room_names=rooms['room_name'].tolist() if 'room_name' in rooms else [f"Room {room_id}" for room_id in rooms['room_id']],
+        floors=rooms['floor'].fillna(0).to_numpy() if 'floor' in rooms else np.zeros(len(rooms)),
+        edges_from=edges['from'].to_numpy(),
+        edges_to=edges['to'].to_numpy(),
+        walking_times=edges['walking_time'].fillna(1.0).to_numpy() if 'walking_time' in edges else None,
+        directed=edges['directed'].fillna(False).astype(bool).to_numpy() if 'directed' in edges else None,
+        artwork_rooms={int(artwork_id): int(room_id) for artwork_id, room_id in zip(placements['artwork_id'], placements['room_id'])},
+        **flags
+    )
+
+    unknown_rooms = set(graph.artwork_rooms.values()) - set(graph.room_index)
+    assert not unknown_rooms, f"Artworks placed in unknown rooms: {sorted(unknown_rooms)[:10]}"
+    assert graph.is_entry.any(), "The museum needs an entry"
+    assert graph.is_exit.any(), "The museum needs an exit"
+    return graph
+
+def save_museum(graph: MuseumGraph, path: str):
+    """Saves a museum layout as a JSON file readable by load_museum (every edge is stored as directed)."""
+    sources, targets, weights = graph.edges()
+    data = {
+        'name': graph.name,
+        'rooms': [
+            {
+                'room_id': int(graph.room_ids[i]), 'room_name': graph.room_names[i], 'floor': int(graph.floors[i]),
+                **{flag: bool(getattr(graph, flag)[i]) for flag in ROOM_FLAGS}
+            }
+            for i in range(graph.n_rooms)
+        ],
+        'edges': [
+            {'from': int(source), 'to': int(target), 'walking_time': float(weight), 'directed': True}
+            for source, target, weight in zip(sources, targets, weights)
+        ],
+        'artworks': [{'artwork_id': int(artwork_id), 'room_id': int(room_id)} for artwork_id, room_id in graph.artwork_rooms.items()]
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=1)
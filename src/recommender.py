@@ -1,18 +1,23 @@
 from cbr import CBR
+from cbr_shards import CBRShardRouter
 from cf import CF
 import sqlite3
 import json
 import os
 import numpy as np
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib.pyplot as plt
 
-from entities import AbstractProblem, SpecificProblem
-from authors import authors
+from entities import AbstractProblem
 from ontology.themes import theme_instances
 from ontology.periods import periods
 from db_partitions_handler import DBPartitionsHandler
 from clustering import Clustering
+from feature_store import FeatureStore, AVAILABLE_AUTHORS
+from fusion import RankFusion
+from ontology.art import artworks
 
 import pickle as pkl
 
@@ -27,13 +32,26 @@ class Recommender:
 		cf_gamma: float = 1,
 		cf_decay_factor: float = 1,
 		cf_method: str = 'cosine',
+		cf_workers: int | None = None,
+		cf_snapshot_dir: str | None = None,
+		cf_half_life: float | None = None,
+		cf_timeout: float | None = None,
 		beta: float = 0.5,
+		fusion_strategy: str = 'weighted',
+		fusion_top_k: int | None = None,
 		cbr_alpha: float = 0.6,
 		cbr_beta: float = 0.3,
 		cbr_gamma: float = 0.1,
 		cbr_top_k: int = 3,
+		cbr_timeout: float | None = None,
+		cbr_shards: int | None = None,
 		ratings_range: list = [0, 5],
-		clustering: bool = True
+		clustering: bool = True,
+		incremental_clustering: bool = True,
+		warm_start_clustering: bool = True,
+		background_clustering: bool = False,
+		clustering_model_path: str = './models/kmeans_model.joblib',
+		feature_store_size: int | None = 10000
 		):
 		"""
 		Initializes the Recommender system.
@@ -43,42 +61,87 @@ class Recommender:
 			- beta = 0 means only CBR recommendations are used.
 			- beta = 1 means only CF recommendations are used.
 			- 0 < beta < 1 means a combination of both recommendations is used.
+			fusion_strategy (str): The strategy used to combine both recommendations ('weighted', 'rrf' for reciprocal-rank fusion or 'borda').
+			fusion_top_k (int): The number of items of the hybrid recommendation (None to keep all the items recommended by any system).
 
 			cf_alpha (float): The alpha parameter for the CF system.
 			cf_gamma (float): The gamma parameter for the CF system.
 			cf_decay_factor (float): The decay factor for the CF system.
-			cf_method (str): The method to use for the CF system.
+			cf_method (str): The method to use for the CF system ('cosine', 'pearson' or 'als' for matrix factorization).
+			cf_workers (int): The number of worker processes used to score the CF recommendations (None to score them in this process).
+			cf_snapshot_dir (str): The directory of the memory-mapped ratings snapshots read by the CF system (None to query the database).
+			cf_half_life (float): The age in seconds at which a CF rating weighs half as much as a new one (None for no time decay).
+			cf_timeout (float): The seconds the CF recommendation may take before the hybrid recommendation falls back to CBR only (None to always wait).
 			cbr_alpha (float): The alpha parameter for the CBR system.
 			cbr_beta (float): The beta parameter for the CBR system.
 			cbr_gamma (float): The gamma parameter for the CBR system.
 			cbr_top_k (int): The number of top cases to consider in the CBR system.
+			cbr_timeout (float): The seconds the CBR recommendation may take before the hybrid recommendation falls back to CF only (None to always wait).
+			cbr_shards (int): The number of processes the case base is sharded across by cluster (None to run the CBR system in this process).
 			db_path (str): The path to the SQLite database.
 			main_table (str): The name of the main table in the database.
 			ratings_range (list): The range of ratings to use in the feedback.
 			clustering (bool): Whether to calculate the clusters or not.
+			incremental_clustering (bool): Whether to update the clusters incrementally with the stored cases, re-clustering only when they drift.
+			warm_start_clustering (bool): Whether to reuse the saved clustering model if it was fitted on the current train cases instead of clustering them again.
+			background_clustering (bool): Whether to serve with the outdated saved clustering model (if any) while the cases are clustered again in a background thread.
+			clustering_model_path (str): The path of the saved clustering model.
+			feature_store_size (int): The number of groups whose derived features are kept in memory (None for no limit).
 		"""
 		assert 0 <= beta <= 1, "Beta should be between 0 and 1."
 		
+		self.db_path = db_path
+		self.clustering_model_path = clustering_model_path
+		self.incremental_clustering = incremental_clustering
+
+		# CF and CBR run concurrently, and a branch that missed its deadline keeps running in the background, so every
+		# use of the CF system (its connection, cache and model) holds cf_lock and every use of the case base holds cbr_lock
+		self.cf_lock = threading.Lock()
+		self.cbr_lock = threading.Lock()
+
+		# Recommendations and stored cases go through the shard processes if the case base is sharded.
+		# The shards are forked before any thread is started (re-clustering, the executor) so that no lock is copied held
+		self.cbr_router = None
+		if cbr_shards is not None and cbr_shards > 1:
+			self.cbr_router = CBRShardRouter(db_path, cbr_shards, alpha=cbr_alpha, beta=cbr_beta, gamma=cbr_gamma, top_k=cbr_top_k)
+
+		self.clustering_system = None
 		if clustering:
-			self.clustering_system = self.clustering()
+			self.clustering_system = self.clustering(warm_start=warm_start_clustering, use_outdated_model=background_clustering)
+			# The clusters of the cases may have been saved after the shards loaded them
+			if self.cbr_router is not None:
+				self.cbr_router.reload()
+			if incremental_clustering and self.clustering_system.kmeans is not None:
+				self.clustering_system.start_incremental()
+
+			# Serve with the outdated model until the new one is ready
+			if background_clustering and not self.clustering_system.model_is_current:
+				threading.Thread(target=self.recluster, daemon=True).start()
 
 		self.cf_alpha = cf_alpha
 		self.cf_gamma = cf_gamma
 		self.cf_decay_factor = cf_decay_factor
 		self.cf_method = cf_method
+		self.cf_workers = cf_workers
+		self.cf_timeout = cf_timeout
 		self.cbr_alpha = cbr_alpha
 		self.cbr_beta = cbr_beta
 		self.cbr_gamma = cbr_gamma
 		self.cbr_top_k = cbr_top_k
+		self.cbr_timeout = cbr_timeout
 		self.main_table = main_table
-		self.db_path = db_path
 		self.beta = beta
 		self.conn = sqlite3.connect(db_path, check_same_thread=False)
 		self.cursor = self.conn.cursor()
 
 		self.ratings_range = ratings_range
 
+		# Derived problems and clustering features of the groups, filled at retain time or on first use
+		self.feature_store = FeatureStore(max_groups=feature_store_size)
+
 		self.cbr: CBR = CBR(db_path, alpha=cbr_alpha, beta=cbr_beta, gamma=cbr_gamma, top_k=cbr_top_k)
+
+		self.case_base: CBR | CBRShardRouter = self.cbr_router or self.cbr
 		
 		self.cf: CF = CF(
 			db_path=db_path, 
@@ -86,19 +149,44 @@ class Recommender:
 			default_gamma=cf_gamma, 
 			default_method=cf_method, 
 			default_decay_factor=cf_decay_factor, 
-			ratings_range=ratings_range
+			ratings_range=ratings_range,
+			snapshot_dir=cf_snapshot_dir,
+			default_half_life=cf_half_life
 		)
+
+		# CF and CBR run concurrently on this pool (see cf_lock and cbr_lock)
+		self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='recommender')
+
+		self.fusion = RankFusion(catalog_ids=list(artworks.keys()), strategy=fusion_strategy, top_k=fusion_top_k)
 		
 		self.dbph = DBPartitionsHandler(db_path=self.db_path, train_split=0.9875, main_table="cases", ratings_range=[0, 5], seed=42, overwrite=False)
 	
-	def clustering(self):
+	def clustering(self, warm_start: bool = False, use_outdated_model: bool = False) -> Clustering:
+		"""
+		Clusters the train cases and saves the clustering model.
 
+		Args:
+			warm_start (bool): Whether to load the saved model instead if it was fitted on the current train cases (same fingerprint).
+			use_outdated_model (bool): Whether to load the saved model even if it is outdated (see `Clustering.model_is_current`),
+			so that the cases are only clustered if there is no saved model.
+
+		Returns:
+			Clustering: The clustering system.
+		"""
 		# Initialize the clustering system
-		clustering_system = Clustering(db_path='./data/database.db', model_path='./models/kmeans_model.joblib')
+		clustering_system = Clustering(db_path=self.db_path, model_path=self.clustering_model_path)
 
 		try:
 			# Fetch data and perform clustering
 			raw_data = clustering_system.fetch_data_from_cases()
+
+			if warm_start and clustering_system.load_model_if_current():
+				return clustering_system
+
+			if use_outdated_model and os.path.exists(self.clustering_model_path):
+				clustering_system.load_model()
+				return clustering_system
+
 			X_scaled = clustering_system.encode_and_scale_features()
 			clustering_system.perform_clustering(X_scaled, min_k=10, max_k=30, minimum_examples_per_cluster=10)
 			clustering_system.save_clusters_to_cases()
@@ -112,6 +200,40 @@ class Recommender:
 			clustering_system.close_connection()
 		return clustering_system
 
+	def recluster_if_drifted(self) -> bool:
+		"""
+		Runs the full clustering again if the incremental clusters drifted past the thresholds of the clustering system.
+
+		Returns:
+			bool: Whether the cases were re-clustered.
+		"""
+		if not self.clustering_system.incremental or not self.clustering_system.needs_reclustering():
+			return False
+
+		print(f"Clusters drifted ({self.clustering_system.drift()}), re-clustering.")
+		self.recluster()
+		return True
+
+	def recluster(self) -> None:
+		"""
+		Clusters the train cases again and replaces the clustering system once it is ready.
+
+		The new model numbers its clusters differently, so the cases retained while it was fitted (labelled with the
+		previous model) are labelled again before the swap, with the case base locked so that no case is retained in between.
+		"""
+		clustering_system = self.clustering()
+		if self.incremental_clustering and clustering_system.kmeans is not None:
+			clustering_system.start_incremental()
+
+		with self.cbr_lock:
+			if clustering_system.kmeans is not None and clustering_system.ids is not None and len(clustering_system.ids) > 0:
+				clustering_system.label_cases_after(clustering_system.ids.max())
+			self.clustering_system = clustering_system
+
+			# The shards keep the cases of their clusters in memory
+			if getattr(self, 'cbr_router', None) is not None:
+				self.cbr_router.reload()
+
 
 	def retrieve_data(self, clean_response):
 		"""
@@ -125,9 +247,7 @@ class Recommender:
 		"""
 		Returns the authors from the CBR system.
 		"""
-		# Pick the first 50 in the dictionary
-		aut = list(authors.values())[:50]
-		return aut
+		return AVAILABLE_AUTHORS
 
 	def add_rows_to_cf(self, table_name: str):
 		"""
@@ -148,53 +268,78 @@ class Recommender:
 			ordered_artworks_list = json.loads(ordered_artworks) if ordered_artworks else []
 			ordered_artworks_matches_list = json.loads(ordered_artworks_matches) if ordered_artworks_matches else []
 
-			self.cf.store_group_ratings(
-				group_id=group_id, 
-				ordered_items=ordered_artworks_list,
-				ordered_items_matches=ordered_artworks_matches_list,
-				visited_items_count=visited_artworks_count,
-				global_rating=rating
-			)
+			with self.cf_lock:
+				self.cf.store_group_ratings(
+					group_id=group_id, 
+					ordered_items=ordered_artworks_list,
+					ordered_items_matches=ordered_artworks_matches_list,
+					visited_items_count=visited_artworks_count,
+					global_rating=rating
+				)
 
 		print("All rows added to the CF system.")
 
 	def convert_to_problems(self, clean_response: list = None) -> AbstractProblem:
 		"""
 		Converts a `clean_response` data list into a SpecificProblem object and then into an AbstractProblem.
+		The problems are derived once per group and then read from the feature store.
 		"""
-		specific_problem = SpecificProblem(
-			group_id=int(clean_response[0]),
-			num_people=int(clean_response[1]),
-			favorite_author=clean_response[2],
-			favorite_period=int(clean_response[3]),
-			favorite_theme=clean_response[4],
-			guided_visit=bool(int(clean_response[5])),
-			minors=bool(int(clean_response[6])),
-			num_experts=int(clean_response[7]),
-			past_museum_visits=int(clean_response[8]),
-			group_description=clean_response[9]
-		)
+		return self.feature_store.problems(clean_response)
 
-		abstract_problem = AbstractProblem(
-			specific_problem=specific_problem,
-			available_authors=list(authors.values())[:50],
-			available_themes=theme_instances,
-			available_periods=periods
-		)
+	def classify_groups(self, clean_responses: list[list]) -> list[int]:
+		"""
+		Classifies several groups into clusters, with the clustering features encoded in the feature store.
+		"""
+		if not clean_responses:
+			return []
+
+		X = self.feature_store.encoded_features(clean_responses, self.clustering_system)
+		return [int(label) for label in self.clustering_system.classify_features(X)]
 
-		return specific_problem, abstract_problem
+	def partial_fit_groups(self, clean_responses: list[list]) -> list[int]:
+		"""
+		Assigns several groups to the incrementally updated clusters, see `Clustering.partial_fit_cases`.
+		"""
+		X = self.feature_store.encoded_features(clean_responses, self.clustering_system)
+		return self.clustering_system.partial_fit_features(X)
 	
 	def store_case(self, clean_response,  visited_artworks_count, ordered_artworks, ordered_artworks_matches, rating, textual_feedback, cluster, time_limit) -> None:
 		print('.......................................................................................................................')
+		# Store the features of the group, a returning visitor skips their derivation
+		self.feature_store.put(clean_response)
 		sp, ap = self.convert_to_problems(clean_response)
-		self.cf.store_group_ratings(group_id=ap.group_id, ordered_items=ordered_artworks, ordered_items_matches=ordered_artworks_matches, visited_items_count=visited_artworks_count, global_rating=rating)
-		self.cbr.retain(specific_problem=sp, abstract_problem=ap, user_feedback=rating, visited_artworks_count=visited_artworks_count, ordered_artworks=ordered_artworks, ordered_artworks_matches=ordered_artworks_matches, time_limit=time_limit, rating=rating, textual_feedback=textual_feedback, cluster=cluster)
+
+		# Assign the case with the incrementally updated clusters
+		clustering_system = self.clustering_system
+		if self.incremental_clustering and clustering_system is not None and clustering_system.incremental:
+			cluster = self.partial_fit_groups([clean_response])[0]
+
+		with self.cf_lock:
+			self.cf.store_group_ratings(group_id=ap.group_id, ordered_items=ordered_artworks, ordered_items_matches=ordered_artworks_matches, visited_items_count=visited_artworks_count, global_rating=rating)
+		with self.cbr_lock:
+			# The cluster was given by the previous model if the cases were re-clustered in the meantime
+			if self.clustering_system is not clustering_system and self.clustering_system is not None:
+				cluster = self.classify_groups([clean_response])[0]
+			self.case_base.retain(specific_problem=sp, abstract_problem=ap, user_feedback=rating, visited_artworks_count=visited_artworks_count, ordered_artworks=ordered_artworks, ordered_artworks_matches=ordered_artworks_matches, time_limit=time_limit, rating=rating, textual_feedback=textual_feedback, cluster=cluster)
+
+		if self.incremental_clustering and self.clustering_system is not None:
+			self.recluster_if_drifted()
+
+	def new_case(self, clean_response: list) -> dict:
+		"""
+		Converts a `clean_response` data list into the features used by the clustering system.
+		"""
+		return dict(self.feature_store.get(clean_response).cluster_features)
 
 	def recommend(self, target_group_id: int, clean_response: list = [], ap: AbstractProblem = None, eval_mode: bool = False, cluster_id: int = 0) -> dict[str, tuple[list[int], list[float]]]:
 		"""
 		Recommends items using the CF and CBR systems.
 
-		The combination of the recommendations is done by averaging the positions of the items in the two lists and sorting them by the average position.
+		Both systems run concurrently. If one of them misses its deadline (cf_timeout or cbr_timeout), the recommendation
+		degrades to the system that finished and the other one is returned empty. If both miss it, a TimeoutError is raised.
+
+		The recommendations are combined by `self.fusion` (weighted scores, reciprocal-rank fusion or Borda count) and sorted by descending fused score.
+		The strategy can be changed by setting `self.fusion.strategy`.
 
 		Args:
 			target_group_id (int): The group ID of the target group.
@@ -210,34 +355,70 @@ class Recommender:
 			sp, ap = self.convert_to_problems(clean_response)
 
 		ap.cluster = cluster_id
-		cf_result, cbr_result = [], []
-		cf_probs, cbr_probs = [], []
-		combined_result, combined_probs = [], []
 
 		# Calculate the routes
+		cf_result, cf_probs, cbr_result, cbr_probs, beta = self.run_branches(target_group_id=target_group_id, ap=ap)
+
+		return self.combine_recommendations(cf_result, cf_probs, cbr_result, cbr_probs, beta)
+
+	def recommend_many(self, requests: list[list], cluster_ids: list[int] | None = None) -> list[dict[str, tuple[list[int], list[float]]]]:
+		"""
+		Recommends items for several groups at once, for offline scoring and evaluation.
+
+		The clusters of all the groups are classified with a single prediction, the CBR cases of all of them are retrieved
+		with a single query and the CF recommendations are scored with a single read of the ratings.
+
+		Args:
+			requests (list[list]): The `clean_response` data list of each group.
+			cluster_ids (list[int]): The cluster of each group. If None, they are classified with the clustering system.
+
+		Returns:
+			list[dict(str, tuple)]: The recommendations of each group, as returned by `recommend`.
+		"""
+		if not requests:
+			return []
+
+		aps = [self.convert_to_problems(clean_response)[1] for clean_response in requests]
+
+		if cluster_ids is None:
+			cluster_ids = self.classify_groups(requests)
+
+		for ap, cluster_id in zip(aps, cluster_ids):
+			ap.cluster = cluster_id
+
+		cf_results = [([], [])] * len(aps)
+		cbr_results = [([], [])] * len(aps)
+
 		if self.beta > 0:
-			cf_result, cf_probs = self.cf.recommend_items(target_group_id=target_group_id) # CF probs must be used to aproximate matches when storing the case in the CF databse
-			cf_probs_dict = {item_id: prob for item_id, prob in zip(cf_result, cf_probs)}
-		
+			with self.cf_lock:
+				cf_batch = self.cf.recommend_items_batch(target_group_ids=[ap.group_id for ap in aps], workers=self.cf_workers)
+			cf_results = [cf_batch[ap.group_id] for ap in aps]
+
 		if self.beta < 1:
-			cbr_result, cbr_probs = self.cbr.recommend_items(ap=ap)
-			cbr_probs_dict = {item_id: prob for item_id, prob in zip(cbr_result, cbr_probs)}
+			with self.cbr_lock:
+				cbr_results = self.case_base.recommend_items_many(aps)
 
-		# Combine the recommendations from both systems
-		all_items = cf_result if self.beta > 0 else cbr_result
-		if 0 < self.beta < 1:
-			averaged_probs_dict = {
-				item_id: (cf_probs_dict[item_id] * self.beta + cbr_probs_dict[item_id] * (1 - self.beta)) for item_id in all_items
-			}
+		return [
+			self.combine_recommendations(cf_result, cf_probs, cbr_result, cbr_probs, self.beta)
+			for (cf_result, cf_probs), (cbr_result, cbr_probs) in zip(cf_results, cbr_results)
+		]
 
-		# Sort the items by the average position
-		if self.beta == 0:
+	def combine_recommendations(self, cf_result: list[int], cf_probs: list[float], cbr_result: list[int], cbr_probs: list[float], beta: float) -> dict[str, tuple[list[int], list[float]]]:
+		"""
+		Combines the CF and CBR recommendations of a group into the hybrid recommendation.
+
+		Returns:
+			dict(str, tuple): A dictionary with the CBR, CF and Hybrid recommendations and their probabilities.
+		"""
+		combined_result, combined_probs = [], []
+
+		# Sort the items by the fused score
+		if beta == 0:
 			combined_result = cbr_result
-		elif self.beta == 1:
+		elif beta == 1:
 			combined_result = cf_result
 		else:
-			combined_result = list(sorted(averaged_probs_dict.keys(), key=lambda x: averaged_probs_dict[x]))
-			combined_probs = [averaged_probs_dict[item_id] for item_id in combined_result]
+			combined_result, combined_probs = self.fusion.fuse(cf_result, cf_probs, cbr_result, cbr_probs, beta)
 
 		recommendations = {
 			"cf": (cf_result, cf_probs),
@@ -247,6 +428,66 @@ class Recommender:
 
 		return recommendations
 
+	def run_branches(self, target_group_id: int, ap: AbstractProblem) -> tuple[list[int], list[float], list[int], list[float], float]:
+		"""
+		Runs the CF and CBR recommendations needed for the current beta, concurrently if both are needed.
+
+		Args:
+			target_group_id (int): The group ID of the target group.
+			ap (AbstractProblem): The abstract problem to use for the CBR system.
+
+		Returns:
+			tuple: The CF items and probabilities, the CBR items and probabilities and the effective beta
+			(0 or 1 if a branch missed its deadline and the recommendation is degraded to the other one).
+		"""
+		start_time = time.time()
+
+		def remaining_time(timeout):
+			# Both deadlines start counting when the branches are submitted
+			return None if timeout is None else max(timeout - (time.time() - start_time), 0)
+
+		def run_locked(lock, timeout, recommend):
+			# A branch that missed its deadline may still hold the lock: give up at the deadline instead of blocking a worker of the pool
+			remaining = remaining_time(timeout)
+			if not lock.acquire(timeout=-1 if remaining is None else remaining):
+				raise TimeoutError
+			try:
+				return recommend()
+			finally:
+				lock.release()
+
+		def run_cf(timeout=None):
+			return run_locked(self.cf_lock, timeout, lambda: self.cf.recommend_items(target_group_id=target_group_id, workers=self.cf_workers)) # CF probs must be used to aproximate matches when storing the case in the CF databse
+
+		def run_cbr(timeout=None):
+			return run_locked(self.cbr_lock, timeout, lambda: self.case_base.recommend_items(ap=ap))
+
+		if self.beta == 1:
+			return *run_cf(), [], [], self.beta
+		if self.beta == 0:
+			return [], [], *run_cbr(), self.beta
+
+		cf_future = self.executor.submit(run_cf, self.cf_timeout)
+		cbr_future = self.executor.submit(run_cbr, self.cbr_timeout)
+
+		results = {}
+		for name, future, timeout in [('cf', cf_future, self.cf_timeout), ('cbr', cbr_future, self.cbr_timeout)]:
+			try:
+				results[name] = future.result(timeout=remaining_time(timeout))
+			except TimeoutError:
+				# A branch still waiting for a worker is not run
+				future.cancel()
+				print(f"The {name.upper()} recommendation missed its deadline ({timeout} s).")
+
+		if not results:
+			raise TimeoutError("Both the CF and the CBR recommendations missed their deadlines.")
+
+		cf_result, cf_probs = results.get('cf', ([], []))
+		cbr_result, cbr_probs = results.get('cbr', ([], []))
+		beta = self.beta if len(results) == 2 else (1 if 'cf' in results else 0)
+
+		return cf_result, cf_probs, cbr_result, cbr_probs, beta
+
 	def evaluate(self, results_file_name: str, reload_cf: bool = False, save: bool = False, plot_time = False):
 		"""
 		Evaluates the Recommender Hybrid predictions in the test set.
@@ -262,40 +503,41 @@ class Recommender:
 		predictions = []
 
 		self.clustering_system.load_model()
+		if self.incremental_clustering:
+			self.clustering_system.start_incremental()
 
 		execution_times = [] 
 
 		start_time = time.time()
-		for i, row in enumerate(test_rows):
-			iter_start_time = time.time()  
 
-			if (i + 1) % 50 == 0:
-				self.clustering_system = self.clustering()			
-				self.clustering_system.load_model() 
+		# Score the CF recommendations of all the test groups at once, the loop below reads them from the CF cache
+		if self.beta > 0:
+			with self.cf_lock:
+				self.cf.recommend_items_batch(target_group_ids=[row[1] for row in test_rows], workers=self.cf_workers)
 
-			print(f"Generating test prediction {(i+1)}/{len(test_rows)}", end='\r')
+		# The test groups are not stored, so they are classified with the current clusters and never update them.
+		# Without incremental clustering, the cases are clustered again every 50 rows (before the 50th, 100th, ... row).
+		chunk_starts = [0] + list(range(49, len(test_rows), 50)) if test_rows else []
+		for chunk_start, chunk_end in zip(chunk_starts, chunk_starts[1:] + [len(test_rows)]):
+			chunk_start_time = time.time()
 
-			_, group_id, _, num_people, num_experts, minors, past_museum_visits, preferred_main_theme, guided_visit, preferred_year, _, _, _, preferred_author_name, _, _, _, _, group_description, _, _, _, _, _, _, _, _, _, _, _, _, _ = row
+			print(f"Generating test predictions {chunk_start + 1}-{chunk_end}/{len(test_rows)}", end='\r')
 
-			clean_response = [group_id, num_people, preferred_author_name, preferred_year, preferred_main_theme, guided_visit, minors, num_experts, past_museum_visits, group_description]
+			if not self.incremental_clustering and chunk_start > 0:
+				self.clustering_system = self.clustering()
+				self.clustering_system.load_model()
 
-			new_case = {
-				'num_people': int(num_people),
-				'preferred_author_name': preferred_author_name,
-				'preferred_year': int(preferred_year),
-				'preferred_main_theme': preferred_main_theme,
-				'guided_visit': int(guided_visit),
-				'minors': int(minors),
-				'num_experts': int(num_experts),
-				'past_museum_visits': int(past_museum_visits)
-			}
+			requests = []
+			for row in test_rows[chunk_start:chunk_end]:
+				_, group_id, _, num_people, num_experts, minors, past_museum_visits, preferred_main_theme, guided_visit, preferred_year, _, _, _, preferred_author_name, _, _, _, _, group_description, _, _, _, _, _, _, _, _, _, _, _, _, _ = row
 
-			cluster_id = self.clustering_system.classify_new_case(new_case)
+				requests.append([group_id, num_people, preferred_author_name, preferred_year, preferred_main_theme, guided_visit, minors, num_experts, past_museum_visits, group_description])
 
-			predictions.append(self.recommend(target_group_id=group_id, clean_response=clean_response, eval_mode=True, cluster_id=cluster_id)["hybrid"][0])
+			predictions.extend(recommendations["hybrid"][0] for recommendations in self.recommend_many(requests))
 
-			iter_time = time.time() - iter_start_time
-			execution_times.append(iter_time)
+			# Spread the time of the chunk over its rows
+			iter_time = (time.time() - chunk_start_time) / (chunk_end - chunk_start)
+			execution_times.extend([iter_time] * (chunk_end - chunk_start))
 
 		# Evaluate the predictions
 		scores = self.dbph.evaluate_predictions(predictions=predictions, improvement_error_funcs=['lin-lin'])
@@ -322,7 +564,7 @@ class Recommender:
 
 		if save:
 			# Check if the file exists. If it does, change the name
-			parameters_str = f"{self.cf_alpha=}, {self.cf_gamma=}, {self.cf_decay_factor=}, {self.cf_method=}, {self.beta=}, {self.cbr_alpha=}, {self.cbr_beta=}, {self.cbr_gamma=}, {self.cbr_top_k=}"
+			parameters_str = f"{self.cf_alpha=}, {self.cf_gamma=}, {self.cf_decay_factor=}, {self.cf_method=}, {self.beta=}, {self.cbr_alpha=}, {self.cbr_beta=}, {self.cbr_gamma=}, {self.cbr_top_k=}, {self.fusion.strategy=}"
 			results_file_name = os.path.join('scores', results_file_name)
 
 			scores['parameters'] = parameters_str
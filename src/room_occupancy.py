@@ -0,0 +1,174 @@
+"""
+Expected room occupancy of the planned visits.
+
+Every planned route is turned into time windows (the minutes the group spends in every room it walks through) and
+added to a (rooms x time slots) array of expected visitors. The array is a ring over a time horizon: the slots in the
+past are cleared and reused for the future ones, so the tracker runs for days in constant memory.
+
+Adding a route costs O(path length) (times the few slots a room stay spans) and reading a room-slot is O(1), so the
+tracker is updated and queried while a request is planned. The crowding of the rooms (expected visitors / capacity)
+is given to route_optimizer.optimize_route, so that the groups are spread over equally good routes instead of all
+following the same top-ranked one.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+
+import museum
+
+# Expected visitors of a room at which it counts as full
+ROOM_CAPACITY = 30.0
+
+@dataclass
+class PlannedVisit:
+    """Occupancy added by a planned route, kept so that it can be removed if the group changes its route."""
+    rooms: np.ndarray  # Room positions in the museum graph
+    slots: np.ndarray  # Absolute time slots
+    visitors: np.ndarray  # Expected visitors added to each (room, slot)
+    graph_version: int
+
+def route_windows(route: List[int], artwork_minutes: Dict[int, float], start_time: float) -> List[tuple]:
+    """
+    Time windows of a planned route on the current museum graph, as (room position, arrival minute, leaving minute).
+
+    The group walks the route (room ids) from start_time, taking the walking time of every edge, and spends the
+    minutes of the artworks of a room (artwork id -> minutes) the first time it goes through it. Half of the walking
+    time of an edge counts in each of its rooms, so that the rooms only walked through (corridors, stairs, elevators)
+    are occupied too.
+    """
+    graph = museum.current_museum()
+    matrix = museum.route_distances(False).matrix
+
+    # Minutes spent in every room
+    room_minutes: Dict[int, float] = {}
+    for artwork_id, minutes in artwork_minutes.items():
+        if artwork_id in graph.artwork_rooms:
+            room = graph.room_index[graph.artwork_rooms[artwork_id]]
+            room_minutes[room] = room_minutes.get(room, 0.0) + minutes
+
+    windows = []
+    clock = start_time
+    previous = None
+    for room_id in route:
+        room = graph.room_index[room_id]
+        walk = 0.0
+        if previous is not None:
+            walk = float(matrix[previous, room])
+            previous_room, arrival, leaving = windows[-1]
+            windows[-1] = (previous_room, arrival, leaving + walk / 2)
+            clock += walk
+        stay = room_minutes.pop(room, 0.0)
+        windows.append((room, clock - walk / 2, clock + stay))
+        clock += stay
+        previous = room
+    return windows
+
+class RoomOccupancy:
+    """
+    Expected visitors of every room of the current museum graph, in time slots of slot_minutes over a horizon.
+    Times are in minutes (by default, minutes of the wall clock, see now).
+    """
+    def __init__(self, slot_minutes: float = 5.0, horizon_minutes: float = 12 * 60, capacity: float = ROOM_CAPACITY):
+        """
+        Parameters
+        ----------
+        slot_minutes : float
+            Length of a time slot, default is 5 minutes.
+        horizon_minutes : float
+            Time ahead that is tracked, default is 12 hours. Visits planned beyond it are not counted.
+        capacity : float
+            Expected visitors at which a room is full, see crowding.
+        """
+        assert slot_minutes > 0 and horizon_minutes >= slot_minutes, "Invalid time slots"
+
+        self.slot_minutes = slot_minutes
+        self.n_slots = int(np.ceil(horizon_minutes / slot_minutes))
+        self.capacity = capacity
+        self.lock = threading.RLock()
+
+        self.graph_version = None
+        self.counts = None  # counts[room, slot % n_slots]: expected visitors of a room in an absolute slot
+        self.first_slot = None  # Oldest absolute slot kept
+
+    @staticmethod
+    def now() -> float:
+        """Current time in minutes."""
+        return time.time() / 60
+
+    def slot(self, minute: float) -> int:
+        """Absolute time slot of a minute."""
+        return int(minute // self.slot_minutes)
+
+    def __sync(self, minute: float):
+        """Resets the array if the museum graph changed and clears the slots that are now in the past."""
+        slot = self.slot(minute)
+        if self.graph_version != museum.graph_version:
+            self.counts = np.zeros((museum.current_museum().n_rooms, self.n_slots))
+            self.first_slot = slot
+            self.graph_version = museum.graph_version
+        elif slot > self.first_slot:
+            stale = min(slot - self.first_slot, self.n_slots)
+            self.counts[:, (self.first_slot + np.arange(stale)) % self.n_slots] = 0.0
+            self.first_slot = slot
+
+    def __tracked(self, slot: int) -> bool:
+        return self.first_slot <= slot < self.first_slot + self.n_slots
+
+    def add_visit(self, route: List[int], artwork_minutes: Dict[int, float], start_time: float | None = None, people: int = 1) -> PlannedVisit:
+        """
+        Adds the expected occupancy of a group following a planned route (see route_windows) and returns it.
+        A group staying part of a slot counts as that fraction of its people.
+        """
+        start_time = self.now() if start_time is None else start_time
+        rooms, slots, visitors = [], [], []
+        with self.lock:
+            self.__sync(self.now())
+            for room, arrival, leaving in route_windows(route, artwork_minutes, start_time):
+                leaving = max(leaving, arrival + 1e-9)
+                for slot in range(self.slot(arrival), self.slot(leaving) + 1):
+                    if not self.__tracked(slot):
+                        continue
+                    overlap = min(leaving, (slot + 1) * self.slot_minutes) - max(arrival, slot * self.slot_minutes)
+                    if overlap <= 0:
+                        continue
+                    amount = people * overlap / self.slot_minutes
+                    self.counts[room, slot % self.n_slots] += amount
+                    rooms.append(room)
+                    slots.append(slot)
+                    visitors.append(amount)
+            return PlannedVisit(np.array(rooms, dtype=np.int64), np.array(slots, dtype=np.int64), np.array(visitors), self.graph_version)
+
+    def remove_visit(self, visit: PlannedVisit):
+        """Removes the occupancy of a planned visit (the part still ahead), e.g. when the group picks another route."""
+        with self.lock:
+            self.__sync(self.now())
+            if visit.graph_version != self.graph_version:
+                return
+            kept = visit.slots >= self.first_slot
+            np.subtract.at(self.counts, (visit.rooms[kept], visit.slots[kept] % self.n_slots), visit.visitors[kept])
+            np.maximum(self.counts, 0.0, out=self.counts)
+
+    def occupancy(self, room: int, minute: float) -> float:
+        """Expected visitors of a room (position in the museum graph) at a minute, 0 outside of the tracked horizon."""
+        with self.lock:
+            self.__sync(self.now())
+            slot = self.slot(minute)
+            return float(self.counts[room, slot % self.n_slots]) if self.__tracked(slot) else 0.0
+
+    def crowding(self, start_time: float | None = None, end_time: float | None = None) -> np.ndarray:
+        """
+        Peak expected visitors / capacity of every room of the museum graph between two minutes (from now, one slot by default).
+        Used as the room cost of route_optimizer.optimize_route.
+        """
+        start_time = self.now() if start_time is None else start_time
+        end_time = start_time if end_time is None else end_time
+        with self.lock:
+            self.__sync(self.now())
+            slots = [slot for slot in range(self.slot(start_time), self.slot(end_time) + 1) if self.__tracked(slot)]
+            if not slots:
+                return np.zeros(len(self.counts))
+            return self.counts[:, np.array(slots) % self.n_slots].max(axis=1) / self.capacity
@@ -0,0 +1,286 @@
+"""
+Benchmark of the route planners on synthetic museums.
+
+The museums are generated as MuseumGraph (see museum_graph.py): grids, trees and random multi-floor layouts, stacked
+on several floors joined by elevator and stairs shafts, with a number of artworks per room. Every planner is timed for
+an increasing number of rooms to visit, with and without only_elevators, and the results are saved as JSON in scores/.
+
+A run can be compared against a stored baseline: a planner that got slower than the baseline (beyond a tolerance) or
+that returns longer walks is reported as a regression.
+
+    python src/route_benchmark.py                    # run and check against scores/route_benchmark_baseline.json
+    python src/route_benchmark.py --update-baseline  # run and store the results as the new baseline
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import museum
+from museum_graph import MuseumGraph
+from route_optimizer import optimize_route
+
+SCORES_DIR = 'scores'
+DEFAULT_OUTPUT = os.path.join(SCORES_DIR, 'route_benchmark.json')
+DEFAULT_BASELINE = os.path.join(SCORES_DIR, 'route_benchmark_baseline.json')
+
+# Minutes to move one floor by elevator and by stairs
+ELEVATOR_TIME = 2.0
+STAIRS_TIME = 1.0
+
+# --- Synthetic Museums ---
+
+def _stack_floors(
+    name: str, floor_edges: List[tuple], rooms_per_floor: int, floors: int, elevators: int, stairs: int,
+    artworks_per_room: int, rng: random.Random
+) -> MuseumGraph:
+    """
+    Builds a museum with the same layout on every floor (floor_edges between the local room indices 0..rooms_per_floor-1),
+    joined by elevator and stairs shafts: one connecting room per floor and shaft, next to a random room of the layout.
+    The entry is the room 0 and the exit the last room of the ground floor. The walking times of the rooms are random
+    between 0.5 and 2 minutes.
+    """
+    room_ids, room_names, room_floors, is_stairs, is_elevator = [], [], [], [], []
+    edges_from, edges_to, walking_times = [], [], []
+
+    def add_edge(source: int, target: int, walking_time: float):
+        edges_from.append(source)
+        edges_to.append(target)
+        walking_times.append(walking_time)
+
+    for floor in range(floors):
+        for local in range(rooms_per_floor):
+            room_ids.append(floor * rooms_per_floor + local + 1)
+            room_names.append(f"Room {local + 1} (floor {floor})")
+            room_floors.append(floor)
+            is_stairs.append(False)
+            is_elevator.append(False)
+        for a, b in floor_edges:
+            add_edge(floor * rooms_per_floor + a + 1, floor * rooms_per_floor + b + 1, rng.uniform(0.5, 2.0))
+
+    # Shafts between floors
+    next_id = floors * rooms_per_floor + 1
+    if floors > 1:
+        for shaft, elevator in enumerate([True] * elevators + [False] * stairs):
+            local = rng.randrange(rooms_per_floor)
+            for floor in range(floors):
+                room_ids.append(next_id)
+                room_names.append(f"{'Elevator' if elevator else 'Stairs'} {shaft + 1} (floor {floor})")
+                room_floors.append(floor)
+                is_stairs.append(not elevator)
+                is_elevator.append(elevator)
+                add_edge(next_id, floor * rooms_per_floor + local + 1, 0.5)
+                if floor > 0:
+                    add_edge(next_id - 1, next_id, ELEVATOR_TIME if elevator else STAIRS_TIME)
+                next_id += 1
+
+    n_rooms = len(room_ids)
+    artwork_rooms = {}
+    for room_id, connector in zip(room_ids, np.array(is_stairs) | np.array(is_elevator)):
+        if not connector:
+            for _ in range(artworks_per_room):
+                artwork_rooms[len(artwork_rooms) + 1] = room_id
+
+    return MuseumGraph.from_edges(
+        name=name,
+        room_ids=room_ids,
+        room_names=room_names,
+        floors=room_floors,
+        is_entry=[i == 0 for i in range(n_rooms)],
+        is_exit=[i == rooms_per_floor - 1 for i in range(n_rooms)],
+        is_stairs=is_stairs,
+        is_elevator=is_elevator,
+        edges_from=edges_from,
+        edges_to=edges_to,
+        walking_times=walking_times,
+        artwork_rooms=artwork_rooms
+    )
+
+def grid_museum(width: int = 10, height: int = 10, floors: int = 1, elevators: int = 1, stairs: int = 1, artworks_per_room: int = 2, seed: int = 42) -> MuseumGraph:
+    """Museum whose floors are width x height grids of rooms."""
+    floor_edges = [(x * height + y, (x + 1) * height + y) for x in range(width - 1) for y in range(height)]
+    floor_edges += [(x * height + y, x * height + y + 1) for x in range(width) for y in range(height - 1)]
+    return _stack_floors(f"grid-{width}x{height}x{floors}", floor_edges, width * height, floors, elevators, stairs, artworks_per_room, random.Random(seed))
+
+def tree_museum(rooms: int = 100, branching: int = 3, floors: int = 1, elevators: int = 1, stairs: int = 1, artworks_per_room: int = 2, seed: int = 42) -> MuseumGraph:
+    """Museum whose floors are trees of rooms (every room opens to branching rooms), so walks go back along the corridors."""
+    floor_edges = [(room, (room - 1) // branching) for room in range(1, rooms)]
+    return _stack_floors(f"tree-{rooms}x{floors}", floor_edges, rooms, floors, elevators, stairs, artworks_per_room, random.Random(seed))
+
+def multi_floor_museum(
+    floors: int = 4, rooms_per_floor: int = 100, elevators: int = 2, stairs: int = 2, extra_doors: float = 0.3,
+    artworks_per_room: int = 2, seed: int = 42
+) -> MuseumGraph:
+    """Museum whose floors are random connected layouts: a random spanning tree plus extra_doors x rooms doors between random rooms."""
+    rng = random.Random(seed)
+    floor_edges = [(room, rng.randrange(room)) for room in range(1, rooms_per_floor)]
+    floor_edges += [tuple(rng.sample(range(rooms_per_floor), 2)) for _ in range(int(extra_doors * rooms_per_floor))]
+    return _stack_floors(f"multi-floor-{rooms_per_floor}x{floors}", floor_edges, rooms_per_floor, floors, elevators, stairs, artworks_per_room, rng)
+
+# --- Benchmark ---
+
+def _optimize_all(artworks_to_visit, only_elevators: bool = False) -> List[int]:
+    """optimize_route without a time limit (every artwork is visited), as a planner."""
+    route = optimize_route(list(artworks_to_visit), None, np.inf, only_elevators=only_elevators, times=[0.0] * len(artworks_to_visit))
+    return museum.plan_route(route.artworks, only_elevators) if len(route.artworks) == len(artworks_to_visit) else []
+
+PLANNERS: Dict[str, Callable] = {
+    'find_route': museum.find_route,
+    'plan_route': museum.plan_route,
+    'plan_route_2opt': lambda artworks_to_visit, only_elevators=False: museum.plan_route(artworks_to_visit, only_elevators, held_karp_max_rooms=0),
+    'optimize_route': _optimize_all
+}
+
+def museums(quick: bool = False) -> List[MuseumGraph]:
+    """Museums of the benchmark (small ones with quick)."""
+    if quick:
+        return [grid_museum(6, 6, floors=2), tree_museum(60, floors=2), multi_floor_museum(floors=3, rooms_per_floor=40)]
+    return [
+        grid_museum(10, 10, floors=3),
+        tree_museum(300, floors=3),
+        multi_floor_museum(floors=5, rooms_per_floor=200),
+        multi_floor_museum(floors=10, rooms_per_floor=500, elevators=4, stairs=4)
+    ]
+
+def walking_time(graph: MuseumGraph, route: List[int]) -> float:
+    """Minutes walked along a route of room ids."""
+    matrix = graph.csr()
+    return float(sum(matrix[graph.room_index[a], graph.room_index[b]] for a, b in zip(route, route[1:])))
+
+def run_benchmark(
+    needed_rooms: List[int] = (1, 2, 4, 6, 8, 12, 16, 24), planners: List[str] | None = None, quick: bool = False,
+    exact_max_rooms: int = 6, repeats: int = 3, seed: int = 42
+) -> dict:
+    """
+    Times the planners on every museum for each number of rooms to visit, with and without only_elevators.
+
+    Parameters
+    ----------
+    needed_rooms : List[int]
+        Numbers of rooms to visit (one random artwork of each random room).
+    planners : List[str], optional
+        Names of the planners in PLANNERS, all by default.
+    quick : bool
+        Whether to use the small museums.
+    exact_max_rooms : int
+        Largest number of rooms timed with find_route, whose search is exponential in them.
+    repeats : int
+        Runs of every measure, the median time is kept. The cached routes are cleared before every run,
+        the shortest paths of the museum are kept (as in the app).
+    seed : int
+        Seed of the rooms to visit.
+    """
+    planners = list(PLANNERS) if planners is None else planners
+    rng = random.Random(seed)
+    results = []
+
+    try:
+        for graph in museums(quick):
+            rooms_of = {}
+            for artwork_id, room_id in graph.artwork_rooms.items():
+                rooms_of.setdefault(room_id, []).append(artwork_id)
+
+            museum.use_museum(graph)
+            start = time.perf_counter()
+            museum.route_distances(False)
+            museum.route_distances(True)
+            setup_time = time.perf_counter() - start
+
+            for k in needed_rooms:
+                if k > len(rooms_of):
+                    continue
+                artworks_to_visit = [rng.choice(rooms_of[room_id]) for room_id in rng.sample(sorted(rooms_of), k)]
+
+                for only_elevators in (False, True):
+                    for name in planners:
+                        if name == 'find_route' and k > exact_max_rooms:
+                            continue
+                        times = []
+                        for _ in range(repeats):
+                            museum.route_cache.clear()
+                            start = time.perf_counter()
+                            route = PLANNERS[name](artworks_to_visit, only_elevators)
+                            times.append(time.perf_counter() - start)
+
+                        results.append({
+                            'museum': graph.name,
+                            'rooms': graph.n_rooms,
+                            'setup_seconds': setup_time,
+                            'planner': name,
+                            'needed_rooms': k,
+                            'only_elevators': only_elevators,
+                            'seconds': float(np.median(times)),
+                            'found': bool(route),
+                            'route_length': len(route),
+                            'walking_time': walking_time(graph, route) if route else None
+                        })
+                        print(f"{graph.name:24} {name:16} rooms={k:3} only_elevators={only_elevators!s:5} {results[-1]['seconds'] * 1000:9.2f} ms")
+    finally:
+        museum.use_museum(None)
+
+    return {
+        'parameters': {'needed_rooms': list(needed_rooms), 'planners': planners, 'quick': quick, 'exact_max_rooms': exact_max_rooms, 'repeats': repeats, 'seed': seed},
+        'results': results
+    }
+
+def _result_key(result: dict) -> tuple:
+    return result['museum'], result['planner'], result['needed_rooms'], result['only_elevators']
+
+def check_regression(benchmark: dict, baseline: dict, tolerance: float = 2.0, min_seconds: float = 0.005) -> List[str]:
+    """
+    Compares a benchmark with a baseline and returns the regressions found:
+    - a planner that is more than tolerance times slower than in the baseline (ignoring differences under min_seconds),
+    - a planner that no longer finds a route, or whose walk is longer than in the baseline.
+    """
+    baseline_results = {_result_key(result): result for result in baseline['results']}
+    regressions = []
+
+    for result in benchmark['results']:
+        previous = baseline_results.get(_result_key(result))
+        if previous is None:
+            continue
+        name = '{} {} rooms={} only_elevators={}'.format(*_result_key(result))
+
+        if result['seconds'] > previous['seconds'] * tolerance and result['seconds'] - previous['seconds'] > min_seconds:
+            regressions.append(f"{name}: {result['seconds'] * 1000:.2f} ms, baseline {previous['seconds'] * 1000:.2f} ms")
+        if previous['found'] and not result['found']:
+            regressions.append(f"{name}: no route found, the baseline found one")
+        elif previous['found'] and result['walking_time'] > previous['walking_time'] + 1e-6:
+            regressions.append(f"{name}: walk of {result['walking_time']:.2f} minutes, baseline {previous['walking_time']:.2f} minutes")
+
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark of the route planners on synthetic museums.")
+    parser.add_argument('--quick', action='store_true', help="Use small museums.")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="JSON file of the results.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="JSON file of the baseline results.")
+    parser.add_argument('--update-baseline', action='store_true', help="Store the results as the new baseline.")
+    parser.add_argument('--tolerance', type=float, default=2.0, help="Slowdown factor over the baseline reported as a regression.")
+    args = parser.parse_args()
+
+    benchmark = run_benchmark(quick=args.quick)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(benchmark, f, indent=4)
+    print(f"Results saved to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(benchmark, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            regressions = check_regression(benchmark, json.load(f), tolerance=args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        sys.exit(1 if regressions else 0)
+    else:
+        print(f"No baseline found at {args.baseline}, run with --update-baseline to create it")
@@ -0,0 +1,233 @@
+"""
+Time-budgeted route optimization (orienteering).
+
+Given a ranked recommendation, choose the artworks that maximize the total recommendation score while the
+visit fits in the time budget of the group. The time of a visit is the walk entry -> rooms -> exit over the
+museum graph (its walking times) plus the time spent at every artwork (its default time x the time coefficient of the group).
+
+The heuristic is a greedy insertion by score per added minute followed by a local search:
+- the rooms are re-ordered with the museum's visit ordering (Held-Karp or 2-opt), freeing walking time,
+- the freed time is filled again greedily,
+- the selected artworks are swapped out one at a time (lowest score per minute first), keeping the swap if the
+  refill raises the total score.
+The search is restarted with a few insertion criteria (see GREEDINESS) and the best route is kept.
+The search stops after max_moves evaluated moves, so the result only depends on the input and not on the load of the server.
+
+With the crowding of the rooms (see room_occupancy), the score of the artworks of crowded rooms is lowered, so that
+groups with similar recommendations are spread over equally good rooms instead of all taking the same route.
+"""
+
+from dataclasses import dataclass
+from typing import List
+import numpy as np
+
+import museum
+from ontology.art import artworks
+
+# Weight of the crowding of a room in the score of its artworks: score / (1 + CROWD_AVERSION x crowding)
+CROWD_AVERSION = 1.0
+
+# Exponents of the added minutes in the greedy insertion criterion score / added minutes^greediness, one restart each
+GREEDINESS = (1.0, 0.5, 0.0)
+
+@dataclass
+class OptimizedRoute:
+    artworks: List[int]  # Selected artworks in visiting order
+    rooms: List[int]  # Rooms of the selected artworks in visiting order (without the rooms walked through)
+    score: float
+    visit_time: float  # Minutes spent at the artworks
+    walking_time: float  # Minutes walking from the entry to the exit
+
+    @property
+    def total_time(self) -> float:
+        return self.visit_time + self.walking_time
+
+class _Tour:
+    """Rooms visited in order between the entry and the closest exit, over a distance matrix in minutes between the key rooms."""
+    def __init__(self, D: np.ndarray, entry: int, end_costs: np.ndarray):
+        self.D = D
+        self.entry = entry
+        self.end_costs = end_costs
+        self.rooms: List[int] = []
+
+    def walking_time(self, rooms: List[int] | None = None) -> float:
+        rooms = self.rooms if rooms is None else rooms
+        if not rooms:
+            return float(self.end_costs[self.entry])
+        stops = [self.entry] + rooms
+        return float(self.D[stops[:-1], stops[1:]].sum() + self.end_costs[rooms[-1]])
+
+    def insertion_costs(self, candidate_rooms: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Cheapest extra walking time to insert each candidate room in the tour, and the position to insert it at."""
+        previous = [self.entry] + self.rooms
+        # Cost from every position to the next stop (the end for the last position)
+        next_costs = np.vstack([self.D[:, self.rooms].T, self.end_costs[None, :]])
+        base = np.array([self.D[a, b] for a, b in zip(previous, self.rooms)] + [self.end_costs[previous[-1]]])
+
+        costs = self.D[np.ix_(previous, candidate_rooms)] + next_costs[:, candidate_rooms] - base[:, None]
+        positions = np.argmin(costs, axis=0)
+        return costs[positions, np.arange(len(candidate_rooms))], positions
+
+    def reorder(self):
+        """Re-order the rooms with the museum's visit ordering if that shortens the walk."""
+        if len(self.rooms) < 3:
+            return
+        start_costs = self.D[self.entry, self.rooms]
+        costs = self.D[np.ix_(self.rooms, self.rooms)]
+        end_costs = self.end_costs[self.rooms]
+        order = museum.visit_order(start_costs, costs, end_costs)
+        if len(order) != len(self.rooms):
+            return
+
+        reordered = [self.rooms[i] for i in order]
+        if self.walking_time(reordered) < self.walking_time() - 1e-9:
+            self.rooms = reordered
+
+def optimize_route(
+    artwork_ids: List[int], scores: List[float] | None, time_budget: float, time_coefficient: float = 1.0,
+    only_elevators: bool = False, max_moves: int = 20000, times: List[float] | None = None,
+    room_crowding: np.ndarray | None = None, crowd_aversion: float = CROWD_AVERSION
+) -> OptimizedRoute:
+    """
+    Selects and orders the artworks of a recommendation that fit in a time budget, maximizing their total score.
+
+    Parameters
+    ----------
+    artwork_ids : List[int]
+        Recommended artworks, sorted by descending relevance.
+    scores : List[float], optional
+        Score of each recommended artwork. If None or empty (e.g. a recommendation without probabilities),
+        the artworks are scored by their rank.
+    time_budget : float
+        Minutes available for the visit.
+    time_coefficient : float
+        Multiplier of the default time of the artworks (see AbstractProblem.time_coefficient), default is 1.
+    only_elevators : bool
+        Whether the group can only move between floors by elevator.
+    max_moves : int
+        Number of evaluated moves after which the search stops.
+    times : List[float], optional
+        Minutes spent at each recommended artwork. If None, the default time of the artwork x time_coefficient.
+    room_crowding : np.ndarray, optional
+        Crowding of every room of the museum graph (expected visitors / capacity, see RoomOccupancy.crowding).
+        The artworks of a room are scored score / (1 + crowd_aversion x crowding) by the search.
+    crowd_aversion : float
+        Weight of the crowding, default is CROWD_AVERSION.
+    """
+    distances = museum.route_distances(only_elevators)
+    graph = distances.graph
+    if not np.isfinite(distances.to_exit[distances.entry]):
+        return OptimizedRoute([], [], 0.0, 0.0, 0.0)
+
+    # The tour works on the key rooms only (the entry and the rooms of the recommended artworks), key room 0 is the entry
+    placed = [rank for rank, artwork_id in enumerate(artwork_ids) if artwork_id in graph.artwork_rooms]
+    key_rooms = list(dict.fromkeys([distances.entry] + [graph.room_index[graph.artwork_rooms[artwork_ids[rank]]] for rank in placed]))
+    key_index = {room: i for i, room in enumerate(key_rooms)}
+    D = distances.between(key_rooms)
+    end_costs = distances.to_exit[key_rooms]
+    entry = 0
+
+    if times is None:
+        times = [artworks[artwork_id].default_time * time_coefficient for artwork_id in artwork_ids]
+
+    # Candidates: the recommended artworks placed in reachable rooms
+    if scores is not None and len(scores) == len(artwork_ids):
+        values = np.maximum(np.array(scores, dtype=np.float64), 1e-9)
+    else:
+        values = np.arange(len(artwork_ids), 0, -1, dtype=np.float64)
+
+    room_of = {rank: key_index[graph.room_index[graph.artwork_rooms[artwork_ids[rank]]]] for rank in placed}
+    candidates = [rank for rank in placed if np.isfinite(D[entry, room_of[rank]]) and np.isfinite(end_costs[room_of[rank]])]
+
+    if not candidates:
+        return OptimizedRoute([], [], 0.0, 0.0, float(end_costs[entry]))
+
+    candidates = np.array(candidates)
+    candidate_rooms = np.array([room_of[rank] for rank in candidates])
+    candidate_scores = values[candidates]
+    candidate_values = candidate_scores
+    if room_crowding is not None:
+        candidate_values = candidate_scores / (1 + crowd_aversion * np.asarray(room_crowding)[np.array(key_rooms)[candidate_rooms]])
+    candidate_times = np.array([times[rank] for rank in candidates], dtype=np.float64)
+
+    def search(greediness: float, max_moves: int):
+        """Greedy insertion by score / added minutes^greediness followed by the local search."""
+        tour = _Tour(D, entry, end_costs)
+        selected = np.zeros(len(candidates), dtype=bool)
+        moves = 0
+
+        def fill(excluded: int | None = None):
+            """Insert the best candidate while one fits."""
+            nonlocal moves
+            while moves < max_moves:
+                available = ~selected
+                if excluded is not None:
+                    available[excluded] = False
+                if not available.any():
+                    return
+
+                insertion_costs, positions = tour.insertion_costs(candidate_rooms)
+                in_tour = np.isin(candidate_rooms, tour.rooms)
+                extra = candidate_times + np.where(in_tour, 0.0, insertion_costs)
+                feasible = available & (tour.walking_time() + candidate_times[selected].sum() + extra <= time_budget + 1e-9)
+                moves += int(available.sum())
+                if not feasible.any():
+                    return
+
+                ratios = np.where(feasible, candidate_values / np.maximum(extra, 1e-9) ** greediness, -np.inf)
+                best = int(np.argmax(ratios))
+                if not in_tour[best]:
+                    tour.rooms.insert(int(positions[best]), int(candidate_rooms[best]))
+                selected[best] = True
+
+        def remove(i: int):
+            selected[i] = False
+            room = candidate_rooms[i]
+            if not (selected & (candidate_rooms == room)).any():
+                tour.rooms.remove(int(room))
+
+        fill()
+
+        improved = True
+        while improved and moves < max_moves:
+            improved = False
+
+            # Shorten the walk and use the freed time
+            tour.reorder()
+            fill()
+
+            # Swap out the selected artworks with the lowest score per minute
+            for i in sorted(np.flatnonzero(selected), key=lambda i: candidate_values[i] / candidate_times[i] if candidate_times[i] > 0 else np.inf):
+                if moves >= max_moves:
+                    break
+                score, saved_rooms, saved_selected = candidate_values[selected].sum(), list(tour.rooms), selected.copy()
+
+                remove(i)
+                fill(excluded=i)
+                moves += 1
+
+                if candidate_values[selected].sum() > score + 1e-9:
+                    improved = True
+                    break
+                tour.rooms, selected[:] = saved_rooms, saved_selected
+
+        return tour, selected
+
+    # Restart from greedy insertions that weigh the added time less and less, keeping the best route
+    tour, selected = None, None
+    for greediness in GREEDINESS:
+        candidate_tour, candidate_selected = search(greediness, max_moves // len(GREEDINESS))
+        if selected is None or candidate_values[candidate_selected].sum() > candidate_values[selected].sum() + 1e-9:
+            tour, selected = candidate_tour, candidate_selected
+
+    # Artworks in the order of their rooms, and by rank within a room
+    room_order = {room: position for position, room in enumerate(tour.rooms)}
+    chosen = sorted(np.flatnonzero(selected), key=lambda i: (room_order[candidate_rooms[i]], candidates[i]))
+
+    return OptimizedRoute(
+        artworks=[artwork_ids[candidates[i]] for i in chosen],
+        rooms=[int(graph.room_ids[key_rooms[room]]) for room in tour.rooms],
+        score=float(candidate_scores[selected].sum()),
+        visit_time=float(candidate_times[selected].sum()),
+        walking_time=tour.walking_time()
+    )
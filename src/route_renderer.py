@@ -0,0 +1,149 @@
+"""
+Off-request rendering of the route images.
+
+The layout of the museum graph (spring layout) is computed once per graph version and reused by every image. The
+images are rendered with the Agg canvas (no display needed) by a background worker and stored in a content-addressed
+cache: the file name is a hash of the route, the image format and the museum graph, so an image is rendered once and
+can be served as a static file. A request only submits the route and returns the URL of its image.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List
+
+import networkx as nx
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import museum
+
+FORMATS = ['png', 'svg']
+
+# Route images are served from the static folder of the app
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'routes')
+
+class RouteRenderer:
+    """
+    Renders route images in a background thread into a content-addressed cache directory.
+    """
+    def __init__(self, output_dir: str = DEFAULT_OUTPUT_DIR, workers: int = 1, image_format: str = 'png', dpi: int = 80):
+        """
+        Parameters
+        ----------
+        output_dir : str
+            Directory of the rendered images (served as static files).
+        workers : int
+            Number of rendering threads, default is 1.
+        image_format : str
+            Default image format, one of FORMATS, default is 'png'.
+        dpi : int
+            Resolution of the PNG images, default is 80.
+        """
+        assert image_format in FORMATS, f"Invalid image format; use one of {FORMATS}"
+
+        self.output_dir = output_dir
+        self.image_format = image_format
+        self.dpi = dpi
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.RLock()
+        self.pending: Dict[str, Future] = {}
+        self.failed: Dict[str, str] = {}  # File name -> error of the renders that failed
+
+        # Graph, layout and signature of the museum graph, per graph version
+        self.layout_version = None
+        self.graph = None
+        self.positions = None
+        self.graph_signature = None
+
+    def layout(self):
+        """Returns the museum graph, its node positions and its signature, computing them if the graph changed."""
+        with self.lock:
+            if self.layout_version != museum.graph_version:
+                graph = museum.museum_nx_graph()
+                self.positions = nx.spring_layout(graph, seed=42)
+                self.graph = graph
+                self.graph_signature = hashlib.sha256(json.dumps([
+                    sorted([room_id, room] for room_id, room in graph.nodes(data=True)),
+                    sorted(graph.edges(data='walking_time'))
+                ], sort_keys=True).encode('utf-8')).hexdigest()
+                self.layout_version = museum.graph_version
+            return self.graph, self.positions, self.graph_signature
+
+    def filename(self, route: List[int], image_format: str | None = None) -> str:
+        """Content-addressed file name of the image of a route."""
+        image_format = image_format or self.image_format
+        _, _, graph_signature = self.layout()
+        key = hashlib.sha256(json.dumps([route, image_format, self.dpi, graph_signature]).encode('utf-8')).hexdigest()
+        return f"{key[:32]}.{image_format}"
+
+    def submit(self, route: List[int], image_format: str | None = None) -> str:
+        """
+        Queues the rendering of a route image, unless it is cached or already queued, and returns its file name
+        (relative to output_dir). The image can be served as soon as is_ready returns True.
+        A route whose render failed is rendered again.
+        """
+        image_format = image_format or self.image_format
+        assert image_format in FORMATS, f"Invalid image format; use one of {FORMATS}"
+
+        filename = self.filename(route, image_format)
+        with self.lock:
+            self.failed.pop(filename, None)
+            if filename not in self.pending and not os.path.exists(os.path.join(self.output_dir, filename)):
+                future = self.executor.submit(self.render, list(route), filename, image_format)
+                self.pending[filename] = future
+                future.add_done_callback(lambda _: self.__done(filename))
+        return filename
+
+    def __done(self, filename: str):
+        with self.lock:
+            future = self.pending.pop(filename, None)
+            if future is not None and future.exception() is not None:
+                self.failed[filename] = str(future.exception())
+                print(f"Error rendering {filename}: {future.exception()}")
+
+    def is_ready(self, filename: str) -> bool:
+        """Whether the image of a submitted route has been rendered."""
+        return os.path.exists(os.path.join(self.output_dir, filename))
+
+    def status(self, filename: str) -> str:
+        """Status of the image of a submitted route: 'ready', 'pending', 'failed' or 'unknown' (never submitted)."""
+        with self.lock:
+            if self.is_ready(filename):
+                return 'ready'
+            if filename in self.pending:
+                return 'pending'
+            if filename in self.failed:
+                return 'failed'
+            return 'unknown'
+
+    def wait(self, filename: str, timeout: float | None = None):
+        """Waits for the rendering of an image, if it is still queued."""
+        with self.lock:
+            future = self.pending.get(filename)
+        if future is not None:
+            future.result(timeout=timeout)
+
+    def render(self, route: List[int], filename: str, image_format: str):
+        """Renders a route image (Agg canvas, no pyplot state) and stores it atomically."""
+        graph, positions, _ = self.layout()
+
+        figure = Figure(figsize=(14, 10))
+        FigureCanvasAgg(figure)
+        ax = figure.add_subplot()
+        museum.draw_route(ax, route, G=graph, pos=positions)
+        figure.tight_layout(rect=[0, 0, 0.85, 1])
+
+        # Write to a temporary file first, so that a partially written image is never served
+        path = os.path.join(self.output_dir, filename)
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        figure.savefig(temporary_path, format=image_format, dpi=self.dpi)
+        os.replace(temporary_path, path)
+
+    def close(self):
+        """Waits for the queued images and stops the rendering threads."""
+        self.executor.shutdown(wait=True)